@@ -0,0 +1,527 @@
+# benchmark.py
+"""
+watcher のベンチマーク
+本番の販売ページ・LINE APIにアクセスせず、ローカルのスタンドイン（チケットサイト・LINE API・SMTP）に
+向けて watcher.py を起動し、以下を計測する。
+  - 検知遅延: ページの販売状態が切り替わってから、モックLINEが通知を受信するまでの時間
+  - ポーリング性能: 秒間チェック数と、CPU 1コア（CPU時間1秒）あたりのチェック数
+  - メモリ: watcher とブラウザ（子プロセス）の合計RSS、ターゲットあたりのRSS
+ターゲット数（--targets 1,5,10）ごとに watcher を起動し直して計測する。
+CPU・メモリの計測には psutil が必要（pip install psutil）
+
+使用例:
+  python benchmark.py --targets 1,5,10 --interval 1
+  python benchmark.py --targets 20 --kind seat --fetch-mode http --redirect-rate 0.05
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email import message_from_string
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+WATCHER_PATH = Path(__file__).resolve().parent / "watcher.py"
+# 監視対象の日付・検知文言（フィクスチャのページと config の両方で使う）
+TARGET_DATE = "12/7"
+DATE_DETECT_TEXT = "販売期間中"
+SEAT_TYPE = "Ｓ席"
+SEAT_DETECT_TEXT = "販売中"
+# 通知本文の先頭「[ターゲット名]」
+_TARGET_RE = re.compile(r"^\[(.+?)\]")
+
+
+class BenchState:
+    """スタンドインのサーバー間で共有する状態（販売状態の切り替え時刻・受信記録）"""
+
+    def __init__(self, redirect_rate=0.0):
+        self.lock = threading.Lock()
+        self.redirect_rate = redirect_rate
+        # key: ターゲット番号, value: 販売状態に切り替わる時刻（time.time()、未設定は None）
+        self.flip_at = {}
+        # key: ターゲット番号, value: チェック（ページ取得）回数
+        self.polls = {}
+        self.redirects = 0
+        # key: ターゲット名, value: 最初に受信した時刻
+        self.line_received = {}
+        self.mail_received = {}
+        self.line_requests = 0
+        self.mail_messages = 0
+
+    def reset(self):
+        with self.lock:
+            self.flip_at.clear()
+            self.polls.clear()
+            self.redirects = 0
+            self.line_received.clear()
+            self.mail_received.clear()
+            self.line_requests = 0
+            self.mail_messages = 0
+
+    def is_open(self, idx):
+        flip_at = self.flip_at.get(idx)
+        return flip_at is not None and time.time() >= flip_at
+
+    def record_poll(self, idx):
+        with self.lock:
+            self.polls[idx] = self.polls.get(idx, 0) + 1
+
+    def total_polls(self):
+        with self.lock:
+            return sum(self.polls.values())
+
+    def record_notification(self, received, text):
+        match = _TARGET_RE.match(text or "")
+        if not match:
+            return
+        with self.lock:
+            received.setdefault(match.group(1), time.time())
+
+
+# ---- スタンドインのチケットサイト
+
+def render_date_page(idx, is_open):
+    """日付ブロックのページ（ul.table_data > li、対象日のみ販売状態が切り替わる）"""
+    status = DATE_DETECT_TEXT if is_open else "準備中"
+    rows = [
+        f'<li>12/6 東京公演 終了 <a href="/seats/{idx}">詳細</a></li>',
+        f'<li>{TARGET_DATE} 東京公演 {status} <a href="/seats/{idx}">詳細</a></li>',
+        f'<li>12/8 大阪公演 準備中 <a href="/seats/{idx}">詳細</a></li>',
+    ]
+    return (
+        "<html><head><title>bench</title></head><body>"
+        f'<h1>公演 {idx}</h1><ul class="table_data">{"".join(rows)}</ul>'
+        "</body></html>"
+    )
+
+
+def render_seat_page(idx, is_open):
+    """席種ブロックのページ（input.valiation と .ticketSelect__text、Ｓ席のみ販売状態が切り替わる）"""
+    seats = [
+        (SEAT_TYPE, "12,000円", SEAT_DETECT_TEXT if is_open else "予定枚数終了"),
+        ("Ａ席", "9,000円", "予定枚数終了"),
+    ]
+    blocks = []
+    for i, (seat, price, status) in enumerate(seats):
+        # 1つ目は input.valiation、2つ目は .ticketSelect__text から席種を取る形式
+        seat_input = f'<input type="hidden" class="valiation" value="{seat}">' if i == 0 else ""
+        blocks.append(
+            f'<div class="ticketSelect">{seat_input}'
+            f'<span class="ticketSelect__text">{seat} {price}</span> <span>{status}</span></div>'
+        )
+    return f"<html><head><title>bench</title></head><body><h1>席種 {idx}</h1>{''.join(blocks)}</body></html>"
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body="", headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        # リロードのたびにサーバーから取得させる
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts[0] == "error":
+            self._send(200, "<html><body><h1>アクセスが集中しています</h1></body></html>")
+            return
+        if len(parts) != 2 or parts[0] not in ("event", "seats") or not parts[1].isdigit():
+            self._send(404, "not found")
+            return
+        idx = int(parts[1])
+        state = self.state
+        if state.redirect_rate and random.random() < state.redirect_rate:
+            # アクセス過多ページへのリダイレクト（watcher は URL の error / access / too で判定する）
+            with state.lock:
+                state.redirects += 1
+            self._send(302, headers={"Location": "/error/access_too_many"})
+            return
+        state.record_poll(idx)
+        render = render_date_page if parts[0] == "event" else render_seat_page
+        self._send(200, render(idx, state.is_open(idx)))
+
+
+# ---- モックLINE API
+
+class _LineHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/v2/bot/info"):
+            self._send_json(200, {"userId": "Ubench", "basicId": "@bench"})
+        else:
+            self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        endpoint = self.path.rsplit("/", 1)[-1]
+        if endpoint not in ("push", "multicast", "broadcast"):
+            self._send_json(404, {"message": "Not found"})
+            return
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            self._send_json(400, {"message": "The request body has 1 error(s)"})
+            return
+        with self.state.lock:
+            self.state.line_requests += 1
+        for message in payload.get("messages", []):
+            self.state.record_notification(self.state.line_received, message.get("text"))
+        self._send_json(200, {})
+
+
+# ---- モックSMTPサーバー（認証なし・平文）
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    state = None
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        self._reply("220 bench ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith(("EHLO", "HELO")):
+                self._reply("250 bench")
+            elif command.startswith("DATA"):
+                self._reply("354 end data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    data.append(data_line)
+                self._record("".join(l.decode("utf-8", "replace") for l in data))
+                self._reply("250 queued")
+            elif command.startswith("QUIT"):
+                self._reply("221 bye")
+                return
+            else:
+                # MAIL / RCPT / RSET / NOOP
+                self._reply("250 ok")
+
+    def _record(self, raw):
+        msg = message_from_string(raw)
+        body = msg.get_payload(decode=True) or b""
+        with self.state.lock:
+            self.state.mail_messages += 1
+        self.state.record_notification(
+            self.state.mail_received, body.decode(msg.get_content_charset() or "utf-8", "replace")
+        )
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_servers(state, host="127.0.0.1"):
+    """スタンドインのサーバーを起動（ポートは空きポートを自動で割り当て）
+
+    Returns:
+        (サイトのURL, LINE APIのURL, SMTPのポート, サーバーのリスト)
+    """
+    handlers = {
+        "site": type("SiteHandler", (_SiteHandler,), {"state": state}),
+        "line": type("LineHandler", (_LineHandler,), {"state": state}),
+    }
+    site = ThreadingHTTPServer((host, 0), handlers["site"])
+    line = ThreadingHTTPServer((host, 0), handlers["line"])
+    smtp = _ThreadingSMTPServer((host, 0), type("SMTPHandler", (_SMTPHandler,), {"state": state}))
+    servers = [site, line, smtp]
+    for server in servers:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://{host}:{site.server_port}", f"http://{host}:{line.server_port}", smtp.server_address[1], servers
+
+
+# ---- 計測
+
+def build_config(args, n_targets, site_url, line_url, smtp_port, workdir):
+    """ベンチマーク用の config.json（通知先はすべてモックサーバー）"""
+    targets = []
+    for idx in range(n_targets):
+        kind = args.kind if args.kind != "mix" else ("date" if idx % 2 == 0 else "seat")
+        if kind == "date":
+            target = {
+                "name": f"bench{idx}",
+                "url": f"{site_url}/event/{idx}",
+                "selector": "ul.table_data > li",
+                "target_dates": [TARGET_DATE],
+                "detect_text": DATE_DETECT_TEXT,
+            }
+        else:
+            target = {
+                # 名前に「詳細」を含むターゲットは席種で判定する（日付チェックなし）
+                "name": f"bench{idx} 詳細",
+                "url": f"{site_url}/seats/{idx}",
+                "selector": ".ticketSelect",
+                "target_dates": [],
+                "detect_text": SEAT_DETECT_TEXT,
+                "detail_seat_types": [SEAT_TYPE],
+            }
+        target["fetch_mode"] = args.fetch_mode
+        targets.append(target)
+    return {
+        "chrome_path": args.chrome_path,
+        "user_data_dir": str(workdir),
+        "profile": "profile",
+        "headless": True,
+        "check_interval_sec": args.interval,
+        "check_timeout_sec": max(5, args.interval * 5),
+        "browser_pool_size": args.browser_pool_size,
+        "shards": args.shards,
+        # 実行中の watcher の制御チャネル（既定のポート）と干渉しないよう無効にする
+        "control_port": 0,
+        "block_resources": False,
+        "stop_after_detection": False,
+        "line_channel_access_token": "bench-token",
+        "line_user_id": "Ubench",
+        "line_api_base_url": line_url,
+        "smtp_host": "127.0.0.1",
+        "smtp_port": smtp_port,
+        "smtp_ssl": False,
+        "smtp_user": "bench@example.com",
+        "smtp_password": "",
+        "mail_to": "bench@example.com",
+        "state_db_path": str(workdir / "notified_state.db"),
+        "watch_targets": targets,
+    }
+
+
+def _process_tree(pid):
+    try:
+        proc = psutil.Process(pid)
+        return [proc] + proc.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def _cpu_seconds(procs):
+    total = 0.0
+    for proc in procs:
+        try:
+            times = proc.cpu_times()
+            total += times.user + times.system
+        except psutil.Error:
+            pass
+    return total
+
+
+def _rss_bytes(procs):
+    total = 0
+    for proc in procs:
+        try:
+            total += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _wait_until(predicate, timeout, interval=0.1):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(interval)
+    return predicate()
+
+
+def run_scenario(args, state, n_targets, site_url, line_url, smtp_port):
+    """ターゲット数 n_targets で watcher を起動して計測
+
+    Returns:
+        計測結果の辞書
+    """
+    state.reset()
+    workdir = Path(tempfile.mkdtemp(prefix=f"bench{n_targets}_"))
+    cfg = build_config(args, n_targets, site_url, line_url, smtp_port, workdir)
+    (workdir / "config.json").write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+    log_file = open(workdir / "watcher.log", "w", encoding="utf-8")
+    env = dict(os.environ, PYTHONIOENCODING="utf-8", PYTHONUNBUFFERED="1")
+    proc = subprocess.Popen(
+        [sys.executable, str(WATCHER_PATH)], cwd=workdir, stdout=log_file, stderr=subprocess.STDOUT, env=env
+    )
+    result = {"targets": n_targets, "workdir": str(workdir)}
+    try:
+        # 全ターゲットのチェックが始まるまで待つ（ブラウザの起動・初回ロード）
+        if not _wait_until(lambda: len(state.polls) >= n_targets or proc.poll() is not None, args.startup_timeout):
+            print(f"[{n_targets}] 起動待ちがタイムアウトしました（{len(state.polls)}/{n_targets}）")
+        if proc.poll() is not None:
+            raise RuntimeError(f"watcher が終了しました（ログ: {workdir / 'watcher.log'}）")
+
+        # 定常状態の計測（販売状態は切り替えない）
+        procs = _process_tree(proc.pid) if psutil else []
+        cpu_started = _cpu_seconds(procs)
+        polls_started = state.total_polls()
+        started = time.time()
+        time.sleep(args.duration)
+        elapsed = time.time() - started
+        polls = state.total_polls() - polls_started
+        result["polls_per_sec"] = polls / elapsed
+        if psutil:
+            procs = _process_tree(proc.pid)
+            cpu = _cpu_seconds(procs) - cpu_started
+            rss = _rss_bytes(procs)
+            result["cpu_cores"] = cpu / elapsed
+            result["polls_per_cpu_sec"] = polls / cpu if cpu > 0 else None
+            result["rss_mb"] = rss / 1024 / 1024
+            result["rss_per_target_mb"] = result["rss_mb"] / n_targets
+
+        # 販売状態の切り替え（ポーリングの周期とずらすため、切り替え時刻をばらつかせる）
+        now = time.time()
+        with state.lock:
+            for idx in range(n_targets):
+                state.flip_at[idx] = now + random.uniform(0, args.interval)
+        names = [t["name"] for t in cfg["watch_targets"]]
+        _wait_until(
+            lambda: all(name in state.line_received for name in names) or proc.poll() is not None,
+            args.detect_timeout,
+        )
+        latencies = []
+        mail_latencies = []
+        with state.lock:
+            for idx, name in enumerate(names):
+                if name in state.line_received:
+                    latencies.append(state.line_received[name] - state.flip_at[idx])
+                if name in state.mail_received:
+                    mail_latencies.append(state.mail_received[name] - state.flip_at[idx])
+            result["redirects"] = state.redirects
+        result["detected"] = len(latencies)
+        result["latency"] = {q: _percentile(latencies, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("max", 1.0))}
+        result["mail_latency_p50"] = _percentile(mail_latencies, 0.5)
+    finally:
+        # SIGTERM で終了させ、送信待ちの通知・ログを書き出させる
+        if proc.poll() is None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        log_file.close()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _fmt(value, spec=".1f", scale=1.0):
+    return "-" if value is None else format(value * scale, spec)
+
+
+def print_report(results):
+    print()
+    print("=== ベンチマーク結果 ===")
+    header = f"{'targets':>7} {'polls/s':>8} {'polls/cpu-s':>11} {'cores':>6} {'RSS MB':>8} {'MB/target':>9} " \
+             f"{'detected':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'mail p50':>8} {'redirects':>9}"
+    print(header)
+    for r in results:
+        latency = r.get("latency", {})
+        print(
+            f"{r['targets']:>7} {_fmt(r.get('polls_per_sec')):>8} {_fmt(r.get('polls_per_cpu_sec')):>11} "
+            f"{_fmt(r.get('cpu_cores'), '.2f'):>6} {_fmt(r.get('rss_mb')):>8} {_fmt(r.get('rss_per_target_mb')):>9} "
+            f"{r.get('detected', 0):>4}/{r['targets']:<3} {_fmt(latency.get('p50'), '.0f', 1000):>8} "
+            f"{_fmt(latency.get('p95'), '.0f', 1000):>8} {_fmt(latency.get('max'), '.0f', 1000):>8} "
+            f"{_fmt(r.get('mail_latency_p50'), '.0f', 1000):>8} {r.get('redirects', 0):>9}"
+        )
+    if psutil is None:
+        print("※ CPU・メモリの計測には psutil が必要です（pip install psutil）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="watcher のベンチマーク（ローカルのスタンドインサイト・モックLINE/SMTP）")
+    parser.add_argument("--targets", default="1,5,10", help="ターゲット数（カンマ区切りで複数指定、順に計測）")
+    parser.add_argument("--kind", choices=("date", "seat", "mix"), default="mix",
+                        help="フィクスチャの種類（date: 日付ブロック / seat: 席種ブロック / mix: 交互）")
+    parser.add_argument("--fetch-mode", choices=("browser", "http"), default="browser", help="ターゲットの取得方式")
+    parser.add_argument("--interval", type=float, default=1.0, help="チェック間隔（秒）")
+    parser.add_argument("--duration", type=float, default=10.0, help="定常状態の計測時間（秒）")
+    parser.add_argument("--redirect-rate", type=float, default=0.0, help="アクセス過多ページへリダイレクトする割合（0〜1）")
+    parser.add_argument("--browser-pool-size", type=int, default=1, help="共有ブラウザの数")
+    parser.add_argument("--shards", type=int, default=1, help="ターゲットを分割して監視するプロセス数")
+    parser.add_argument("--chrome-path", default=None, help="Chrome の実行パス（省略時は Playwright 同梱の Chromium）")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="全ターゲットのチェック開始を待つ秒数")
+    parser.add_argument("--detect-timeout", type=float, default=30.0, help="通知の受信を待つ秒数")
+    parser.add_argument("--keep", action="store_true", help="作業ディレクトリ（config・ログ）を残す")
+    parser.add_argument("--serve", action="store_true", help="スタンドインのサーバーのみ起動（手動での確認用）")
+    args = parser.parse_args()
+
+    state = BenchState(redirect_rate=args.redirect_rate)
+    site_url, line_url, smtp_port, servers = start_servers(state)
+    print(f"スタンドインサイト: {site_url}/event/<n>, {site_url}/seats/<n>")
+    print(f"モックLINE API: {line_url}（line_api_base_url に指定）")
+    print(f"モックSMTP: 127.0.0.1:{smtp_port}（smtp_ssl: false）")
+    if args.serve:
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            return
+
+    results = []
+    try:
+        for n_targets in [int(n) for n in args.targets.split(",") if n.strip()]:
+            print(f"--- ターゲット数 {n_targets} ---")
+            try:
+                result = run_scenario(args, state, n_targets, site_url, line_url, smtp_port)
+            except RuntimeError as e:
+                print(f"計測エラー: {e}")
+                continue
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False, default=str))
+    finally:
+        for server in servers:
+            server.shutdown()
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
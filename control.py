@@ -0,0 +1,155 @@
+# control.py
+"""
+実行中の watcher への指示（ローカルの制御チャネル）
+watcher（シャードの場合はスーパーバイザー）が 127.0.0.1 で待ち受け、controller.py などから
+1行1件のJSON（{"command": "reload", "secret": "..."}）を受け取って、1行のJSONで応答する。
+設定の再読み込みなどを、watcher を起動し直さずに反映するために使う
+"""
+import json
+import socket
+import socketserver
+import threading
+
+DEFAULT_PORT = 5050
+# 1件の指示・応答の最大サイズ（バイト）
+MAX_MESSAGE_BYTES = 1024 * 1024
+DEFAULT_TIMEOUT_SEC = 5.0
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if len(line) > MAX_MESSAGE_BYTES:
+                self._reply({"ok": False, "error": "message too large"})
+                return
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                self._reply({"ok": False, "error": "invalid json"})
+                continue
+            self._reply(self.server.control.dispatch(message))
+
+    def _reply(self, payload):
+        self.wfile.write((json.dumps(payload, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ControlServer:
+    """制御チャネルのサーバー（バックグラウンドのスレッドで待ち受ける）
+
+    Args:
+        handler: handler(command, message) -> 応答の辞書（待ち受けスレッドから呼ばれる）
+        port: 待ち受けるポート（127.0.0.1 のみ）
+        secret: 指定した場合、message["secret"] が一致しない指示は拒否する
+    """
+
+    def __init__(self, handler, port=DEFAULT_PORT, secret=None):
+        self.handler = handler
+        self.secret = secret
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.control = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="control")
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def dispatch(self, message):
+        if not isinstance(message, dict) or not message.get("command"):
+            return {"ok": False, "error": "command is required"}
+        if self.secret and message.get("secret") != self.secret:
+            return {"ok": False, "error": "forbidden"}
+        try:
+            result = self.handler(message["command"], message)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        if result is None:
+            return {"ok": False, "error": f"unknown command: {message['command']}"}
+        return dict({"ok": True}, **result)
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def start_server(cfg, handler):
+    """設定（control_port、0 で無効）に従って制御チャネルを開始
+
+    Returns:
+        ControlServer（無効・ポートを開けなかった場合は None）
+    """
+    port = cfg.get("control_port", DEFAULT_PORT)
+    if not port:
+        return None
+    try:
+        server = ControlServer(handler, port, secret=cfg.get("management_secret")).start()
+    except OSError as e:
+        print(f"制御チャネルを開始できません（127.0.0.1:{port}）: {e}")
+        return None
+    print(f"制御チャネル: 127.0.0.1:{server.port}")
+    return server
+
+
+def send_command(cfg, command, timeout=DEFAULT_TIMEOUT_SEC, **params):
+    """実行中の watcher に指示を送る
+
+    Returns:
+        応答の辞書（watcher が待ち受けていない場合は None）
+    """
+    port = cfg.get("control_port", DEFAULT_PORT)
+    if not port:
+        return None
+    message = dict(params, command=command)
+    if cfg.get("management_secret"):
+        message["secret"] = cfg["management_secret"]
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+            sock.sendall((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            reader = sock.makefile("rb")
+            line = reader.readline(MAX_MESSAGE_BYTES)
+    except OSError:
+        return None
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return {"ok": False, "error": "invalid response"}
+
+
+# 再読み込みで反映する前に確認するターゲットの必須キー
+REQUIRED_TARGET_KEYS = ("name", "url", "target_dates")
+
+
+def validate_config(cfg):
+    """再読み込みで反映する設定を確認（反映を始める前に呼び、途中で失敗して設定が半端に変わらないようにする）
+
+    Raises:
+        ValueError: watch_targets の形式が正しくない場合
+    """
+    if not isinstance(cfg, dict):
+        raise ValueError("設定がJSONオブジェクトではありません")
+    targets = cfg.get("watch_targets", [])
+    if not isinstance(targets, list):
+        raise ValueError("watch_targets はリストで指定してください")
+    for i, target in enumerate(targets):
+        if not isinstance(target, dict):
+            raise ValueError(f"watch_targets[{i}] がオブジェクトではありません")
+        missing = [k for k in REQUIRED_TARGET_KEYS if k not in target]
+        if missing:
+            raise ValueError(f"watch_targets[{i}] に {', '.join(missing)} がありません")
+        if not isinstance(target["name"], str) or not isinstance(target["url"], str):
+            raise ValueError(f"watch_targets[{i}] の name・url は文字列で指定してください")
+        if not isinstance(target["target_dates"], list):
+            raise ValueError(f"watch_targets[{i}] の target_dates はリストで指定してください")
@@ -1,20 +1,48 @@
 # controller.py
 import json
 import os
+import queue
 import subprocess
 import signal
-from flask import Flask, request, jsonify, abort
-from notifier import send_line_push
+import threading
+from flask import Flask, request, jsonify, abort, Response
+from notifier import send_line_message_async
+import line_http
+import metrics
+import control
+import watch_status
+from shard import SHARDS_FILE
 
 app = Flask(__name__)
 PIDFILE = "watcher.pid"
+# /set で変更できる設定（実行中の watcher には再読み込みで反映される）
+SETTABLE_KEYS = [
+    "target_dates", "check_interval_sec", "target_url", "button_text",
+    "watch_targets", "interval_jitter_sec", "check_timeout_sec", "stop_after_detection",
+]
+# LINEのコマンドのキューの上限（これを超えたコマンドは破棄する）
+COMMAND_QUEUE_SIZE = 100
 
 def load_config():
     with open("config.json", "r", encoding="utf-8") as f:
         return json.load(f)
 
+def save_config(config):
+    """config.json を書き換える（watcher が書きかけのファイルを読まないよう、一時ファイルから置き換える）"""
+    tmp = "config.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, "config.json")
+
 cfg = load_config()
 
+# 起動・停止・設定変更を1つずつ行うためのロック（HTTPのリクエストとLINEのコマンドで共有）
+process_lock = threading.Lock()
+# LINEのコマンドのキュー（/callback が積み、command_worker が処理する）
+command_queue = queue.Queue(maxsize=COMMAND_QUEUE_SIZE)
+command_thread = None
+command_thread_lock = threading.Lock()
+
 # ---- helper
 def read_pid():
     if os.path.exists(PIDFILE):
@@ -41,62 +69,228 @@ def is_running():
         remove_pid()
         return False
 
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except OSError:
+        return False
+
+def read_shards():
+    """シャードで起動している場合のワーカーの一覧（watcher.shards.json、なければ空）"""
+    try:
+        with open(SHARDS_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return []
+    return [dict(s, alive=pid_alive(s.get("pid"))) for s in data.get("shards", [])]
+
+def read_status():
+    """watcher が書き出した現在の状態（ターゲットごとの最終チェック・検知状態など、なければ None）"""
+    return watch_status.read_merged(cfg.get("status_path", watch_status.DEFAULT_STATUS_PATH))
+
 # ---- start/stop watcher
+def notify_user(message):
+    """LINEでユーザーに知らせる（ディスパッチャー経由で送信し、完了は待たない）"""
+    send_line_message_async(cfg, message)
+
+def start_watcher_process():
+    """watcher を起動（warm_standby で一時停止中の場合は再開）
+
+    Returns:
+        結果の辞書（/start の応答）
+    """
+    with process_lock:
+        if is_running():
+            # warm_standby: 一時停止中の watcher を再開する（ブラウザ・ログイン状態はそのまま）
+            if cfg.get("warm_standby", False):
+                resp = control.send_command(cfg, "resume")
+                if resp and resp.get("ok") and resp.get("was_paused"):
+                    notify_user("監視を再開しました。")
+                    return {"status":"resumed"}
+            return {"status":"already_running"}
+        # start watcher.py（shards が2以上の場合はスーパーバイザーがワーカープロセスを起動する）
+        command = ["python", "watcher.py"]
+        if int(cfg.get("shards", 1)) > 1:
+            command += ["--shards", str(cfg["shards"])]
+        proc = subprocess.Popen(command, creationflags=0)
+        write_pid(proc.pid)
+    notify_user("監視を開始しました。")
+    return {"status":"started", "pid": proc.pid}
+
+def stop_watcher_process(shutdown=False):
+    """watcher を停止（warm_standby の場合は一時停止、shutdown=True でプロセスを終了）
+
+    Returns:
+        結果の辞書（/stop の応答）
+    """
+    with process_lock:
+        pid = read_pid()
+        if not pid:
+            return {"status":"not_running"}
+        # warm_standby: プロセスは終了せずに一時停止する（?shutdown=1 で終了、制御チャネルに届かない場合も終了）
+        if cfg.get("warm_standby", False) and not shutdown and is_running():
+            resp = control.send_command(cfg, "pause")
+            if resp and resp.get("ok"):
+                if resp.get("was_paused"):
+                    return {"status":"already_paused"}
+                notify_user("監視を一時停止しました（待機中）。")
+                return {"status":"paused"}
+        # シャードのワーカーはスーパーバイザーが停止する（スーパーバイザーが強制終了された場合も自分で停止する）
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except Exception:
+            pass
+        remove_pid()
+    notify_user("監視を停止しました。")
+    return {"status":"stopped"}
+
+def update_config(body):
+    """config.json の設定を変更し、実行中の watcher に再読み込みさせる
+
+    Returns:
+        結果の辞書（/set の応答）
+
+    Raises:
+        ValueError: 変更後の設定の形式が正しくない場合（config.json は変更しない）
+    """
+    with process_lock:
+        config = load_config()
+        # allow changing target_dates (list) or check_interval_sec, target_url etc.
+        for k in SETTABLE_KEYS:
+            if k in body:
+                config[k] = body[k]
+        control.validate_config(config)
+        save_config(config)
+    # 実行中の watcher にすぐ再読み込みさせる（届かなくても watcher が config.json の更新を確認して反映する）
+    reload = control.send_command(cfg, "reload") if is_running() else None
+    return {"status":"ok", "config": config, "reload": reload}
+
 @app.route("/start", methods=["POST"])
 def start_watcher():
     secret = request.args.get("secret")
     if secret != cfg.get("management_secret"):
         return abort(403)
-    if is_running():
-        return jsonify({"status":"already_running"})
-    # start watcher.py
-    proc = subprocess.Popen(["python", "watcher.py"], creationflags=0)
-    write_pid(proc.pid)
-    send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], "監視を開始しました。")
-    return jsonify({"status":"started", "pid": proc.pid})
+    return jsonify(start_watcher_process())
 
 @app.route("/stop", methods=["POST"])
 def stop_watcher():
     secret = request.args.get("secret")
     if secret != cfg.get("management_secret"):
         return abort(403)
-    pid = read_pid()
-    if not pid:
-        return jsonify({"status":"not_running"})
-    try:
-        os.kill(pid, signal.SIGTERM)
-    except Exception:
-        pass
-    remove_pid()
-    send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], "監視を停止しました。")
-    return jsonify({"status":"stopped"})
+    return jsonify(stop_watcher_process(shutdown=request.args.get("shutdown") == "1"))
 
 @app.route("/status", methods=["GET"])
 def status():
     secret = request.args.get("secret")
     if secret != cfg.get("management_secret"):
         return abort(403)
-    return jsonify({"running": is_running()})
+    running = is_running()
+    result = {"running": running}
+    if running:
+        # watcher には問い合わせず、書き出されたファイルを読むだけにする
+        state = read_status()
+        if state:
+            result.update(state)
+        shards = read_shards()
+        if shards:
+            result["shards"] = shards
+    return jsonify(result)
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """watcher が書き出したメトリクスを Prometheus のテキスト形式で返す"""
+    secret = request.args.get("secret")
+    if secret != cfg.get("management_secret"):
+        return abort(403)
+    # シャードで起動している場合は各ワーカーのファイルもまとめる（watcher が未起動の場合は空）
+    body = metrics.read_merged(cfg.get("metrics_path", metrics.DEFAULT_METRICS_PATH))
+    return Response(body, mimetype="text/plain; version=0.0.4")
 
 @app.route("/set", methods=["POST"])
 def set_config():
     secret = request.args.get("secret")
     if secret != cfg.get("management_secret"):
         return abort(403)
-    body = request.json or {}
-    config = load_config()
-    # allow changing target_dates (list) or check_interval_sec, target_url etc.
-    for k in ["target_dates", "check_interval_sec", "target_url", "button_text"]:
-        if k in body:
-            config[k] = body[k]
-    with open("config.json", "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
-    return jsonify({"status":"ok", "config": config})
+    try:
+        return jsonify(update_config(request.json or {}))
+    except ValueError as e:
+        return jsonify({"status":"error", "error": str(e)}), 400
+
+# ---- LINE commands
+def parse_set_value(key, value):
+    """LINEの set コマンドの値を設定の型に変換（target_dates はカンマ区切り、数値・true/false はJSONとして解釈）"""
+    if key == "target_dates":
+        return [d.strip() for d in value.split(",")]
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+def handle_line_command(txt):
+    """LINEのコマンドを1件処理（コマンド処理スレッドで実行）
+    コマンド名と set のキーは大文字・小文字を区別しない（値は URL などを含むためそのまま使う）
+    """
+    command = txt.lower()
+    if command == "start":
+        if start_watcher_process()["status"] == "already_running":
+            notify_user("既に監視中です。")
+    elif command == "stop":
+        status = stop_watcher_process()["status"]
+        if status == "not_running":
+            notify_user("監視は停止しています。")
+        elif status == "already_paused":
+            notify_user("既に一時停止しています。")
+    elif command == "shutdown":
+        # warm_standby でも watcher のプロセスを終了する
+        if stop_watcher_process(shutdown=True)["status"] == "not_running":
+            notify_user("監視は停止しています。")
+    elif command == "status":
+        running = is_running()
+        notify_user(watch_status.format_text(read_status() if running else None, running))
+    elif command.startswith("set "):
+        # set target_dates=11月16日,11月15日 など
+        payload = txt[len("set "):]
+        if "=" not in payload:
+            notify_user("設定更新エラー: set key=value の形式で指定してください")
+            return
+        k, v = payload.split("=",1)
+        k = k.strip().lower()
+        if k not in SETTABLE_KEYS:
+            notify_user(f"設定更新エラー: {k} は変更できません")
+            return
+        value = parse_set_value(k, v.strip())
+        try:
+            update_config({k: value})
+        except ValueError as e:
+            notify_user(f"設定更新エラー: {e}")
+            return
+        notify_user(f"設定更新: {k} = {value}")
+
+def command_worker():
+    """キューに積まれたLINEのコマンドを順に処理（1つずつ処理し、開始・停止が重ならないようにする）"""
+    while True:
+        txt = command_queue.get()
+        try:
+            handle_line_command(txt)
+        except Exception as ex:
+            print(f"コマンド処理エラー ({txt}): {ex}")
+            notify_user(f"コマンド処理エラー: {ex}")
+
+def start_command_worker():
+    global command_thread
+    with command_thread_lock:
+        if command_thread is None:
+            command_thread = threading.Thread(target=command_worker, daemon=True, name="line-commands")
+            command_thread.start()
 
 # ---- LINE webhook endpoint
 @app.route("/callback", methods=["POST"])
 def callback():
     # LINE webhook events (簡易): テキストメッセージをコマンドとして処理
+    # コマンドはキューに積んで別スレッドで処理し、Webhook にはすぐに応答する
     ev = request.get_json()
     try:
         for e in ev.get("events", []):
@@ -107,38 +301,24 @@ def callback():
             if user != cfg.get("line_user_id"):
                 # 認可外のユーザーは無視
                 continue
-            txt = e["message"].get("text", "").strip().lower()
-            if txt == "start":
-                # call local /start with secret
-                subprocess.Popen(["curl", "-X", "POST", f"http://localhost:5000/start?secret={cfg.get('management_secret')}"])
-            elif txt == "stop":
-                subprocess.Popen(["curl", "-X", "POST", f"http://localhost:5000/stop?secret={cfg.get('management_secret')}"])
-            elif txt == "status":
-                running = is_running()
-                send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], f"稼働中: {running}")
-            elif txt.startswith("set "):
-                # set target_dates=11月16日,11月15日 など
-                try:
-                    payload = txt.replace("set ", "", 1)
-                    if "=" in payload:
-                        k, v = payload.split("=",1)
-                        k = k.strip()
-                        v = v.strip()
-                        if k == "target_dates":
-                            dates = [d.strip() for d in v.split(",")]
-                            subprocess.Popen(["curl", "-X", "POST", "-H", "Content-Type: application/json",
-                                              "-d", json.dumps({"target_dates": dates}), f"http://localhost:5000/set?secret={cfg.get('management_secret')}"])
-                            send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], f"設定更新: {k} = {dates}")
-                        else:
-                            subprocess.Popen(["curl", "-X", "POST", "-H", "Content-Type: application/json",
-                                              "-d", json.dumps({k: v}), f"http://localhost:5000/set?secret={cfg.get('management_secret')}"])
-                            send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], f"設定更新: {k} = {v}")
-                except Exception as ex:
-                    send_line_push(cfg["line_channel_access_token"], cfg["line_user_id"], f"設定更新エラー: {ex}")
+            txt = e["message"].get("text", "").strip()
+            if not txt:
+                continue
+            start_command_worker()
+            try:
+                command_queue.put_nowait(txt)
+            except queue.Full:
+                print(f"コマンドのキューが満杯のため破棄しました: {txt}")
         return "OK"
     except Exception:
         return "ERR", 400
 
 if __name__ == "__main__":
     # 本番では systemd / Windowsサービス 等で常駐させる
+    # LINE APIへの接続を維持して、返信時のハンドシェイクを省く
+    line_http.start_keepalive(
+        cfg.get("line_channel_access_token"),
+        base_url=cfg.get("line_api_base_url", line_http.LINE_API_BASE_URL),
+    )
+    start_command_worker()
     app.run(port=5000, host="127.0.0.1")
@@ -0,0 +1,181 @@
+# detail_pool.py
+"""
+詳細ページ（enable_detail_watch で検知したリンク先）のタブの管理
+監視する詳細ページの数に上限を設け、URLで引ける索引を持つ。上限に達した場合は最も長く使われていない
+（親ターゲットで再検知されていない・自身で検知していない）ページから閉じ、一定時間使われていないページも閉じる。
+親ターゲットでリンクが検知されなくなった詳細ページは監視を終える。閉じたタブは少数を空ページにして残し、
+次の詳細ページで使い回す（タブを新しく開かない）
+"""
+import time
+from collections import OrderedDict
+
+# 同時に監視する詳細ページの上限
+DEFAULT_MAX_PAGES = 10
+# この秒数使われていない詳細ページは閉じる（0 で閉じない）
+DEFAULT_IDLE_SEC = 600
+# 親ターゲットのチェックでこの回数続けてリンクが検知されなかった詳細ページは閉じる
+DEFAULT_RETIRE_MISSES = 2
+# 使い回すために残しておく空ページの数
+DEFAULT_SPARE_PAGES = 2
+SPARE_URL = "about:blank"
+
+
+class _Entry:
+    __slots__ = ("idx", "parent", "context", "last_used", "misses")
+
+    def __init__(self, idx, parent, context):
+        self.idx = idx
+        self.parent = parent
+        self.context = context
+        self.last_used = time.monotonic()
+        self.misses = 0
+
+
+class DetailPagePool:
+    """詳細ページの索引（URL → 監視中のページ）と、閉じたページの使い回し
+
+    ページの監視ループ・リストは watcher が持ち、このクラスはどのページを閉じるかを決める。
+
+    Args:
+        max_pages: 同時に監視する詳細ページの上限
+        idle_sec: この秒数使われていないページは閉じる（0 で閉じない）
+        retire_misses: 親ターゲットでこの回数続けて検知されなかったページは閉じる
+        spare_pages: 使い回すために残しておく空ページの数
+    """
+
+    def __init__(self, max_pages=DEFAULT_MAX_PAGES, idle_sec=DEFAULT_IDLE_SEC,
+                 retire_misses=DEFAULT_RETIRE_MISSES, spare_pages=DEFAULT_SPARE_PAGES):
+        self.max_pages = max(1, int(max_pages))
+        self.idle_sec = idle_sec
+        self.retire_misses = max(1, int(retire_misses))
+        self.spare_pages = max(0, int(spare_pages))
+        # key: URL, value: _Entry（使われた順、先頭が最も長く使われていない）
+        self._entries = OrderedDict()
+        # key: 監視対象の idx, value: URL
+        self._by_idx = {}
+        # 使い回す空ページ: [(context, page)]
+        self._spares = []
+        self.stats = {"opened": 0, "reused": 0, "evicted_lru": 0, "evicted_idle": 0, "retired": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def is_detail(self, idx):
+        return idx in self._by_idx
+
+    def indices(self):
+        return list(self._by_idx)
+
+    def children(self, parent):
+        """親ターゲット（(name, url)）から開いた詳細ページの idx"""
+        return [e.idx for e in self._entries.values() if e.parent == parent]
+
+    def add(self, url, idx, parent, context):
+        self._entries[url] = _Entry(idx, parent, context)
+        self._by_idx[idx] = url
+
+    def remove(self, idx):
+        url = self._by_idx.pop(idx, None)
+        if url is not None:
+            self._entries.pop(url, None)
+
+    def touch(self, idx):
+        """詳細ページが使われた（検知した）"""
+        url = self._by_idx.get(idx)
+        if url is not None:
+            self._touch(url)
+
+    def _touch(self, url):
+        entry = self._entries[url]
+        entry.last_used = time.monotonic()
+        entry.misses = 0
+        self._entries.move_to_end(url)
+
+    def observe_parent(self, parent, detected_urls):
+        """親ターゲットのチェック結果を反映
+
+        Args:
+            parent: 親ターゲット（(name, url)）
+            detected_urls: 今回検知したリンクのURL
+
+        Returns:
+            親で検知されなくなったため閉じる詳細ページの idx
+        """
+        detected_urls = set(detected_urls)
+        retire = []
+        for url, entry in list(self._entries.items()):
+            if entry.parent != parent:
+                continue
+            if url in detected_urls:
+                self._touch(url)
+                continue
+            entry.misses += 1
+            if entry.misses >= self.retire_misses:
+                self.stats["retired"] += 1
+                retire.append(entry.idx)
+        return retire
+
+    def evictions(self, incoming=1):
+        """上限・未使用時間を超えたため閉じる詳細ページの idx
+
+        Args:
+            incoming: これから追加するページ数（上限に空きを作る）
+        """
+        evict = []
+        if self.idle_sec:
+            cutoff = time.monotonic() - self.idle_sec
+            for entry in self._entries.values():
+                if entry.last_used > cutoff:
+                    break
+                evict.append(entry.idx)
+                self.stats["evicted_idle"] += 1
+        overflow = len(self._entries) - len(evict) + incoming - self.max_pages
+        if overflow > 0:
+            for entry in self._entries.values():
+                if overflow <= 0:
+                    break
+                if entry.idx in evict:
+                    continue
+                evict.append(entry.idx)
+                self.stats["evicted_lru"] += 1
+                overflow -= 1
+        return evict
+
+    async def acquire_page(self, context):
+        """詳細ページ用のタブ（同じコンテキストの空ページがあれば使い回す）"""
+        for i, (spare_context, page) in enumerate(self._spares):
+            if spare_context is context:
+                del self._spares[i]
+                if not page.is_closed():
+                    self.stats["reused"] += 1
+                    return page
+                break
+        self.stats["opened"] += 1
+        return await context.new_page()
+
+    async def release_page(self, page, context):
+        """監視を終えた詳細ページのタブを空ページにして残す（残す数を超えた場合は閉じる）"""
+        if len(self._spares) < self.spare_pages and not page.is_closed():
+            try:
+                await page.goto(SPARE_URL)
+                self._spares.append((context, page))
+                return
+            except Exception:
+                pass
+        await page.close()
+
+    async def close_spares(self, context=None):
+        """空ページを閉じる（context を指定した場合はそのコンテキストの分のみ）"""
+        keep = []
+        for spare_context, page in self._spares:
+            if context is not None and spare_context is not context:
+                keep.append((spare_context, page))
+                continue
+            try:
+                await page.close()
+            except Exception:
+                pass
+        self._spares = keep
@@ -0,0 +1,295 @@
+# dispatcher.py
+"""
+通知ディスパッチャー
+送信ごとにスレッドを作らず、常駐する少数のワーカーで通知を処理する。
+優先度付きキュー（LINEをメールより先に送る）、指数バックオフでの再送（Retry-Afterを優先）、
+終了時の送信待ち（ドレイン）に対応する
+"""
+import atexit
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# 優先度（小さいほど先に送信）
+PRIORITY_PUSH = 0
+PRIORITY_MAIL = 10
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BASE_DELAY_SEC = 0.5
+DEFAULT_MAX_DELAY_SEC = 30.0
+DEFAULT_MAX_QUEUE = 1000
+# 終了時に送信待ちを待つ最大秒数
+DEFAULT_DRAIN_TIMEOUT_SEC = 10.0
+# 遅延統計に保持する直近の件数
+LATENCY_WINDOW = 200
+
+
+class _Job:
+    __slots__ = ("channel", "func", "args", "kwargs", "priority", "created_at", "attempt", "label")
+
+    def __init__(self, channel, func, args, kwargs, priority, created_at, label):
+        self.channel = channel
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.created_at = created_at
+        self.attempt = 0
+        self.label = label
+
+
+class _ChannelStats:
+    def __init__(self):
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        # 投入〜送信開始（キュー待ち）/ 投入〜送信完了（秒）
+        self.dispatch_latency = deque(maxlen=LATENCY_WINDOW)
+        self.delivery_latency = deque(maxlen=LATENCY_WINDOW)
+
+
+def _summary(values):
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "avg_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1),
+        "max_ms": round(ordered[-1] * 1000, 1),
+    }
+
+
+def _record_metrics(channel, label, created_at, delivered, retries):
+    """検知（通知の作成）から送信完了までの時間と結果をメトリクスに記録"""
+    if delivered:
+        metrics.observe("ticket_watcher_notification_latency_seconds", time.monotonic() - created_at,
+                        channel=channel, target=label)
+    metrics.inc("ticket_watcher_notifications_total", channel=channel, target=label,
+                result="delivered" if delivered else "failed")
+    if retries:
+        metrics.inc("ticket_watcher_notification_retries_total", retries, channel=channel, target=label)
+
+
+def backoff_delay(attempt, retry_after=None, base_delay=DEFAULT_BASE_DELAY_SEC, max_delay=DEFAULT_MAX_DELAY_SEC):
+    """再送までの待ち時間（指数バックオフ＋ゆらぎ、Retry-After があればそれ以上待つ）"""
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    delay += random.uniform(0, delay * 0.1)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_delay))
+    return delay
+
+
+class NotificationDispatcher:
+    """優先度付きキューと固定数のワーカーで通知を送信する
+
+    送信関数が送出した例外に retryable=True 属性があれば再送する。
+    retry_after 属性（秒）があれば、バックオフよりその値を優先する。
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY_SEC, max_delay=DEFAULT_MAX_DELAY_SEC,
+                 max_queue=DEFAULT_MAX_QUEUE):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        # 上限は submit 時に未完了件数で判定する（再送は上限に関係なく戻すため）
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        # 再送待ち（key: 送信可能時刻）
+        self._delayed = []
+        self._delayed_cond = threading.Condition()
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+        # 未完了（キュー内・送信中・再送待ち）の件数
+        self._pending = 0
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self._threads = [
+            threading.Thread(target=self._worker, daemon=True, name=f"notify-worker-{i}")
+            for i in range(max(1, workers))
+        ]
+        self._threads.append(threading.Thread(target=self._scheduler, daemon=True, name="notify-retry"))
+        for t in self._threads:
+            t.start()
+
+    def _channel_stats(self, channel):
+        with self._stats_lock:
+            if channel not in self._stats:
+                self._stats[channel] = _ChannelStats()
+            return self._stats[channel]
+
+    def _done(self):
+        with self._pending_cond:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._pending_cond.notify_all()
+
+    def submit(self, channel, func, *args, priority=PRIORITY_PUSH, label="", created_at=None, **kwargs):
+        """通知をキューに追加
+
+        Args:
+            channel: チャネル名（"line", "mail" など、統計の集計単位）
+            func: 送信関数
+            priority: 優先度（小さいほど先に送信）
+            label: ログ出力用の名前（ターゲット名など）
+            created_at: 起点時刻（time.monotonic()、省略時は現在時刻）
+
+        Returns:
+            キューに追加できた場合True（満杯・終了済みの場合False）
+        """
+        stats = self._channel_stats(channel)
+        if self._closed:
+            stats.dropped += 1
+            metrics.inc("ticket_watcher_notifications_total", channel=channel, target=label, result="dropped")
+            return False
+        with self._pending_cond:
+            if self._pending >= self.max_queue:
+                full = True
+            else:
+                full = False
+                self._pending += 1
+        if full:
+            stats.dropped += 1
+            metrics.inc("ticket_watcher_notifications_total", channel=channel, target=label, result="dropped")
+            print(f"[{label}] 通知キューが満杯のため破棄しました（{channel}）")
+            return False
+        job = _Job(channel, func, args, kwargs, priority, created_at or time.monotonic(), label)
+        stats.submitted += 1
+        self._queue.put((priority, next(self._seq), job))
+        return True
+
+    def record_result(self, channel, created_at, started_at, delivered, retries=0, label=""):
+        """ディスパッチャー外（asyncio側など）で送信した通知の結果を統計に加える
+
+        Args:
+            label: ターゲット名など（メトリクスのラベル）
+            created_at: 起点時刻（time.monotonic()）
+            started_at: 最初の送信開始時刻（time.monotonic()）
+            delivered: 送信できた場合True
+            retries: 再送回数
+        """
+        stats = self._channel_stats(channel)
+        stats.submitted += 1
+        stats.retries += retries
+        stats.dispatch_latency.append(started_at - created_at)
+        if delivered:
+            stats.delivered += 1
+            stats.delivery_latency.append(time.monotonic() - created_at)
+        else:
+            stats.failed += 1
+        _record_metrics(channel, label, created_at, delivered, retries)
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            stats = self._channel_stats(job.channel)
+            started = time.monotonic()
+            if job.attempt == 0:
+                stats.dispatch_latency.append(started - job.created_at)
+            try:
+                job.func(*job.args, **job.kwargs)
+            except Exception as e:
+                if getattr(e, "retryable", False) and job.attempt < self.max_retries:
+                    delay = backoff_delay(job.attempt, getattr(e, "retry_after", None), self.base_delay, self.max_delay)
+                    job.attempt += 1
+                    stats.retries += 1
+                    print(f"[{job.label}] {job.channel}送信失敗、{delay:.1f}s後に再送します（{job.attempt}/{self.max_retries}）: {e}")
+                    with self._delayed_cond:
+                        heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._seq), job))
+                        self._delayed_cond.notify()
+                    continue
+                stats.failed += 1
+                print(f"[{job.label}] {job.channel}送信失敗: {e}")
+                _record_metrics(job.channel, job.label, job.created_at, False, job.attempt)
+            else:
+                stats.delivered += 1
+                stats.delivery_latency.append(time.monotonic() - job.created_at)
+                _record_metrics(job.channel, job.label, job.created_at, True, job.attempt)
+            self._done()
+
+    def _scheduler(self):
+        """再送待ちのジョブを送信可能時刻にキューへ戻す"""
+        while True:
+            with self._delayed_cond:
+                while not self._delayed:
+                    self._delayed_cond.wait()
+                due, _, job = self._delayed[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._delayed_cond.wait(wait)
+                    continue
+                heapq.heappop(self._delayed)
+            self._queue.put((job.priority, next(self._seq), job))
+
+    def drain(self, timeout=DEFAULT_DRAIN_TIMEOUT_SEC):
+        """未完了の通知がなくなるまで待機
+
+        Returns:
+            すべて完了した場合True
+        """
+        deadline = time.monotonic() + timeout
+        with self._pending_cond:
+            while self._pending > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=DEFAULT_DRAIN_TIMEOUT_SEC):
+        """新規受付を止め、送信待ちの通知を送り切る"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._pending:
+            print(f"未送信の通知を送信しています（{self._pending}件）...")
+        if not self.drain(timeout):
+            print(f"通知の送信待ちがタイムアウトしました（残り{self._pending}件）")
+
+    def stats(self):
+        """チャネルごとの送信統計"""
+        with self._stats_lock:
+            items = list(self._stats.items())
+        return {
+            channel: {
+                "submitted": s.submitted,
+                "delivered": s.delivered,
+                "failed": s.failed,
+                "retries": s.retries,
+                "dropped": s.dropped,
+                "dispatch_latency": _summary(list(s.dispatch_latency)),
+                "delivery_latency": _summary(list(s.delivery_latency)),
+            }
+            for channel, s in items
+        }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher(cfg=None):
+    """プロセス共通のディスパッチャーを取得（初回のみ cfg の設定で作成）"""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                cfg = cfg or {}
+                _dispatcher = NotificationDispatcher(
+                    workers=cfg.get("notify_workers", DEFAULT_WORKERS),
+                    max_retries=cfg.get("notify_max_retries", DEFAULT_MAX_RETRIES),
+                )
+                atexit.register(_dispatcher.shutdown)
+    return _dispatcher
@@ -0,0 +1,85 @@
+# dom_archive.py
+"""
+DOMスナップショットのアーカイブ
+検知時のHTML（一致したブロックの outerHTML、またはページ全体）を gzip で保存する。
+ファイル名は内容のハッシュ（content-addressed）のため、同じ内容は1回だけ保存される。
+スクリーンショットより軽く、grep や diff で事後確認できる
+"""
+import asyncio
+import gzip
+import hashlib
+import os
+from pathlib import Path
+
+DEFAULT_DIR = "logs/dom"
+# アーカイブの対象（blocks: 一致したブロックのみ / page: ページ全体）
+MODES = ("blocks", "page")
+
+
+def resolve_mode(cfg, target_config):
+    """dom_archive の設定値（ターゲット単位で上書き可）。無効な場合は None"""
+    mode = target_config.get("dom_archive", cfg.get("dom_archive"))
+    if not mode:
+        return None
+    if mode is True:
+        return "blocks"
+    if mode not in MODES:
+        print(f"[{target_config.get('name', '')}] dom_archive の値が不正です（無視）: {mode}")
+        return None
+    return mode
+
+
+def join_blocks(block_htmls):
+    """ブロックの outerHTML を1つの文書にまとめる"""
+    return "\n".join(f"<!-- block {i} -->\n{html}" for i, html in enumerate(block_htmls))
+
+
+class DomArchive:
+    """gzip圧縮・内容ハッシュ名でHTMLを保存する
+
+    保存先は <directory>/<ハッシュ先頭2文字>/<ハッシュ>.html.gz
+    """
+
+    def __init__(self, directory=DEFAULT_DIR):
+        self.directory = Path(directory)
+        # 保存済み（または保存中）のハッシュ
+        self._known = set()
+        self.stats = {"stored": 0, "deduplicated": 0, "bytes_written": 0}
+
+    def path_for(self, digest):
+        return self.directory / digest[:2] / f"{digest}.html.gz"
+
+    def store(self, html):
+        """HTMLを保存（書き込みはスレッドで行い、完了は待たない）
+
+        Returns:
+            内容のハッシュ（イベントログなどから参照する）
+        """
+        data = html.encode("utf-8")
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        if digest in self._known:
+            self.stats["deduplicated"] += 1
+            return digest
+        self._known.add(digest)
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write, digest, data)
+        except RuntimeError:
+            self._write(digest, data)
+        return digest
+
+    def _write(self, digest, data):
+        path = self.path_for(digest)
+        if path.exists():
+            self.stats["deduplicated"] += 1
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with gzip.open(tmp, "wb", compresslevel=6) as f:
+                f.write(data)
+            os.replace(tmp, path)
+            self.stats["stored"] += 1
+            self.stats["bytes_written"] += path.stat().st_size
+        except Exception as e:
+            self._known.discard(digest)
+            print(f"DOMスナップショットの保存エラー: {e}")
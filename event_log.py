@@ -0,0 +1,175 @@
+# event_log.py
+"""
+検知イベントのログ（JSONL）
+常駐する1本のスレッドがキューからまとめて書き込む（イベントごとにスレッド作成・ファイルオープンをしない）。
+ファイルはサイズ・経過時間でローテーションし、古いファイルはgzipで圧縮する。
+キューが満杯の場合はイベントを破棄し、破棄した件数を記録する
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_LOG_PATH = "logs/detection_changes.jsonl"
+# ローテーションするサイズ（バイト）
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+# ローテーションする間隔（秒）
+DEFAULT_ROTATE_INTERVAL_SEC = 24 * 3600
+DEFAULT_MAX_QUEUE = 10000
+# まとめて書き込む最大件数・最大待ち時間（秒）
+BATCH_SIZE = 256
+FLUSH_INTERVAL_SEC = 0.5
+
+_STOP = object()
+
+
+class EventLogWriter:
+    """JSONLのイベントログをバックグラウンドでまとめて書き込む
+
+    Args:
+        path: ログファイルのパス
+        max_bytes: このサイズを超えたらローテーション（0で無効）
+        rotate_interval_sec: この秒数が経過したらローテーション（0で無効）
+        compress: ローテーションしたファイルをgzipで圧縮するか
+        max_queue: キューの上限（超えた分は破棄）
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, max_bytes=DEFAULT_MAX_BYTES,
+                 rotate_interval_sec=DEFAULT_ROTATE_INTERVAL_SEC, compress=True, max_queue=DEFAULT_MAX_QUEUE):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.rotate_interval_sec = rotate_interval_sec
+        self.compress = compress
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._opened_at = 0.0
+        self.stats = {"written": 0, "dropped": 0, "batches": 0, "rotations": 0, "errors": 0}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True, name="event-log")
+        self._thread.start()
+
+    def write(self, event):
+        """イベント（辞書）をキューに追加（満杯の場合は破棄してFalseを返す）"""
+        if self._closed:
+            self.stats["dropped"] += 1
+            return False
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+        # 既存ファイルに追記する場合は、ファイルの作成時刻からローテーション間隔を数える
+        try:
+            self._opened_at = os.path.getmtime(self.path) if self._file.tell() else time.time()
+        except OSError:
+            self._opened_at = time.time()
+
+    def _should_rotate(self):
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval_sec) and time.time() - self._opened_at >= self.rotate_interval_sec
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if not self.path.exists() or self.path.stat().st_size == 0:
+            return
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        rotated = self.path.with_name(f"{self.path.stem}.{stamp}{self.path.suffix}")
+        n = 1
+        while rotated.exists() or Path(f"{rotated}.gz").exists():
+            rotated = self.path.with_name(f"{self.path.stem}.{stamp}-{n}{self.path.suffix}")
+            n += 1
+        os.replace(self.path, rotated)
+        self.stats["rotations"] += 1
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+    def _write_batch(self, batch):
+        if self._file is None:
+            self._open()
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=str) + "\n" for event in batch)
+        self._file.write(lines)
+        self._file.flush()
+        self.stats["written"] += len(batch)
+        self.stats["batches"] += 1
+        if self._should_rotate():
+            self._rotate()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=FLUSH_INTERVAL_SEC)
+            except queue.Empty:
+                if self._file is not None and self.rotate_interval_sec and self._should_rotate():
+                    self._rotate()
+                continue
+            batch = []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                if len(batch) >= BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    print(f"イベントログの書き込みエラー: {e}")
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self, timeout=5.0):
+        """キューに残ったイベントを書き込んでから終了"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self.stats["dropped"]:
+            print(f"イベントログ: {self.stats['dropped']}件を破棄しました（キュー満杯）")
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer(cfg=None):
+    """プロセス共通のイベントログを取得（初回のみ cfg の設定で作成）"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                cfg = cfg or {}
+                _writer = EventLogWriter(
+                    cfg.get("event_log_path", DEFAULT_LOG_PATH),
+                    max_bytes=cfg.get("event_log_max_bytes", DEFAULT_MAX_BYTES),
+                    rotate_interval_sec=cfg.get("event_log_rotate_interval_sec", DEFAULT_ROTATE_INTERVAL_SEC),
+                    compress=cfg.get("event_log_compress", True),
+                )
+                atexit.register(_writer.close)
+    return _writer
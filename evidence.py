@@ -0,0 +1,235 @@
+# evidence.py
+"""
+検知時の証跡（スクリーンショット）の取得
+監視中のページは使わず、検知時点のDOMスナップショット（HTML）を専用のキャプチャページに
+set_content で再現して撮影する。撮影は別タスクで行うため、ポーリングは撮影を待たない。
+撮影は検知したブロックに切り抜き、形式（JPEG / PNG / WebP）と画質を指定できる。
+直前と同じ内容のブロックは撮影をスキップする
+"""
+import asyncio
+import hashlib
+import html as html_lib
+import io
+import re
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_DIR = "logs/screenshots"
+DEFAULT_FORMAT = "jpeg"
+DEFAULT_QUALITY = 70
+DEFAULT_MAX_QUEUE = 100
+# キャプチャページでの描画の待ち時間（ミリ秒）
+RENDER_TIMEOUT_MS = 5000
+
+# 検知時点のDOMと、切り抜くブロック（selector に一致し needle を含む最初の要素）の位置を取得
+SNAPSHOT_JS = """
+([selector, needle]) => {
+    let index = -1;
+    let block = '';
+    if (selector) {
+        try {
+            const els = document.querySelectorAll(selector);
+            for (let i = 0; i < els.length; i++) {
+                if (!needle || (els[i].innerText || '').includes(needle)) {
+                    index = i;
+                    block = els[i].outerHTML;
+                    break;
+                }
+            }
+        } catch (e) {}
+    }
+    return {
+        html: document.documentElement.outerHTML,
+        url: location.href,
+        index: index,
+        block: block,
+        width: window.innerWidth,
+        height: window.innerHeight,
+    };
+}
+"""
+
+_SCRIPT_RE = re.compile(r"<script\b[^>]*>.*?</script\s*>", re.IGNORECASE | re.DOTALL)
+_HEAD_RE = re.compile(r"<head\b[^>]*>", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def prepare_html(html, base_url):
+    """キャプチャページ用のHTML（スクリプトを除去し、相対URLが解決されるよう <base> を入れる）"""
+    html = _SCRIPT_RE.sub("", html)
+    base_tag = f'<base href="{html_lib.escape(base_url, quote=True)}">'
+    match = _HEAD_RE.search(html)
+    if match:
+        return html[:match.end()] + base_tag + html[match.end():]
+    return base_tag + html
+
+
+def content_hash(snapshot):
+    """撮影内容の同一判定用ハッシュ（ブロックの内容のみ、空白の違いは無視）"""
+    body = snapshot.get("block") or snapshot.get("html", "")
+    normalized = _SPACE_RE.sub(" ", body).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+async def take_snapshot(page, selector, needle=None):
+    """ページのDOMスナップショットを取得（1回の evaluate のみ）"""
+    return await page.evaluate(SNAPSHOT_JS, [selector or "", needle or ""])
+
+
+def snapshot_from_html(html, url, needle=None):
+    """HTTP取得したHTMLからスナップショットを作成（fetch_mode: "http" 用、ブロックは描画後に needle で探す）"""
+    return {"html": html, "url": url, "index": None, "needle": needle or "", "block": "", "width": 0, "height": 0}
+
+
+def _safe_name(name):
+    safe = "".join(c for c in name if c.isalnum() or c in (" ", "-", "_")).strip()
+    return safe.replace(" ", "_")
+
+
+class EvidenceCapturer:
+    """DOMスナップショットをキャプチャページで描画して撮影する
+
+    キューにはスナップショット（文字列）のみを積み、監視中のページへの参照は持たない。
+
+    Args:
+        browser: キャプチャページを開くブラウザ（監視用とは別のコンテキストを初回撮影時に作成）
+        cookies: キャプチャ用コンテキストに設定するCookie（画像などの取得用）
+        directory: 保存先ディレクトリ
+        image_format: "jpeg" / "png" / "webp"（webp は Pillow が必要）
+        quality: JPEG / WebP の画質（1〜100）
+    """
+
+    def __init__(self, browser, cookies=None, directory=DEFAULT_DIR, image_format=DEFAULT_FORMAT,
+                 quality=DEFAULT_QUALITY, max_queue=DEFAULT_MAX_QUEUE):
+        self.browser = browser
+        self.cookies = cookies or []
+        self._context = None
+        self.directory = Path(directory)
+        self.image_format = image_format.lower()
+        if self.image_format == "jpg":
+            self.image_format = "jpeg"
+        if self.image_format == "webp" and Image is None:
+            print("WebPでの保存には Pillow が必要です（pip install pillow）。JPEGで保存します。")
+            self.image_format = "jpeg"
+        self.quality = quality
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._page = None
+        # key: (ターゲット名, state_change), value: 直前に撮影した内容のハッシュ
+        # 撮影は状態変化（appeared / disappeared が交互）の時のみのため、変化の種類ごとに前回と比べる
+        self._last_hash = {}
+        self.stats = {"captured": 0, "skipped_same": 0, "dropped": 0, "errors": 0}
+
+    def set_browser(self, browser):
+        """キャプチャに使うブラウザを切り替える（元のブラウザが閉じられる場合、コンテキストは次の撮影時に作り直す）"""
+        if browser is not self.browser:
+            self.browser = browser
+            self._context = None
+            self._page = None
+
+    def submit(self, snapshot, target_name, selector, state_change, timestamp):
+        """撮影をキューに追加（完了は待たない）"""
+        digest = content_hash(snapshot)
+        hash_key = (target_name, state_change)
+        if self._last_hash.get(hash_key) == digest:
+            self.stats["skipped_same"] += 1
+            print(f"[{target_name}] 前回と同じ内容のためスクリーンショットをスキップしました")
+            return False
+        self._last_hash[hash_key] = digest
+        try:
+            self._queue.put_nowait({
+                "snapshot": snapshot,
+                "target_name": target_name,
+                "selector": selector,
+                "state_change": state_change,
+                "timestamp": timestamp,
+            })
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"[{target_name}] スクリーンショットのキューが満杯のためスキップしました")
+            return False
+
+    async def _get_page(self):
+        if self._context is None:
+            self._context = await self.browser.new_context()
+            if self.cookies:
+                try:
+                    await self._context.add_cookies(self.cookies)
+                except Exception as e:
+                    print(f"キャプチャ用コンテキストのCookie設定エラー（無視）: {e}")
+        if self._page is None or self._page.is_closed():
+            self._page = await self._context.new_page()
+        return self._page
+
+    def _filepath(self, item):
+        ext = "jpg" if self.image_format == "jpeg" else self.image_format
+        name = _safe_name(item["target_name"])
+        return self.directory / f"{item['timestamp'].strftime('%Y%m%d_%H%M%S')}_{name}_{item['state_change']}.{ext}"
+
+    async def _capture(self, item):
+        snapshot = item["snapshot"]
+        page = await self._get_page()
+        if snapshot.get("width") and snapshot.get("height"):
+            await page.set_viewport_size({"width": snapshot["width"], "height": snapshot["height"]})
+        await page.set_content(
+            prepare_html(snapshot["html"], snapshot["url"]), wait_until="load", timeout=RENDER_TIMEOUT_MS
+        )
+
+        # Playwright は JPEG / PNG のみ対応（WebP は PNG で撮影して変換）
+        shot_type = "png" if self.image_format in ("png", "webp") else "jpeg"
+        options = {"type": shot_type, "timeout": RENDER_TIMEOUT_MS}
+        if shot_type == "jpeg":
+            options["quality"] = self.quality
+
+        target = None
+        selector = item["selector"]
+        if selector and snapshot.get("index") is None:
+            target = page.locator(selector)
+            if snapshot.get("needle"):
+                target = target.filter(has_text=snapshot["needle"])
+            target = target.first
+        elif selector and snapshot["index"] >= 0:
+            target = page.locator(selector).nth(snapshot["index"])
+        if target is not None and not await target.count():
+            target = None
+        # ブロックが見つからない場合は表示範囲のみ（ページ全体は撮らない）
+        data = await (target.screenshot(**options) if target else page.screenshot(**options))
+
+        filepath = self._filepath(item)
+        # 変換・保存はスレッドで行い、イベントループを止めない
+        await asyncio.get_running_loop().run_in_executor(None, self._save, data, filepath)
+        return filepath
+
+    def _save(self, data, filepath):
+        if self.image_format == "webp":
+            buffer = io.BytesIO()
+            Image.open(io.BytesIO(data)).save(buffer, "WEBP", quality=self.quality)
+            data = buffer.getvalue()
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_bytes(data)
+
+    async def run(self):
+        """キューの撮影を順に処理（タスクとして常駐）"""
+        while True:
+            item = await self._queue.get()
+            try:
+                filepath = await self._capture(item)
+                self.stats["captured"] += 1
+                print(f"[{item['target_name']}] スクリーンショットを保存しました: {filepath}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"[{item['target_name']}] スクリーンショット取得エラー: {e}")
+
+    async def aclose(self):
+        if self._context is not None:
+            try:
+                await self._context.close()
+            except Exception:
+                pass
+            self._context = None
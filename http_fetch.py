@@ -0,0 +1,192 @@
+# http_fetch.py
+"""
+HTTP高速パス
+サーバー側で描画されるページ（JavaScript不要）をブラウザを使わずに取得し、
+watcher.py と同じ [text, seat_type, href] 形式のブロックを抽出する
+"""
+import re
+
+try:
+    import httpx
+    import lxml.html
+    from lxml.cssselect import CSSSelector
+    AVAILABLE = True
+except ImportError:
+    # 依存ライブラリが無い場合はHTTP高速パスを使わず、ブラウザで監視する
+    AVAILABLE = False
+
+# タイムアウト（秒）
+HTTP_TIMEOUT_SEC = 2.0
+# キープアライブで保持する接続数・保持時間
+HTTP_MAX_KEEPALIVE = 20
+HTTP_KEEPALIVE_EXPIRY_SEC = 60
+
+# innerText に含まれない（描画されない）要素。HTTPで取得した場合も取り除いてからテキストを取る
+NON_RENDERED_TAGS = ("script", "style", "noscript", "template")
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+)
+
+
+def _inner_text(el):
+    """要素のテキスト（innerText に近づけるため、改行を含む空白は改行1つ、それ以外の連続した空白は空白1つにまとめる）"""
+    text = el.text_content() or ""
+    text = re.sub(r"[ \t\r\f\v]*\n\s*", "\n", text)
+    return re.sub(r"[ \t\r\f\v]+", " ", text).strip()
+
+
+def extract_blocks_from_html(html, selector, base_url=None):
+    """HTMLからセレクタに一致するブロックを抽出
+
+    Args:
+        html: HTML文字列（またはbytes）
+        selector: CSSセレクタ
+        base_url: ドキュメントのURL（hrefは相対URLのまま返す）
+
+    Returns:
+        [text, seat_type, href] のリスト
+    """
+    doc = lxml.html.fromstring(html, base_url=base_url)
+    # ブラウザの innerText と同じテキストで照合するため、script・style などの中身を除く（後ろのテキストは残す）
+    for el in list(doc.iter(*NON_RENDERED_TAGS)):
+        el.drop_tree()
+    blocks = []
+    for el in CSSSelector(selector)(doc):
+        # 席種: input.valiation の value、なければ .ticketSelect__text の先頭語
+        seat_type = None
+        valiation = el.cssselect("input.valiation")
+        if valiation:
+            seat_type = valiation[0].get("value")
+        else:
+            text_elem = el.cssselect(".ticketSelect__text")
+            if text_elem:
+                text_content = (text_elem[0].text_content() or "").strip()
+                seat_type = text_content.split(" ")[0] if " " in text_content else text_content
+        link = el.cssselect("a")
+        href = link[0].get("href") if link else None
+        blocks.append([_inner_text(el), seat_type, href])
+    return blocks
+
+
+class HttpFetcher:
+    """キープアライブ接続を使い回してページを条件付きGETで取得するクライアント"""
+
+    def __init__(self, cookies=None, timeout=HTTP_TIMEOUT_SEC):
+        """
+        初期化
+
+        Args:
+            cookies: Playwrightの context.cookies() 形式のCookieリスト
+            timeout: リクエストタイムアウト（秒）
+        """
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+            ),
+        )
+        self.set_cookies(cookies or [])
+        # key: (url, selector), value: {"etag", "last_modified", "blocks"}
+        self._cache = {}
+
+    def set_cookies(self, cookies):
+        """persistent context から取得したCookieを設定"""
+        for c in cookies:
+            try:
+                self.client.cookies.set(
+                    c["name"], c["value"],
+                    domain=c.get("domain", ""),
+                    path=c.get("path", "/"),
+                )
+            except Exception as e:
+                print(f"HTTP Cookie設定エラー（無視）: {e}")
+
+    async def fetch_blocks(self, url, selector, target_name="", detection=None):
+        """ページを取得してブロックを抽出
+
+        Args:
+            detection: 渡すとリダイレクトを検知した場合に detection["redirected"] を True にする
+
+        Returns:
+            [text, seat_type, href] のリスト。
+            セレクタ未指定・不一致・リダイレクト・HTTPエラーの場合は None（ブラウザで監視する）
+        """
+        if not selector:
+            return None
+        cache_key = (url, selector)
+        cached = self._cache.get(cache_key)
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            r = await self.client.get(url, headers=headers)
+        except Exception as e:
+            print(f"[{target_name}] HTTP取得エラー: {e}")
+            return None
+
+        if r.status_code == 304 and cached:
+            # 変更なし: 解析をスキップして前回の抽出結果を使う
+            print(f"[{target_name}] HTTP 304（変更なし）")
+            return cached["blocks"]
+
+        if r.status_code != 200:
+            print(f"[{target_name}] HTTPステータス異常: {r.status_code}")
+            return None
+
+        # リダイレクトを検知（アクセス過多ページなどに飛ばされた場合）
+        final_url = str(r.url)
+        lowered = final_url.lower()
+        if final_url != url and ("error" in lowered or "access" in lowered or "too" in lowered):
+            print(f"[{target_name}] 警告: HTTPでリダイレクトが検知されました。現在のURL: {final_url}")
+            if detection is not None:
+                detection["redirected"] = True
+            return None
+
+        try:
+            # Content-Type で文字コードが指定されていればそれで復号（なければ lxml が <meta charset> から判定）
+            html = r.text if r.charset_encoding else r.content
+            blocks = extract_blocks_from_html(html, selector, base_url=final_url)
+        except Exception as e:
+            print(f"[{target_name}] HTML解析エラー: {e}")
+            return None
+
+        if not blocks:
+            print(f"[{target_name}] HTMLに{selector}が見つかりません。ブラウザで確認します。")
+            self._cache.pop(cache_key, None)
+            return None
+
+        self._cache[cache_key] = {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "blocks": blocks,
+            "html": r.text,
+            "final_url": final_url,
+        }
+        print(f"[{target_name}] HTTPで{len(blocks)}個の要素を検出")
+        return blocks
+
+    def last_html(self, url, selector):
+        """直近に取得したHTMLと最終URL（証跡用、取得していない場合は None）"""
+        cached = self._cache.get((url, selector))
+        if not cached:
+            return None
+        return cached["html"], cached["final_url"]
+
+    async def warm_up(self, url):
+        """接続を事前に確立（販売開始前のウォームアップ用）"""
+        try:
+            await self.client.head(url)
+        except Exception as e:
+            print(f"HTTPウォームアップエラー（無視）: {e}")
+
+    async def aclose(self):
+        await self.client.aclose()
@@ -0,0 +1,142 @@
+# line_http.py
+"""
+LINE Messaging API 用の共有HTTPセッション
+notifier.py と line_push_api.py で接続プールを共有し、
+送信のたびにDNS解決・TCP接続・TLSハンドシェイクを行わないようにする
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+LINE_API_BASE_URL = "https://api.line.me"
+# 接続プールのサイズ（同時に送信する最大数）
+POOL_MAXSIZE = 10
+# 接続を維持するための疎通確認の間隔（秒）
+KEEPALIVE_INTERVAL_SEC = 30
+# 疎通確認のタイムアウト（秒）。送信時より長めに取り、接続確立を確実に終わらせる
+KEEPALIVE_TIMEOUT_SEC = 5.0
+
+_session = None
+_session_lock = threading.Lock()
+_keepalive_thread = None
+
+# 送信統計（接続を再利用できたか）
+stats = {"requests": 0, "reused": 0, "new_connections": 0}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    """共有セッションを取得（初回のみ作成）"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+# key: id(接続プール), value: 前回確認時点の新規接続数
+_seen_connections = {}
+
+
+def _was_reused(response):
+    """レスポンスの接続プールで新しい接続が作られなかったか（判定できない場合None）"""
+    try:
+        pool = response.raw._pool
+        count = pool.num_connections
+    except Exception:
+        return None
+    with _stats_lock:
+        previous = _seen_connections.get(id(pool), 0)
+        _seen_connections[id(pool)] = count
+    return count == previous
+
+
+def post(url, headers, payload, timeout):
+    """共有セッションでPOST
+
+    Returns:
+        (response, reused): reused は既存の接続を再利用できた場合True（判定できない場合None）
+    """
+    response = get_session().post(url, headers=headers, json=payload, timeout=timeout)
+    reused = _was_reused(response)
+    with _stats_lock:
+        stats["requests"] += 1
+        if reused:
+            stats["reused"] += 1
+        elif reused is False:
+            stats["new_connections"] += 1
+    return response, reused
+
+
+def parse_retry_after(value):
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数に変換（解釈できない場合None）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def reuse_label(reused):
+    """ログ出力用の接続状態"""
+    if reused is None:
+        return ""
+    return "（接続再利用）" if reused else "（新規接続）"
+
+
+def ping(token, base_url=LINE_API_BASE_URL):
+    """疎通確認（Bot情報取得）で接続を確立・維持する"""
+    try:
+        response = get_session().get(
+            f"{base_url}/v2/bot/info",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=KEEPALIVE_TIMEOUT_SEC,
+        )
+        _was_reused(response)
+        return True
+    except Exception as e:
+        print(f"LINE接続の疎通確認に失敗: {e}")
+        return False
+
+
+def warm_up(token, connections=2, base_url=LINE_API_BASE_URL):
+    """接続を事前に確立（並列に疎通確認して複数の接続をプールに載せる）"""
+    threads = [
+        threading.Thread(target=ping, args=(token, base_url), daemon=True)
+        for _ in range(max(1, min(connections, POOL_MAXSIZE)))
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(KEEPALIVE_TIMEOUT_SEC)
+
+
+def start_keepalive(token, interval=KEEPALIVE_INTERVAL_SEC, connections=2, base_url=LINE_API_BASE_URL):
+    """接続の事前確立と定期的な疎通確認をバックグラウンドで開始（プロセス内で1回のみ）"""
+    global _keepalive_thread
+    if not token:
+        return
+    with _session_lock:
+        if _keepalive_thread is not None:
+            return
+
+        def _run():
+            warm_up(token, connections, base_url)
+            while True:
+                time.sleep(interval)
+                ping(token, base_url)
+
+        _keepalive_thread = threading.Thread(target=_run, daemon=True, name="line-keepalive")
+        _keepalive_thread.start()
@@ -3,11 +3,20 @@ LINE Messaging API - Push Message 実装
 LINE Bot APIを使用してプッシュメッセージを送信するためのモジュール
 """
 
+import asyncio
 import requests
 import json
+import uuid
+import line_http
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Union
 from enum import Enum
 
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
 
 class MessageType(Enum):
     """メッセージタイプの列挙型"""
@@ -23,83 +32,27 @@ class MessageType(Enum):
     FLEX = "flex"
 
 
-class LinePushAPI:
-    """LINE Push API クライアントクラス"""
-    
-    BASE_URL = "https://api.line.me/v2/bot"
-    REQUEST_TIMEOUT_SEC = 0.3
+class LineAPIError(Exception):
+    """LINE APIリクエストの失敗
     
-    def __init__(self, channel_access_token: str):
-        """
-        初期化
-        
-        Args:
-            channel_access_token: LINE Channel Access Token
-        """
-        self.channel_access_token = channel_access_token
-        self.headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {channel_access_token}"
-        }
+    Attributes:
+        status_code: HTTPステータスコード（通信エラーの場合None）
+        retry_after: Retry-Afterヘッダーの秒数（指定がない場合None）
+        retryable: 再送すべきか（通信エラー・429・5xx）
+    """
     
-    def _send_request(self, url: str, payload: Dict) -> Dict:
-        """
-        APIリクエストを送信
-        
-        Args:
-            url: リクエストURL
-            payload: リクエストペイロード
-            
-        Returns:
-            APIレスポンス
-            
-        Raises:
-            Exception: APIリクエストが失敗した場合
-        """
-        try:
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=self.REQUEST_TIMEOUT_SEC,
-            )
-            response.raise_for_status()
-            return response.json() if response.content else {}
-        except requests.exceptions.HTTPError as e:
-            error_msg = f"HTTPエラー: {e.response.status_code}"
-            try:
-                error_detail = e.response.json()
-                error_msg += f" - {error_detail}"
-            except:
-                error_msg += f" - {e.response.text}"
-            raise Exception(error_msg) from e
-        except requests.exceptions.RequestException as e:
-            raise Exception(f"リクエストエラー: {str(e)}") from e
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.retryable = status_code is None or status_code == 429 or status_code >= 500
+
+
+class LineMessageBuilder:
+    """メッセージオブジェクトの作成（同期版・非同期版のクライアントで共通）"""
     
-    def push_message(
-        self,
-        user_id: str,
-        messages: List[Dict],
-        notification_disabled: bool = False
-    ) -> Dict:
-        """
-        プッシュメッセージを送信
-        
-        Args:
-            user_id: 送信先ユーザーID
-            messages: メッセージオブジェクトのリスト
-            notification_disabled: 通知を無効にするかどうか
-            
-        Returns:
-            APIレスポンス
-        """
-        url = f"{self.BASE_URL}/message/push"
-        payload = {
-            "to": user_id,
-            "messages": messages,
-            "notificationDisabled": notification_disabled
-        }
-        return self._send_request(url, payload)
+    # マルチキャストの1リクエストあたりの最大送信先数（LINE APIの上限）
+    MULTICAST_MAX_RECIPIENTS = 500
     
     @staticmethod
     def create_text_message(text: str, quick_reply: Optional[Dict] = None) -> Dict:
@@ -309,6 +262,169 @@ class LinePushAPI:
             action["displayText"] = display_text
         return action
     
+    @staticmethod
+    def _error_from_response(response) -> LineAPIError:
+        """エラーレスポンス（requests / httpx）から LineAPIError を作成"""
+        error_msg = f"HTTPエラー: {response.status_code}"
+        try:
+            error_detail = response.json()
+            error_msg += f" - {error_detail}"
+        except:
+            error_msg += f" - {response.text}"
+        retry_after = line_http.parse_retry_after(response.headers.get("Retry-After"))
+        return LineAPIError(error_msg, response.status_code, retry_after)
+    
+    @classmethod
+    def _chunk_recipients(cls, user_ids: List[str]) -> List[List[str]]:
+        """送信先を重複除外し、マルチキャストの上限人数ごとに分割"""
+        unique_ids = list(dict.fromkeys(user_ids))
+        size = cls.MULTICAST_MAX_RECIPIENTS
+        return [unique_ids[i:i + size] for i in range(0, len(unique_ids), size)]
+    
+    @staticmethod
+    def _chunk_retry_key(retry_key: Optional[str], chunk: List[str]) -> Optional[str]:
+        """分割したリクエストごとの再送キー（同じ送信先なら再送時も同じキーになる）"""
+        if not retry_key:
+            return None
+        return str(uuid.uuid5(uuid.UUID(retry_key), ",".join(chunk)))
+    
+    @staticmethod
+    def _summarize_chunks(chunk_results: List[Dict]) -> Dict:
+        return {
+            "success": sum(r["recipients"] for r in chunk_results if r["ok"]),
+            "failed": sum(r["recipients"] for r in chunk_results if not r["ok"]),
+            "chunks": chunk_results
+        }
+
+
+class LinePushAPI(LineMessageBuilder):
+    """LINE Push API クライアントクラス"""
+    
+    BASE_URL = f"{line_http.LINE_API_BASE_URL}/v2/bot"
+    REQUEST_TIMEOUT_SEC = 0.3
+    
+    def __init__(self, channel_access_token: str, base_url: Optional[str] = None):
+        """
+        初期化
+        
+        Args:
+            channel_access_token: LINE Channel Access Token
+            base_url: APIのベースURL（省略時は https://api.line.me、ベンチマークのモックサーバーなどに向ける場合に指定）
+        """
+        self.channel_access_token = channel_access_token
+        if base_url:
+            self.BASE_URL = f"{base_url.rstrip('/')}/v2/bot"
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {channel_access_token}"
+        }
+        # 直前の送信で接続を再利用できたか（判定できない場合はNone）
+        self.last_reused = None
+    
+    def _send_request(self, url: str, payload: Dict, retry_key: Optional[str] = None) -> Dict:
+        """
+        APIリクエストを送信
+        
+        Args:
+            url: リクエストURL
+            payload: リクエストペイロード
+            retry_key: 再送キー（X-Line-Retry-Key）。同じキーでの再送はLINE側で重複排除される
+            
+        Returns:
+            APIレスポンス
+            
+        Raises:
+            LineAPIError: APIリクエストが失敗した場合
+        """
+        headers = self.headers
+        if retry_key:
+            headers = {**self.headers, "X-Line-Retry-Key": retry_key}
+        try:
+            # 共有セッションで送信（接続を再利用してハンドシェイクを省く）
+            response, self.last_reused = line_http.post(
+                url, headers, payload, self.REQUEST_TIMEOUT_SEC
+            )
+            if retry_key and response.status_code == 409:
+                # 同じ再送キーのリクエストは受付済み（前回の送信は届いている）
+                return {}
+            response.raise_for_status()
+            return response.json() if response.content else {}
+        except requests.exceptions.HTTPError as e:
+            raise self._error_from_response(e.response) from e
+        except requests.exceptions.RequestException as e:
+            raise LineAPIError(f"リクエストエラー: {str(e)}") from e
+    
+    def push_message(
+        self,
+        user_id: str,
+        messages: List[Dict],
+        notification_disabled: bool = False
+    ) -> Dict:
+        """
+        プッシュメッセージを送信
+        
+        Args:
+            user_id: 送信先ユーザーID
+            messages: メッセージオブジェクトのリスト
+            notification_disabled: 通知を無効にするかどうか
+            
+        Returns:
+            APIレスポンス
+        """
+        url = f"{self.BASE_URL}/message/push"
+        payload = {
+            "to": user_id,
+            "messages": messages,
+            "notificationDisabled": notification_disabled
+        }
+        return self._send_request(url, payload)
+    
+    def multicast_message(
+        self,
+        user_ids: List[str],
+        messages: List[Dict],
+        notification_disabled: bool = False,
+        retry_key: Optional[str] = None
+    ) -> Dict:
+        """
+        マルチキャストメッセージを送信（複数ユーザーに一括送信）
+        500人ごとに分割し、分割したリクエストは並列に送信する
+        
+        Args:
+            user_ids: 送信先ユーザーIDのリスト（重複は除外）
+            messages: メッセージオブジェクトのリスト
+            notification_disabled: 通知を無効にするかどうか
+            retry_key: 再送キー（UUID文字列）。分割したリクエストごとに送信先から派生したキーを付ける
+            
+        Returns:
+            送信結果
+            {"success": 成功した送信先数, "failed": 失敗した送信先数,
+             "chunks": [{"recipients": 送信先数, "user_ids": 送信先, "ok": 成功したか,
+                         "error": 失敗時の LineAPIError}]}
+        """
+        url = f"{self.BASE_URL}/message/multicast"
+        chunks = self._chunk_recipients(user_ids)
+        
+        def send_chunk(chunk):
+            payload = {
+                "to": chunk,
+                "messages": messages,
+                "notificationDisabled": notification_disabled
+            }
+            try:
+                self._send_request(url, payload, self._chunk_retry_key(retry_key, chunk))
+                return {"recipients": len(chunk), "user_ids": chunk, "ok": True, "error": None}
+            except LineAPIError as e:
+                return {"recipients": len(chunk), "user_ids": chunk, "ok": False, "error": e}
+        
+        if len(chunks) <= 1:
+            chunk_results = [send_chunk(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(chunks), line_http.POOL_MAXSIZE)) as executor:
+                chunk_results = list(executor.map(send_chunk, chunks))
+        
+        return self._summarize_chunks(chunk_results)
+    
     def send_text(
         self,
         user_id: str,
@@ -349,10 +465,31 @@ class LinePushAPI:
         messages = [self.create_text_message(text) for text in texts[:5]]  # 最大5個
         return self.push_message(user_id, messages, notification_disabled)
     
+    def send_multicast_text(
+        self,
+        user_ids: List[str],
+        text: str,
+        notification_disabled: bool = False
+    ) -> Dict:
+        """
+        マルチキャストテキストメッセージを送信（簡易メソッド）
+        
+        Args:
+            user_ids: 送信先ユーザーIDのリスト
+            text: メッセージテキスト
+            notification_disabled: 通知を無効にするかどうか
+            
+        Returns:
+            送信結果（multicast_message を参照）
+        """
+        message = self.create_text_message(text)
+        return self.multicast_message(user_ids, [message], notification_disabled)
+    
     def broadcast_message(
         self,
         messages: List[Dict],
-        notification_disabled: bool = False
+        notification_disabled: bool = False,
+        retry_key: Optional[str] = None
     ) -> Dict:
         """
         ブロードキャストメッセージを送信（友達追加した全員に送信）
@@ -360,6 +497,7 @@ class LinePushAPI:
         Args:
             messages: メッセージオブジェクトのリスト
             notification_disabled: 通知を無効にするかどうか
+            retry_key: 再送キー（X-Line-Retry-Key）
             
         Returns:
             APIレスポンス
@@ -369,7 +507,7 @@ class LinePushAPI:
             "messages": messages,
             "notificationDisabled": notification_disabled
         }
-        return self._send_request(url, payload)
+        return self._send_request(url, payload, retry_key)
     
     def send_broadcast_text(
         self,
@@ -391,6 +529,158 @@ class LinePushAPI:
         return self.broadcast_message([message], notification_disabled)
 
 
+class AsyncLinePushAPI(LineMessageBuilder):
+    """LINE Push API 非同期クライアントクラス（asyncio用）
+    
+    接続プール付きの httpx.AsyncClient を保持し、同時送信数をセマフォで制限する。
+    使い終わったら aclose() で接続を閉じる
+    """
+    
+    BASE_URL = LinePushAPI.BASE_URL
+    REQUEST_TIMEOUT_SEC = LinePushAPI.REQUEST_TIMEOUT_SEC
+    # 同時に送信する最大リクエスト数
+    DEFAULT_MAX_CONCURRENCY = 10
+    
+    def __init__(
+        self,
+        channel_access_token: str,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        timeout: Optional[float] = None,
+        base_url: Optional[str] = None
+    ):
+        """
+        初期化
+        
+        Args:
+            channel_access_token: LINE Channel Access Token
+            max_concurrency: 同時に送信する最大リクエスト数（接続プールのサイズも同じ）
+            timeout: リクエストのタイムアウト（秒、省略時は REQUEST_TIMEOUT_SEC）
+            base_url: APIのベースURL（省略時は https://api.line.me）
+        """
+        if httpx is None:
+            raise RuntimeError("AsyncLinePushAPI には httpx が必要です（pip install httpx）")
+        self.channel_access_token = channel_access_token
+        if base_url:
+            self.BASE_URL = f"{base_url.rstrip('/')}/v2/bot"
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {channel_access_token}"
+        }
+        self.timeout = timeout or self.REQUEST_TIMEOUT_SEC
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(
+                max_connections=max(1, max_concurrency),
+                max_keepalive_connections=max(1, max_concurrency),
+            ),
+        )
+    
+    async def _send_request(self, url: str, payload: Dict, retry_key: Optional[str] = None) -> Dict:
+        """
+        APIリクエストを送信（LinePushAPI._send_request の非同期版）
+        
+        Raises:
+            LineAPIError: APIリクエストが失敗した場合
+        """
+        headers = {"X-Line-Retry-Key": retry_key} if retry_key else None
+        async with self._semaphore:
+            try:
+                response = await self._client.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except httpx.HTTPError as e:
+                raise LineAPIError(f"リクエストエラー: {e!r}") from e
+        if retry_key and response.status_code == 409:
+            # 同じ再送キーのリクエストは受付済み（前回の送信は届いている）
+            return {}
+        if response.is_error:
+            raise self._error_from_response(response)
+        return response.json() if response.content else {}
+    
+    async def warm_up(self, connections: int = 1) -> None:
+        """疎通確認（Bot情報取得）で接続を事前に確立"""
+        async def ping():
+            try:
+                async with self._semaphore:
+                    await self._client.get(f"{self.BASE_URL}/info", timeout=line_http.KEEPALIVE_TIMEOUT_SEC)
+            except httpx.HTTPError as e:
+                print(f"LINE接続の疎通確認に失敗: {e!r}")
+        
+        await asyncio.gather(*(ping() for _ in range(max(1, connections))))
+    
+    async def push_message(
+        self,
+        user_id: str,
+        messages: List[Dict],
+        notification_disabled: bool = False,
+        retry_key: Optional[str] = None
+    ) -> Dict:
+        """プッシュメッセージを送信（LinePushAPI.push_message を参照）"""
+        payload = {
+            "to": user_id,
+            "messages": messages,
+            "notificationDisabled": notification_disabled
+        }
+        return await self._send_request(f"{self.BASE_URL}/message/push", payload, retry_key)
+    
+    async def multicast_message(
+        self,
+        user_ids: List[str],
+        messages: List[Dict],
+        notification_disabled: bool = False,
+        retry_key: Optional[str] = None
+    ) -> Dict:
+        """
+        マルチキャストメッセージを送信（500人ごとに分割し、分割したリクエストは並行に送信）
+        
+        Returns:
+            送信結果（LinePushAPI.multicast_message を参照）
+        """
+        url = f"{self.BASE_URL}/message/multicast"
+        
+        async def send_chunk(chunk):
+            payload = {
+                "to": chunk,
+                "messages": messages,
+                "notificationDisabled": notification_disabled
+            }
+            try:
+                await self._send_request(url, payload, self._chunk_retry_key(retry_key, chunk))
+                return {"recipients": len(chunk), "user_ids": chunk, "ok": True, "error": None}
+            except LineAPIError as e:
+                return {"recipients": len(chunk), "user_ids": chunk, "ok": False, "error": e}
+        
+        chunk_results = await asyncio.gather(*(send_chunk(chunk) for chunk in self._chunk_recipients(user_ids)))
+        return self._summarize_chunks(list(chunk_results))
+    
+    async def broadcast_message(
+        self,
+        messages: List[Dict],
+        notification_disabled: bool = False,
+        retry_key: Optional[str] = None
+    ) -> Dict:
+        """ブロードキャストメッセージを送信（友達追加した全員に送信）"""
+        payload = {
+            "messages": messages,
+            "notificationDisabled": notification_disabled
+        }
+        return await self._send_request(f"{self.BASE_URL}/message/broadcast", payload, retry_key)
+    
+    async def send_text(self, user_id: str, text: str, notification_disabled: bool = False) -> Dict:
+        """テキストメッセージを送信（簡易メソッド）"""
+        return await self.push_message(user_id, [self.create_text_message(text)], notification_disabled)
+    
+    async def send_multicast_text(self, user_ids: List[str], text: str, notification_disabled: bool = False) -> Dict:
+        """マルチキャストテキストメッセージを送信（簡易メソッド）"""
+        return await self.multicast_message(user_ids, [self.create_text_message(text)], notification_disabled)
+    
+    async def send_broadcast_text(self, text: str, notification_disabled: bool = False) -> Dict:
+        """ブロードキャストテキストメッセージを送信（簡易メソッド）"""
+        return await self.broadcast_message([self.create_text_message(text)], notification_disabled)
+    
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
 # 便利関数（既存コードとの互換性のため）
 def send_line_push(token: str, user_id: str, message: str) -> bool:
     """
@@ -494,10 +784,12 @@ if __name__ == "__main__":
                             user_ids.append(config["line_user_id"])
                     
                     if user_ids:
-                        # 複数ユーザーに送信
-                        for user_id in user_ids:
-                            api.send_text(user_id, message, notification_disabled=notification_disabled)
-                        print(f"✓ メッセージを送信しました{mode}（{len(user_ids)}人）: {message}")
+                        # 複数ユーザーに一括送信（マルチキャスト）
+                        result = api.send_multicast_text(user_ids, message, notification_disabled=notification_disabled)
+                        print(f"✓ メッセージを送信しました{mode}（成功 {result['success']}人, 失敗 {result['failed']}人）: {message}")
+                        for chunk in result["chunks"]:
+                            if not chunk["ok"]:
+                                print(f"  送信失敗（{chunk['recipients']}人）: {chunk['error']}")
                     else:
                         print("エラー: 送信先ユーザーIDが設定されていません")
                         print("以下のいずれかを設定してください:")
@@ -547,9 +839,8 @@ if __name__ == "__main__":
                         user_ids.append(config["line_user_id"])
                 
                 if user_ids:
-                    for user_id in user_ids:
-                        api.send_text(user_id, "これはテストメッセージです。")
-                    print(f"✓ 送信完了（{len(user_ids)}人）")
+                    result = api.send_multicast_text(user_ids, "これはテストメッセージです。")
+                    print(f"✓ 送信完了（成功 {result['success']}人, 失敗 {result['failed']}人）")
                 else:
                     print("エラー: 送信先ユーザーIDが設定されていません")
         except Exception as e:
@@ -0,0 +1,93 @@
+# live_watch.py
+"""
+ライブ監視（watch_mode: "live"）
+XHRで空席状況が更新されるページ向けに、ページ内にMutationObserverを注入し、
+selector配下の変化（またはtarget_datesを含むテキストの変化）をPythonへ通知する
+"""
+import json
+
+# Pythonへ通知するためのバインディング名（ページごとに登録）
+BINDING_NAME = "__ticketWatcherNotify"
+# 変化をまとめて通知するまでの待ち時間（ミリ秒）
+DEBOUNCE_MS = 50
+
+# 注入するスクリプト（ナビゲーションのたびに add_init_script で再注入される）
+_OBSERVER_JS = """
+(cfg => {
+    if (window.__ticketWatcherObserver) return;
+    const squash = s => (s || '').replace(/\\s+/g, ' ');
+    const dates = cfg.dates.map(squash).filter(d => d);
+    const relevantElement = el => {
+        if (!el || !cfg.selector) return false;
+        try {
+            return el.matches(cfg.selector) || !!el.closest(cfg.selector) || !!el.querySelector(cfg.selector);
+        } catch (e) {
+            return false;
+        }
+    };
+    const relevant = node => {
+        const el = node.nodeType === 1 ? node : node.parentElement;
+        if (relevantElement(el)) return true;
+        const text = squash(node.textContent);
+        return dates.some(d => text.includes(d));
+    };
+    const start = () => {
+        let pending = null;
+        const observer = new MutationObserver(records => {
+            if (pending) return;
+            for (const r of records) {
+                if (relevant(r.target) || [...r.addedNodes].some(relevant) || [...r.removedNodes].some(relevant)) {
+                    pending = setTimeout(() => {
+                        pending = null;
+                        window[cfg.binding](location.href);
+                    }, cfg.debounceMs);
+                    return;
+                }
+            }
+        });
+        observer.observe(document.body || document.documentElement, {
+            subtree: true,
+            childList: true,
+            characterData: true,
+            attributes: true,
+            attributeFilter: ['class', 'disabled', 'value', 'style'],
+        });
+        window.__ticketWatcherObserver = observer;
+    };
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', start);
+    } else {
+        start();
+    }
+})(%s)
+"""
+
+
+def build_observer_script(target_config):
+    """ターゲット設定から注入スクリプトを作成"""
+    cfg = {
+        "selector": target_config.get("selector", ""),
+        "dates": target_config.get("target_dates", []),
+        "binding": BINDING_NAME,
+        "debounceMs": DEBOUNCE_MS,
+    }
+    return _OBSERVER_JS % json.dumps(cfg, ensure_ascii=False)
+
+
+async def install_live_observer(page, target_config, on_change):
+    """ページにMutationObserverを注入
+
+    Args:
+        page: 監視対象のページ
+        target_config: ターゲット設定
+        on_change: DOM変化時に呼ばれるコールバック（引数: 変化したページのURL）
+    """
+    def _binding(source, href):
+        on_change(href)
+
+    script = build_observer_script(target_config)
+    await page.expose_binding(BINDING_NAME, _binding)
+    # 以降のリロード（安全のための定期リロード）でも自動で再注入される
+    await page.add_init_script(script)
+    # 現在表示中のドキュメントにも注入
+    await page.evaluate(script)
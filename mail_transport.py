@@ -0,0 +1,211 @@
+# mail_transport.py
+"""
+メール送信用の常駐SMTP接続
+送信のたびに名前解決・TLSハンドシェイク・ログインを行わず、認証済みの接続を使い回す。
+接続はNOOPで定期的に維持し、切断されていた場合は送信時に自動で再接続する
+"""
+import smtplib
+import socket
+import threading
+import time
+
+# 接続・コマンドのタイムアウト（秒）。接続は事前に確立するため、TLS+AUTHが終わる長さを取る
+DEFAULT_TIMEOUT_SEC = 10.0
+# 接続を維持するためのNOOPの間隔（秒）
+DEFAULT_KEEPALIVE_INTERVAL_SEC = 60
+# 名前解決結果（IPv4アドレス）のキャッシュ有効期間（秒）
+DEFAULT_DNS_TTL_SEC = 300
+
+
+class SMTPTransport:
+    """認証済みのSMTP接続を保持し、同じセッションで複数のメールを送信する
+
+    Args:
+        host: SMTPサーバーのホスト名
+        port: ポート番号
+        user: ログインユーザー（空の場合はログインしない）
+        password: パスワード
+        use_ssl: SMTP_SSL で接続するか（False の場合は平文SMTP、ローカルの検証用サーバー向け）
+        starttls: 平文接続後に STARTTLS するか（use_ssl=False の場合のみ）
+    """
+
+    def __init__(self, host, port, user=None, password=None, use_ssl=True, starttls=False,
+                 timeout=DEFAULT_TIMEOUT_SEC, dns_ttl=DEFAULT_DNS_TTL_SEC):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.use_ssl = use_ssl
+        self.starttls = starttls
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self._conn = None
+        self._lock = threading.Lock()
+        self._addr = None
+        self._addr_expires = 0.0
+        self._keepalive_thread = None
+        self._closed = False
+        # 送信統計（接続を再利用できたか）
+        self.stats = {"sent": 0, "reused": 0, "connects": 0, "reconnects": 0}
+
+    def _resolve(self):
+        """IPv4アドレスを取得（TTLの間はキャッシュを使う）"""
+        now = time.monotonic()
+        if self._addr is None or now >= self._addr_expires:
+            addrinfo = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)
+            self._addr = addrinfo[0][4][0]
+            self._addr_expires = now + self.dns_ttl
+        return self._addr
+
+    def _connect(self):
+        addr = self._resolve()
+        try:
+            if self.use_ssl:
+                conn = smtplib.SMTP_SSL(addr, self.port, local_hostname="localhost", timeout=self.timeout)
+            else:
+                conn = smtplib.SMTP(addr, self.port, local_hostname="localhost", timeout=self.timeout)
+                if self.starttls:
+                    conn.starttls()
+                    conn.ehlo()
+        except OSError:
+            # 接続できない場合は古いアドレスの可能性があるため、次回は名前解決し直す
+            self._addr = None
+            raise
+        conn.set_debuglevel(0)
+        if self.user and self.password:
+            try:
+                conn.login(self.user, self.password)
+            except Exception:
+                self._close_conn(conn)
+                raise
+        self.stats["connects"] += 1
+        return conn
+
+    @staticmethod
+    def _close_conn(conn):
+        try:
+            conn.quit()
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def connect(self):
+        """接続を事前に確立（確立済みの場合は何もしない）"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = self._connect()
+
+    def send(self, msg):
+        """メールを送信（切断されていた場合は1回だけ再接続して送り直す）
+
+        Returns:
+            既存の接続を再利用できた場合True
+        """
+        return self.send_many([msg])[0]
+
+    def send_many(self, msgs):
+        """複数のメールを同じセッションで送信
+
+        Returns:
+            メールごとに、既存の接続を再利用できたか（True/False）のリスト
+        """
+        results = []
+        with self._lock:
+            for msg in msgs:
+                reused = self._conn is not None
+                if self._conn is None:
+                    self._conn = self._connect()
+                try:
+                    self._conn.send_message(msg)
+                except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+                    # サーバーの応答による失敗（接続は生きているため保持する）
+                    raise
+                except OSError:
+                    # 切断・タイムアウト（smtplib の例外も含む）
+                    self._drop()
+                    if not reused:
+                        raise
+                    # 保持していた接続が切れていた: 再接続して送り直す
+                    self.stats["reconnects"] += 1
+                    self._conn = self._connect()
+                    reused = False
+                    self._conn.send_message(msg)
+                self.stats["sent"] += 1
+                if reused:
+                    self.stats["reused"] += 1
+                results.append(reused)
+        return results
+
+    def _drop(self):
+        if self._conn is not None:
+            self._close_conn(self._conn)
+            self._conn = None
+
+    def noop(self):
+        """NOOPで接続を維持（切断されていた場合は再接続）"""
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                    return
+                code, _ = self._conn.noop()
+                if code != 250:
+                    raise smtplib.SMTPServerDisconnected(f"NOOP応答: {code}")
+            except Exception as e:
+                self._drop()
+                print(f"SMTP接続の維持に失敗（次回送信時に再接続）: {e}")
+
+    def start_keepalive(self, interval=DEFAULT_KEEPALIVE_INTERVAL_SEC):
+        """接続の事前確立と定期的なNOOPをバックグラウンドで開始（1回のみ）"""
+        with self._lock:
+            if self._keepalive_thread is not None:
+                return
+
+            def _run():
+                self.noop()
+                while not self._closed:
+                    time.sleep(interval)
+                    self.noop()
+
+            self._keepalive_thread = threading.Thread(target=_run, daemon=True, name="smtp-keepalive")
+            self._keepalive_thread.start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._drop()
+
+
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(cfg):
+    """設定に対応する共有の SMTPTransport を取得（初回のみ作成）"""
+    key = (cfg["smtp_host"], cfg["smtp_port"], cfg.get("smtp_user"), cfg.get("smtp_ssl", True))
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = SMTPTransport(
+                cfg["smtp_host"],
+                cfg["smtp_port"],
+                cfg.get("smtp_user"),
+                cfg.get("smtp_password"),
+                use_ssl=cfg.get("smtp_ssl", True),
+                starttls=cfg.get("smtp_starttls", False),
+                timeout=cfg.get("smtp_timeout_sec", DEFAULT_TIMEOUT_SEC),
+                dns_ttl=cfg.get("smtp_dns_ttl_sec", DEFAULT_DNS_TTL_SEC),
+            )
+            _transports[key] = transport
+    return transport
+
+
+def start_keepalive(cfg):
+    """メール設定がある場合に接続の事前確立と維持を開始"""
+    if not cfg.get("smtp_host") or not cfg.get("mail_to"):
+        return
+    get_transport(cfg).start_keepalive(cfg.get("smtp_keepalive_interval_sec", DEFAULT_KEEPALIVE_INTERVAL_SEC))
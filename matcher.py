@@ -0,0 +1,146 @@
+# matcher.py
+"""
+検知条件（target_dates / detect_text / detail_seat_types）の照合
+ターゲット設定の読み込み時に1回だけ正規化・コンパイルし、
+ブロックごとの照合では日付数・席種パターン数に比例したループを回さない
+"""
+import unicodedata
+
+# 全角英数字・記号（U+FF01〜U+FF5E）を半角に変換する変換表
+_WIDTH_TABLE = str.maketrans({
+    chr(code): unicodedata.normalize('NFKC', chr(code)) for code in range(0xFF01, 0xFF5F)
+})
+
+
+def normalize_alphabet(s):
+    """全角英数字を半角に変換"""
+    if not s:
+        return s
+    return s.translate(_WIDTH_TABLE)
+
+
+def normalize_match_text(s):
+    """照合用の正規化（全角英数字を半角に変換し、空白を1つにまとめる）"""
+    if not s:
+        return ""
+    return ' '.join(s.translate(_WIDTH_TABLE).split())
+
+
+class AhoCorasick:
+    """複数パターンの同時検索（Aho-Corasick法）
+
+    テキストを1回走査するだけで、すべてのパターンの出現位置を求める。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        # goto[state]: {文字: 次の状態}, outputs[state]: この状態で一致するパターン番号
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        self._empty = [i for i, p in enumerate(self.patterns) if not p]
+        for i, pattern in enumerate(self.patterns):
+            if pattern:
+                self._add(pattern, i)
+        self._build()
+
+    def _add(self, pattern, index):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = nxt
+        self._outputs[state].append(index)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail_to = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fail_to if fail_to != nxt else 0
+                self._outputs[nxt] = self._outputs[nxt] + self._outputs[self._fail[nxt]]
+
+    def find_first(self, text):
+        """一致したパターンのうち、パターン番号が最も小さいものを返す
+
+        Returns:
+            (パターン番号, テキスト内の開始位置)。一致しない場合は (None, -1)
+        """
+        best, best_pos = None, -1
+        if self._empty:
+            # 空のパターンはどのテキストにも位置0で一致する（それより番号の小さいパターンの一致を優先する）
+            best, best_pos = self._empty[0], 0
+            if best == 0:
+                return best, best_pos
+        goto, fail, outputs, patterns = self._goto, self._fail, self._outputs, self.patterns
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for index in outputs[state]:
+                if best is None or index < best:
+                    best, best_pos = index, pos - len(patterns[index]) + 1
+                    if best == 0:
+                        # 最優先のパターンが見つかったので打ち切り
+                        return best, best_pos
+        return best, best_pos
+
+
+class TargetMatcher:
+    """ターゲット1件分のコンパイル済み検知条件"""
+
+    def __init__(self, target_config):
+        self.target_dates = list(target_config.get("target_dates", []))
+        self.detect_text = target_config.get("detect_text", "")
+        self.seat_types = list(target_config.get("detail_seat_types", []))
+
+        self.normalized_dates = [normalize_match_text(td) for td in self.target_dates]
+        self._date_automaton = AhoCorasick(self.normalized_dates)
+        self.normalized_detect = normalize_match_text(self.detect_text)
+
+        self.normalized_seat_types = [normalize_alphabet(p) for p in self.seat_types]
+        self._seat_automaton = AhoCorasick(self.normalized_seat_types)
+        # 「席種がパターンに含まれる」判定用（パターンに現れない区切り文字で連結）
+        self._seat_joined = "\0".join(self.normalized_seat_types)
+
+    def match_date(self, normalized_text):
+        """ブロックのテキストに含まれる target_dates を探す（設定の並び順で最初のもの）
+
+        Returns:
+            (一致した日付（設定値のまま）, 正規化済みの日付, テキスト内の位置)。一致しない場合は (None, "", -1)
+        """
+        index, pos = self._date_automaton.find_first(normalized_text)
+        if index is None:
+            return None, "", -1
+        return self.target_dates[index], self.normalized_dates[index], pos
+
+    def match_seat(self, seat_type):
+        """席種が detail_seat_types のいずれかに一致するか（部分一致、全角・半角を区別しない）
+
+        Returns:
+            一致したパターン（設定値のまま）。一致しない場合は None
+        """
+        normalized_seat_type = normalize_alphabet(seat_type)
+        # パターンが席種に含まれる（「Ｓ席」で「注釈付きＳ席」も検知）
+        index, _ = self._seat_automaton.find_first(normalized_seat_type)
+        if index is not None:
+            return self.seat_types[index]
+        # 席種がパターンに含まれる
+        if normalized_seat_type and "\0" not in normalized_seat_type:
+            pos = self._seat_joined.find(normalized_seat_type)
+            if pos >= 0:
+                return self.seat_types[self._seat_joined.count("\0", 0, pos)]
+        return None
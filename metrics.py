@@ -0,0 +1,205 @@
+# metrics.py
+"""
+監視のメトリクス（カウンター・ヒストグラム）
+watcher がプロセス内で集計し、Prometheus のテキスト形式でファイルに書き出す。
+controller.py は書き出されたファイルを /metrics で返す（watcher は別プロセスのため）。
+シャード（--shards）で起動した場合は各ワーカーが別ファイルに書き出し、controller.py がまとめて返す
+"""
+import glob
+import os
+import threading
+from pathlib import Path
+
+DEFAULT_METRICS_PATH = "logs/metrics.prom"
+# メトリクスを書き出す間隔（秒）
+DEFAULT_WRITE_INTERVAL_SEC = 5
+# ヒストグラムのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# メトリクス名と説明（HELP行）
+HELP = {
+    "ticket_watcher_phase_seconds": "チェックの各段階の処理時間（load, http_fetch, wait_selector, extract, match, check）",
+    "ticket_watcher_poll_jitter_seconds": "予定したチェック開始時刻からの遅れ（ポーリング間隔のずれ）",
+    "ticket_watcher_checks_total": "チェック回数（result: detected, not_detected, timeout, error）",
+    "ticket_watcher_redirects_total": "アクセス過多ページなどへのリダイレクト回数",
+    "ticket_watcher_fallback_total": "セレクタが見つからずキーワード検索にフォールバックした回数",
+    "ticket_watcher_notification_latency_seconds": "検知から通知の送信完了までの時間",
+    "ticket_watcher_notifications_total": "通知の結果（result: delivered, failed, dropped）",
+    "ticket_watcher_notification_retries_total": "通知の再送回数",
+    "ticket_watcher_blocked_requests_total": "block_resources で中断したリクエスト数（resource_type 別）",
+    "ticket_watcher_blocked_bytes_estimate_total": "block_resources で中断したリクエストの推定バイト数（リソースタイプ別の概算）",
+}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """ラベル付きのカウンターとヒストグラム（スレッドセーフ）"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # すべての系列に付けるラベル（シャードのワーカーでは shard）
+        self.const_labels = {}
+        self._lock = threading.Lock()
+        # key: (メトリクス名, ラベルのタプル)
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ヒストグラムに値（秒）を追加"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(self.buckets)
+            hist.observe(value)
+
+    def render(self):
+        """Prometheus のテキスト形式で出力"""
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        const = tuple(sorted((k, str(v)) for k, v in self.const_labels.items()))
+        counters = [((name, const + labels), value) for (name, labels), value in counters]
+        histograms = [((name, const + labels), value) for (name, labels), value in histograms]
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for upper, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(upper)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path=DEFAULT_METRICS_PATH):
+        """ファイルに書き出す（一時ファイルに書いてから置き換え、読み手が途中の内容を見ないようにする）"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def shard_path(path, index):
+    """シャードのワーカーが書き出すファイルのパス（例: logs/metrics.shard0.prom）"""
+    path = Path(path)
+    return path.with_name(f"{path.stem}.shard{index}{path.suffix}")
+
+
+def merge_texts(texts):
+    """複数のテキスト形式の出力を1つにまとめる（同じメトリクスの HELP / TYPE は1回だけ出力）
+
+    Prometheus のテキスト形式では、同じメトリクスの系列を連続して並べる必要があるため、
+    メトリクス名ごとに系列を集めてから出力する
+    """
+    families = {}
+    order = []
+    current = None
+    for text in texts:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("# "):
+                parts = line.split(" ", 3)
+                if len(parts) < 3 or parts[1] not in ("HELP", "TYPE"):
+                    continue
+                current = parts[2]
+                if current not in families:
+                    families[current] = {"HELP": None, "TYPE": None, "samples": []}
+                    order.append(current)
+                families[current][parts[1]] = families[current][parts[1]] or line
+                continue
+            if current is None:
+                continue
+            families[current]["samples"].append(line)
+    lines = []
+    for name in order:
+        family = families[name]
+        lines.extend(l for l in (family["HELP"], family["TYPE"]) if l)
+        lines.extend(family["samples"])
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def shard_paths(path):
+    """書き出し済みのシャードのファイル"""
+    path = Path(path)
+    pattern = path.with_name(f"{glob.escape(path.stem)}.shard*{glob.escape(path.suffix)}")
+    return sorted(Path(p) for p in glob.glob(str(pattern)))
+
+
+def read_merged(path=DEFAULT_METRICS_PATH):
+    """書き出されたファイル（シャードのファイルを含む）を読み込んでまとめる"""
+    texts = []
+    for p in [Path(path)] + shard_paths(path):
+        try:
+            texts.append(p.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            continue
+    return merge_texts(texts)
+
+
+# プロセス共通のレジストリ
+REGISTRY = MetricsRegistry()
+
+
+def inc(name, value=1, **labels):
+    REGISTRY.inc(name, value, **labels)
+
+
+def observe(name, value, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+def observe_ms(name, value_ms, **labels):
+    """ミリ秒の値を秒に換算して記録"""
+    REGISTRY.observe(name, value_ms / 1000.0, **labels)
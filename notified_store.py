@@ -0,0 +1,186 @@
+# notified_store.py
+"""
+通知済み状態の永続化（SQLite）
+通知済みキーと各ターゲットの前回の検知状態をファイルに保存し、
+再起動（/stop → /start やクラッシュ）後も同じ枠を再通知しないようにする。
+キーは blake2b の固定長ハッシュで保持し、期限切れ（TTL）のキーは自動で削除する
+"""
+import hashlib
+import sqlite3
+import time
+
+DEFAULT_DB_PATH = "notified_state.db"
+# 通知済みキーを保持する期間（秒）。これより古いキーは削除され、再検知で再通知される
+DEFAULT_TTL_SEC = 7 * 24 * 3600
+# 期限切れキーを削除する間隔（秒）
+EVICT_INTERVAL_SEC = 3600
+# ハッシュの長さ（バイト）
+KEY_DIGEST_SIZE = 16
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notified (
+    key BLOB PRIMARY KEY,
+    target BLOB NOT NULL,
+    notified_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS notified_target ON notified (target);
+CREATE TABLE IF NOT EXISTS detection_state (
+    target BLOB PRIMARY KEY,
+    detected INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def hash_key(value):
+    """文字列（またはタプル）を固定長のハッシュに変換"""
+    if isinstance(value, tuple):
+        value = "||".join(str(v) for v in value)
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=KEY_DIGEST_SIZE).digest()
+
+
+class NotifiedStore:
+    """通知済みキーと検知状態のストア
+
+    参照はメモリ上の辞書で行い、更新時のみSQLiteに書き込む（起動時に一括で読み込む）。
+    watcher のイベントループ（単一スレッド）から使う前提で、ロックは持たない。
+
+    Args:
+        path: SQLiteファイルのパス（":memory:" で永続化しない）
+        ttl_sec: 通知済みキーを保持する期間（秒）
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, ttl_sec=DEFAULT_TTL_SEC):
+        self.path = path
+        self.ttl_sec = ttl_sec
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        # key: ハッシュ, value: (ターゲットのハッシュ, 通知時刻)
+        self._notified = {}
+        # key: ターゲットのハッシュ, value: set(キーのハッシュ)
+        self._by_target = {}
+        # key: ターゲットのハッシュ, value: True（検知中のターゲットのみ保持）
+        self._states = {}
+        self._last_evict = 0.0
+        self._load()
+
+    def _load(self):
+        self.evict_expired()
+        for key, target, notified_at in self._db.execute("SELECT key, target, notified_at FROM notified"):
+            self._notified[key] = (target, notified_at)
+            self._by_target.setdefault(target, set()).add(key)
+        for (target,) in self._db.execute("SELECT target FROM detection_state WHERE detected = 1"):
+            self._states[target] = True
+
+    def __len__(self):
+        return len(self._notified)
+
+    def contains(self, notify_key):
+        """通知済みか（期限切れのキーは未通知として扱う）"""
+        entry = self._notified.get(hash_key(notify_key))
+        return entry is not None and time.time() - entry[1] < self.ttl_sec
+
+    def add(self, target_key, notify_key):
+        """通知済みとして記録
+
+        Args:
+            target_key: ターゲット（(target_name, url)）
+            notify_key: 通知キー
+        """
+        now = time.time()
+        key, target = hash_key(notify_key), hash_key(target_key)
+        self._notified[key] = (target, now)
+        self._by_target.setdefault(target, set()).add(key)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO notified (key, target, notified_at) VALUES (?, ?, ?)",
+                (key, target, now),
+            )
+        if now - self._last_evict >= EVICT_INTERVAL_SEC:
+            self.evict_expired()
+
+    def invalidate_target(self, target_key):
+        """ターゲットの通知済みキーをすべて解除（検知が消えた場合、再出現で再通知できるようにする）
+
+        Returns:
+            解除したキーの数
+        """
+        target = hash_key(target_key)
+        keys = self._by_target.pop(target, set())
+        for key in keys:
+            self._notified.pop(key, None)
+        if keys:
+            with self._db:
+                self._db.execute("DELETE FROM notified WHERE target = ?", (target,))
+        return len(keys)
+
+    def get_state(self, target_key):
+        """前回の検知状態（記録がない場合False）"""
+        return self._states.get(hash_key(target_key), False)
+
+    def set_state(self, target_key, detected):
+        """検知状態を記録（未検知は記録なしと同じため、行を削除して表を小さく保つ）"""
+        target = hash_key(target_key)
+        if self._states.get(target, False) == bool(detected):
+            return
+        with self._db:
+            if detected:
+                self._states[target] = True
+                self._db.execute(
+                    "INSERT OR REPLACE INTO detection_state (target, detected, updated_at) VALUES (?, 1, ?)",
+                    (target, time.time()),
+                )
+            else:
+                self._states.pop(target, None)
+                self._db.execute("DELETE FROM detection_state WHERE target = ?", (target,))
+
+    def snapshot(self, target_keys):
+        """指定したターゲットの通知済みキーと検知状態（シャードのワーカーに渡す、ハッシュのまま）"""
+        targets = {hash_key(target_key) for target_key in target_keys}
+        return {
+            "notified": [(key, target, at) for key, (target, at) in self._notified.items() if target in targets],
+            "states": [target for target in self._states if target in targets],
+        }
+
+    def restore(self, snapshot):
+        """snapshot() の内容を読み込む"""
+        with self._db:
+            for key, target, notified_at in snapshot["notified"]:
+                self._notified[key] = (target, notified_at)
+                self._by_target.setdefault(target, set()).add(key)
+                self._db.execute(
+                    "INSERT OR REPLACE INTO notified (key, target, notified_at) VALUES (?, ?, ?)",
+                    (key, target, notified_at),
+                )
+            for target in snapshot["states"]:
+                self._states[target] = True
+                self._db.execute(
+                    "INSERT OR REPLACE INTO detection_state (target, detected, updated_at) VALUES (?, 1, ?)",
+                    (target, time.time()),
+                )
+
+    def evict_expired(self):
+        """期限切れの通知済みキーを削除
+
+        Returns:
+            削除したキーの数
+        """
+        now = time.time()
+        cutoff = now - self.ttl_sec
+        self._last_evict = now
+        expired = [key for key, (_, notified_at) in self._notified.items() if notified_at <= cutoff]
+        for key in expired:
+            target, _ = self._notified.pop(key)
+            keys = self._by_target.get(target)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_target[target]
+        with self._db:
+            cursor = self._db.execute("DELETE FROM notified WHERE notified_at <= ?", (cutoff,))
+        return max(len(expired), cursor.rowcount)
+
+    def close(self):
+        self._db.close()
@@ -1,17 +1,23 @@
 # notifier.py
-import socket
 import smtplib
 from email.mime.text import MIMEText
 from email.utils import formatdate
-import requests
-import threading
+import asyncio
+import time
+import uuid
+import line_http
+import mail_transport
+from dispatcher import (
+    get_dispatcher, backoff_delay, PRIORITY_PUSH, PRIORITY_MAIL,
+    DEFAULT_MAX_RETRIES, DEFAULT_DRAIN_TIMEOUT_SEC,
+)
+from line_push_api import LinePushAPI, AsyncLinePushAPI, LineAPIError, httpx
 
 # タイムアウト（秒）
 # ※ 短くしすぎると失敗率が上がります
 LINE_HTTP_TIMEOUT_SEC = 0.3
-SMTP_TIMEOUT_SEC = 1.0
 
-def send_line_push(token, user_id, message, notification_disabled=False):
+def send_line_push(token, user_id, message, notification_disabled=False, base_url=None):
     """
     単一ユーザーにLINEプッシュメッセージを送信
     
@@ -20,8 +26,9 @@ def send_line_push(token, user_id, message, notification_disabled=False):
         user_id: ユーザーID（文字列）
         message: メッセージテキスト
         notification_disabled: 通知を無効にするかどうか（サイレント通知）
+        base_url: APIのベースURL（省略時は https://api.line.me）
     """
-    url = "https://api.line.me/v2/bot/message/push"
+    url = f"{base_url or line_http.LINE_API_BASE_URL}/v2/bot/message/push"
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
     payload = {
         "to": user_id,
@@ -29,44 +36,44 @@ def send_line_push(token, user_id, message, notification_disabled=False):
         "notificationDisabled": notification_disabled
     }
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=LINE_HTTP_TIMEOUT_SEC)
+        r, reused = line_http.post(url, headers, payload, LINE_HTTP_TIMEOUT_SEC)
         if r.status_code == 200:
             mode = "（サイレント）" if notification_disabled else ""
-            print(f"LINE通知送信成功{mode} (ユーザーID: {user_id})")
+            print(f"LINE通知送信成功{mode}{line_http.reuse_label(reused)} (ユーザーID: {user_id})")
         else:
             print(f"LINE通知失敗 (ユーザーID: {user_id}):", r.status_code, r.text)
     except Exception as e:
         print(f"LINE送信例外 (ユーザーID: {user_id}):", e)
 
-def send_line_push_to_all(token, user_ids, message, notification_disabled=False):
+def send_line_push_to_all(token, user_ids, message, notification_disabled=False, base_url=None):
     """
-    複数のユーザーにLINEプッシュメッセージを送信
+    複数のユーザーにLINEメッセージを送信（マルチキャスト）
     
     Args:
         token: LINE Channel Access Token
         user_ids: ユーザーIDのリスト
         message: メッセージテキスト
         notification_disabled: 通知を無効にするかどうか（サイレント通知）
+        base_url: APIのベースURL（省略時は https://api.line.me）
+        
+    Returns:
+        送信結果（LinePushAPI.multicast_message を参照）。送信先がない場合は None
     """
     if not user_ids:
         print("送信先ユーザーIDが指定されていません")
         return
     
-    success_count = 0
-    fail_count = 0
-    
-    for user_id in user_ids:
-        try:
-            send_line_push(token, user_id, message, notification_disabled=notification_disabled)
-            success_count += 1
-        except Exception as e:
-            print(f"ユーザー {user_id} への送信失敗: {e}")
-            fail_count += 1
+    # マルチキャストで一括送信（500人ごとに分割し、並列に送信）
+    result = LinePushAPI(token, base_url=base_url).send_multicast_text(user_ids, message, notification_disabled=notification_disabled)
+    for chunk in result["chunks"]:
+        if not chunk["ok"]:
+            print(f"LINEマルチキャスト送信失敗（{chunk['recipients']}人）: {chunk['error']}")
     
     mode = "（サイレント）" if notification_disabled else ""
-    print(f"LINE通知送信完了{mode}: 成功 {success_count}件, 失敗 {fail_count}件 (合計 {len(user_ids)}件)")
+    print(f"LINE通知送信完了{mode}: 成功 {result['success']}件, 失敗 {result['failed']}件 (合計 {result['success'] + result['failed']}件)")
+    return result
 
-def send_line_broadcast(token, message, notification_disabled=False):
+def send_line_broadcast(token, message, notification_disabled=False, base_url=None):
     """
     友達追加した全員にLINEブロードキャストメッセージを送信
     （ユーザーIDの管理が不要で、友達追加した全員に自動送信）
@@ -75,24 +82,39 @@ def send_line_broadcast(token, message, notification_disabled=False):
         token: LINE Channel Access Token
         message: メッセージテキスト
         notification_disabled: 通知を無効にするかどうか（サイレント通知）
+        base_url: APIのベースURL（省略時は https://api.line.me）
     """
-    url = "https://api.line.me/v2/bot/message/broadcast"
+    url = f"{base_url or line_http.LINE_API_BASE_URL}/v2/bot/message/broadcast"
     headers = {"Content-Type": "application/json", "Authorization": f"Bearer {token}"}
     payload = {
         "messages": [{"type": "text", "text": message}],
         "notificationDisabled": notification_disabled
     }
     try:
-        r = requests.post(url, headers=headers, json=payload, timeout=LINE_HTTP_TIMEOUT_SEC)
+        r, reused = line_http.post(url, headers, payload, LINE_HTTP_TIMEOUT_SEC)
         if r.status_code == 200:
             mode = "（サイレント）" if notification_disabled else ""
-            print(f"LINEブロードキャスト送信成功{mode}（友達追加した全員に送信）")
+            print(f"LINEブロードキャスト送信成功{mode}（友達追加した全員に送信）{line_http.reuse_label(reused)}")
         else:
             print(f"LINEブロードキャスト送信失敗: {r.status_code}, {r.text}")
     except Exception as e:
         print(f"LINEブロードキャスト送信例外: {e}")
 
-def send_mail_ipv4(cfg, subject, body):
+class MailDeliveryError(Exception):
+    """メール送信の失敗（retryable: 一時的なエラーで再送すべきか）"""
+    
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = None
+
+def deliver_mail(cfg, subject, body):
+    """
+    メールを送信（失敗時は MailDeliveryError を送出）
+    
+    Raises:
+        MailDeliveryError: 送信に失敗した場合（4xx応答・切断・タイムアウトは retryable=True）
+    """
     msg = MIMEText(body, "plain", "utf-8")
     msg["Subject"] = subject
     msg["From"] = cfg["smtp_user"]
@@ -100,66 +122,254 @@ def send_mail_ipv4(cfg, subject, body):
     msg["Date"] = formatdate()
 
     try:
-        addrinfo = socket.getaddrinfo(cfg["smtp_host"], cfg["smtp_port"], socket.AF_INET, socket.SOCK_STREAM)
-        ipv4_addr = addrinfo[0][4][0]
-        with smtplib.SMTP_SSL(
-            ipv4_addr,
-            cfg["smtp_port"],
-            local_hostname="localhost",
-            timeout=SMTP_TIMEOUT_SEC,
-        ) as s:
-            s.set_debuglevel(0)
-            s.login(cfg["smtp_user"], cfg["smtp_password"])
-            s.send_message(msg)
-        print("メール送信成功")
+        # 常駐する認証済みの接続で送信（名前解決・TLS・ログインを省く）
+        reused = mail_transport.get_transport(cfg).send(msg)
+        print(f"メール送信成功{line_http.reuse_label(reused)}")
+    except smtplib.SMTPResponseException as e:
+        raise MailDeliveryError(f"{e.smtp_code} {e.smtp_error!r}", retryable=400 <= e.smtp_code < 500) from e
+    except smtplib.SMTPRecipientsRefused as e:
+        codes = [code for code, _ in e.recipients.values()]
+        raise MailDeliveryError(str(e), retryable=all(400 <= c < 500 for c in codes)) from e
+    except smtplib.SMTPServerDisconnected as e:
+        raise MailDeliveryError(str(e), retryable=True) from e
+    except smtplib.SMTPException as e:
+        raise MailDeliveryError(str(e)) from e
+    except OSError as e:
+        # タイムアウト・接続拒否・名前解決失敗などの通信エラー
+        raise MailDeliveryError(str(e), retryable=True) from e
+
+def send_mail_ipv4(cfg, subject, body):
+    try:
+        deliver_mail(cfg, subject, body)
     except Exception as e:
         print("メール送信失敗:", e)
 
-def send_notifications_async(cfg, message, target_name, use_broadcast=False):
+def get_line_user_ids(cfg):
+    """設定から送信先のLINEユーザーIDを取得（line_user_ids と line_user_id をまとめる）"""
+    user_ids = []
+    if "line_user_ids" in cfg and isinstance(cfg["line_user_ids"], list):
+        user_ids = list(cfg["line_user_ids"])
+    if "line_user_id" in cfg and cfg["line_user_id"]:
+        if cfg["line_user_id"] not in user_ids:
+            user_ids.append(cfg["line_user_id"])
+    return user_ids
+
+class _LineDelivery:
+    """
+    LINE送信ジョブ（ディスパッチャーのスレッドでは __call__、イベントループでは run_async で実行）
+    再送時は前回失敗した送信先だけに送り直す。再送キーを付けるため、
+    タイムアウトした送信が実際には届いていた場合も重複して届かない
+    """
+    
+    def __init__(self, cfg, message, use_broadcast, user_ids=None):
+        self.token = cfg["line_channel_access_token"]
+        self.base_url = cfg.get("line_api_base_url")
+        self.notification_disabled = cfg.get("notification_disabled", False)
+        self.message = message
+        self.use_broadcast = use_broadcast
+        self.retry_key = str(uuid.uuid4())
+        self.pending_user_ids = None if use_broadcast else list(user_ids or get_line_user_ids(cfg))
+    
+    @property
+    def mode(self):
+        return "（サイレント）" if self.notification_disabled else ""
+    
+    def __call__(self):
+        api = LinePushAPI(self.token, base_url=self.base_url)
+        text = api.create_text_message(self.message)
+        if self.use_broadcast:
+            api.broadcast_message([text], self.notification_disabled, retry_key=self.retry_key)
+            print(f"LINEブロードキャスト送信成功{self.mode}（友達追加した全員に送信）{line_http.reuse_label(api.last_reused)}")
+            return
+        if not self.pending_user_ids:
+            return
+        result = api.multicast_message(
+            self.pending_user_ids, [text], self.notification_disabled, retry_key=self.retry_key
+        )
+        self._finish_multicast(result)
+    
+    async def run_async(self, api):
+        """AsyncLinePushAPI で送信（失敗時は LineAPIError を送出）"""
+        text = api.create_text_message(self.message)
+        if self.use_broadcast:
+            await api.broadcast_message([text], self.notification_disabled, retry_key=self.retry_key)
+            print(f"LINEブロードキャスト送信成功{self.mode}（友達追加した全員に送信）")
+            return
+        if not self.pending_user_ids:
+            return
+        result = await api.multicast_message(
+            self.pending_user_ids, [text], self.notification_disabled, retry_key=self.retry_key
+        )
+        self._finish_multicast(result)
+    
+    def _finish_multicast(self, result):
+        failed = [chunk for chunk in result["chunks"] if not chunk["ok"]]
+        print(f"LINE通知送信完了{self.mode}: 成功 {result['success']}件, 失敗 {result['failed']}件")
+        if not failed:
+            self.pending_user_ids = []
+            return
+        # 再送できない失敗（4xx）の送信先は諦め、再送できるものだけ残す
+        retryable = [chunk for chunk in failed if chunk["error"].retryable]
+        self.pending_user_ids = [uid for chunk in retryable for uid in chunk["user_ids"]]
+        error = (retryable or failed)[0]["error"]
+        retry_afters = [c["error"].retry_after for c in retryable if c["error"].retry_after is not None]
+        raise LineAPIError(
+            f"{result['failed']}件の送信に失敗: {error}",
+            error.status_code,
+            max(retry_afters) if retry_afters else None,
+        )
+
+class AsyncLineSender:
+    """
+    イベントループ上でLINE通知を送信（watcher用）
+    送信はタスクとしてスケジュールし、検知処理は送信完了を待たない。
+    同時送信数は AsyncLinePushAPI のセマフォで制限し、一時的な失敗は指数バックオフで再送する
+    """
+    
+    def __init__(self, cfg):
+        self.api = AsyncLinePushAPI(
+            cfg["line_channel_access_token"],
+            max_concurrency=cfg.get("line_max_concurrency", AsyncLinePushAPI.DEFAULT_MAX_CONCURRENCY),
+            base_url=cfg.get("line_api_base_url"),
+        )
+        self.max_retries = cfg.get("notify_max_retries", DEFAULT_MAX_RETRIES)
+        self.loop = asyncio.get_running_loop()
+        self._tasks = set()
+        self._keepalive_task = None
+    
+    def schedule(self, job, target_name, created_at):
+        """送信タスクを作成（完了は待たない）"""
+        task = self.loop.create_task(self._deliver(job, target_name, created_at))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+    
+    async def _deliver(self, job, target_name, created_at):
+        started_at = time.monotonic()
+        attempt = 0
+        delivered = False
+        try:
+            while True:
+                try:
+                    await job.run_async(self.api)
+                    delivered = True
+                    break
+                except LineAPIError as e:
+                    if not e.retryable or attempt >= self.max_retries:
+                        print(f"[{target_name}] line送信失敗: {e}")
+                        break
+                    delay = backoff_delay(attempt, e.retry_after)
+                    attempt += 1
+                    print(f"[{target_name}] line送信失敗、{delay:.1f}s後に再送します（{attempt}/{self.max_retries}）: {e}")
+                    await asyncio.sleep(delay)
+        finally:
+            get_dispatcher().record_result("line", created_at, started_at, delivered, attempt, label=target_name)
+    
+    def start_keepalive(self, interval=line_http.KEEPALIVE_INTERVAL_SEC, connections=2):
+        """接続の事前確立と定期的な疎通確認をタスクとして開始"""
+        async def _run():
+            await self.api.warm_up(connections)
+            while True:
+                await asyncio.sleep(interval)
+                await self.api.warm_up(1)
+        
+        if self._keepalive_task is None:
+            self._keepalive_task = self.loop.create_task(_run())
+    
+    async def aclose(self, timeout=DEFAULT_DRAIN_TIMEOUT_SEC):
+        """送信中の通知を待ってから（timeout 秒で打ち切り）接続を閉じる"""
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        if self._tasks:
+            print(f"未送信のLINE通知を送信しています（{len(self._tasks)}件）...")
+            _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                print(f"LINE通知の送信待ちがタイムアウトしました（残り{len(pending)}件）")
+                await asyncio.gather(*pending, return_exceptions=True)
+        await self.api.aclose()
+
+_async_line_sender = None
+
+def start_async_line_sender(cfg):
+    """実行中のイベントループにLINE送信を登録（以降の send_notifications_async はループ上で送信）"""
+    global _async_line_sender
+    if not cfg.get("line_channel_access_token") or not cfg.get("line_async", True) or httpx is None:
+        return None
+    _async_line_sender = AsyncLineSender(cfg)
+    return _async_line_sender
+
+async def close_async_line_sender():
+    global _async_line_sender
+    sender, _async_line_sender = _async_line_sender, None
+    if sender:
+        await sender.aclose()
+
+def _running_line_sender():
+    """現在のスレッドで実行中のイベントループに登録された AsyncLineSender（なければNone）"""
+    if _async_line_sender is None:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    return _async_line_sender if _async_line_sender.loop is loop else None
+
+def send_notifications_async(cfg, message, target_name, use_broadcast=False, created_at=None):
     """
-    通知を非同期で送信（LINEとメールを並列実行）
+    通知を非同期で送信（完了は待たない）
+    LINE通知は start_async_line_sender で登録したイベントループ上で送信する（未登録の場合は
+    ディスパッチャーでメールより優先して送信）。一時的な失敗は指数バックオフで再送する
     
     Args:
         cfg: 設定辞書
         message: メッセージテキスト
         target_name: ターゲット名
         use_broadcast: ブロードキャスト送信を使用するかどうか
+        created_at: 遅延の起点（time.monotonic()、省略時は現在時刻。別プロセスで検知した場合に指定）
     """
-    def send_line():
-        """LINE通知を送信（バックグラウンドスレッド）"""
-        try:
-            token = cfg["line_channel_access_token"]
-            notification_disabled = cfg.get("notification_disabled", False)
-            
-            if use_broadcast:
-                send_line_broadcast(token, message, notification_disabled)
-            else:
-                # 複数ユーザーIDに対応
-                user_ids = []
-                if "line_user_ids" in cfg and isinstance(cfg["line_user_ids"], list):
-                    user_ids = cfg["line_user_ids"]
-                if "line_user_id" in cfg and cfg["line_user_id"]:
-                    if cfg["line_user_id"] not in user_ids:
-                        user_ids.append(cfg["line_user_id"])
-                
-                if user_ids:
-                    send_line_push_to_all(token, user_ids, message, notification_disabled)
-        except Exception as e:
-            print(f"LINE通知送信エラー: {e}")
-    
-    def send_mail():
-        """メール通知を送信（バックグラウンドスレッド）"""
-        try:
-            send_mail_ipv4(cfg, f"チケット販売検知 [{target_name}]", message)
-        except Exception as e:
-            print(f"メール送信エラー: {e}")
+    dispatcher = get_dispatcher(cfg)
+    created_at = created_at or time.monotonic()
     
-    # LINE通知とメール送信を並列で実行
-    line_thread = threading.Thread(target=send_line, daemon=True)
-    mail_thread = threading.Thread(target=send_mail, daemon=True)
+    try:
+        line_job = _LineDelivery(cfg, message, use_broadcast)
+    except KeyError as e:
+        print(f"LINE通知送信エラー: 設定がありません {e}")
+    else:
+        if use_broadcast or line_job.pending_user_ids:
+            sender = _running_line_sender()
+            if sender:
+                # イベントループから呼ばれた場合はループ上で送信（スレッドを経由しない）
+                sender.schedule(line_job, target_name, created_at)
+            else:
+                dispatcher.submit("line", line_job, priority=PRIORITY_PUSH, label=target_name, created_at=created_at)
     
-    line_thread.start()
-    mail_thread.start()
+    dispatcher.submit(
+        "mail", deliver_mail, cfg, f"チケット販売検知 [{target_name}]", message,
+        priority=PRIORITY_MAIL, label=target_name, created_at=created_at,
+    )
     
-    # スレッドの開始をログに記録（完了は待たない）
+    # キューへの追加をログに記録（完了は待たない）
     print(f"[{target_name}] 通知送信を開始しました（非同期）")
+
+def send_line_message_async(cfg, message, user_id=None, label="controller"):
+    """
+    LINEメッセージを1件ディスパッチャー経由で送信（完了は待たない、コントローラーの返信など）
+    接続はプロセス共通のセッションを使い、一時的な失敗は再送する
+    
+    Args:
+        cfg: 設定辞書
+        message: メッセージテキスト
+        user_id: 送信先（省略時は line_user_id）
+        label: ログ・統計用の名前
+    
+    Returns:
+        キューに追加できた場合True
+    """
+    try:
+        job = _LineDelivery(cfg, message, False, user_ids=[user_id or cfg["line_user_id"]])
+    except KeyError as e:
+        print(f"LINE送信エラー: 設定がありません {e}")
+        return False
+    return get_dispatcher(cfg).submit("line", job, priority=PRIORITY_PUSH, label=label)
@@ -0,0 +1,110 @@
+# poll_schedule.py
+"""
+販売開始時刻に合わせたポーリング間隔の調整
+販売開始前後（バースト期間）だけ間隔を詰め、それ以外は間隔を空ける。
+アクセス過多ページへのリダイレクトが続く場合は間隔を自動で伸ばす（バックオフ）
+"""
+from datetime import datetime
+
+# 既定値（秒）
+DEFAULT_BURST_BEFORE_SEC = 120
+DEFAULT_BURST_AFTER_SEC = 600
+DEFAULT_BURST_INTERVAL_SEC = 1
+DEFAULT_WARMUP_BEFORE_SEC = 300
+DEFAULT_BACKOFF_MAX_SEC = 60
+
+
+def parse_sale_start(value):
+    """sale_start_at（ISO 8601形式、例: "2025-12-07T10:00:00"）を datetime に変換"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        print(f"sale_start_at の形式が不正です（無視）: {value}")
+        return None
+
+
+class PollSchedule:
+    """ターゲット単位のポーリング間隔
+
+    config.json のターゲットに以下のように指定する（すべて省略可）:
+        "schedule": {
+            "sale_start_at": "2025-12-07T10:00:00",
+            "burst_before_sec": 120,      # 販売開始の何秒前から間隔を詰めるか
+            "burst_after_sec": 600,       # 販売開始後何秒間、間隔を詰めるか
+            "burst_interval_sec": 1,      # バースト期間中の間隔
+            "idle_interval_sec": 30,      # バースト期間外の間隔（省略時は check_interval_sec）
+            "warmup_before_sec": 300,     # 販売開始の何秒前にウォームアップするか
+            "backoff_max_sec": 60         # リダイレクト時のバックオフ上限
+        }
+    """
+
+    def __init__(self, target_config, default_interval):
+        sched = target_config.get("schedule") or {}
+        self.default_interval = default_interval
+        self.sale_start_at = parse_sale_start(sched.get("sale_start_at"))
+        self.burst_before_sec = sched.get("burst_before_sec", DEFAULT_BURST_BEFORE_SEC)
+        self.burst_after_sec = sched.get("burst_after_sec", DEFAULT_BURST_AFTER_SEC)
+        self.burst_interval_sec = sched.get("burst_interval_sec", DEFAULT_BURST_INTERVAL_SEC)
+        self.idle_interval_sec = sched.get("idle_interval_sec", default_interval)
+        self.warmup_before_sec = sched.get("warmup_before_sec", DEFAULT_WARMUP_BEFORE_SEC)
+        self.backoff_max_sec = sched.get("backoff_max_sec", DEFAULT_BACKOFF_MAX_SEC)
+        # 連続でリダイレクト（アクセス過多）された回数
+        self.redirect_streak = 0
+        self.warmed_up = False
+
+    def _now(self):
+        return datetime.now(self.sale_start_at.tzinfo)
+
+    def seconds_until_start(self, now=None):
+        """販売開始までの秒数（開始後は負の値、未設定の場合は None）"""
+        if not self.sale_start_at:
+            return None
+        now = now or self._now()
+        return (self.sale_start_at - now).total_seconds()
+
+    def in_burst(self, now=None):
+        remaining = self.seconds_until_start(now)
+        if remaining is None:
+            return False
+        return -self.burst_after_sec <= remaining <= self.burst_before_sec
+
+    def warmup_due(self, now=None):
+        """ウォームアップを実行すべきか（販売開始ごとに1回のみ）"""
+        if self.warmed_up:
+            return False
+        remaining = self.seconds_until_start(now)
+        if remaining is None:
+            return False
+        return -self.burst_after_sec <= remaining <= self.warmup_before_sec
+
+    def mark_warmed_up(self):
+        self.warmed_up = True
+
+    def record_redirect(self):
+        """アクセス過多ページへのリダイレクトを記録（次回以降の間隔が伸びる）"""
+        self.redirect_streak += 1
+
+    def record_ok(self):
+        self.redirect_streak = 0
+
+    def next_interval(self, now=None):
+        """次のチェックまでの秒数"""
+        remaining = self.seconds_until_start(now)
+        if remaining is None:
+            interval = self.default_interval
+        elif self.in_burst(now):
+            interval = self.burst_interval_sec
+        else:
+            interval = self.idle_interval_sec
+            # バースト期間・ウォームアップの開始を待ち過ごさないように間隔を切り詰める
+            for boundary in (remaining - self.burst_before_sec, remaining - self.warmup_before_sec):
+                if boundary > 0:
+                    interval = min(interval, boundary)
+
+        if self.redirect_streak:
+            # アクセス過多: 連続回数に応じて指数的に間隔を伸ばす
+            backoff = max(interval, 1) * (2 ** min(self.redirect_streak, 10))
+            interval = max(interval, min(backoff, self.backoff_max_sec))
+        return interval
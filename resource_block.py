@@ -0,0 +1,125 @@
+# resource_block.py
+"""
+監視用コンテキストのリソースブロック
+innerText しか読まないページで画像・フォント・CSS・解析/広告スクリプトを取得しないようにして、
+リロードを軽くする。中断した件数と推定バイト数は metrics の ticket_watcher_blocked_requests_total・
+ticket_watcher_blocked_bytes_estimate_total で確認できる
+"""
+from urllib.parse import urlparse
+
+import metrics
+
+# block_resources: true の場合に使うプロファイル
+DEFAULT_BLOCK_PROFILE = {
+    # 中断するリソースタイプ（Playwrightの request.resource_type）
+    "resource_types": ["image", "media", "font", "stylesheet"],
+    # 常に中断するホスト（サフィックス一致）
+    "deny_hosts": [
+        "google-analytics.com",
+        "googletagmanager.com",
+        "doubleclick.net",
+        "googlesyndication.com",
+        "facebook.net",
+        "criteo.com",
+    ],
+    # 常に通すホスト（サフィックス一致、deny_hosts・resource_typesより優先）
+    "allow_hosts": [],
+}
+
+# 中断したリクエストのサイズの推定値（バイト、リソースタイプ別）
+# 中断したリクエストはレスポンスを受け取らないため実際のサイズは分からない。リクエストに Content-Length があればそれを使う
+ESTIMATED_BYTES = {
+    "image": 30 * 1024,
+    "media": 500 * 1024,
+    "font": 40 * 1024,
+    "stylesheet": 20 * 1024,
+    "script": 30 * 1024,
+}
+DEFAULT_ESTIMATED_BYTES = 10 * 1024
+
+
+def resolve_block_profile(cfg, target_config):
+    """グローバル設定とターゲット設定からブロックプロファイルを決定
+
+    block_resources は true（既定プロファイル）/ false（無効）/ 辞書（既定プロファイルを上書き）を指定できる。
+    ターゲット側の指定はグローバル設定に重ねて適用する。
+
+    Returns:
+        プロファイル辞書。無効の場合は None
+    """
+    profile = None
+    for value in (cfg.get("block_resources"), target_config.get("block_resources")):
+        if value is None:
+            continue
+        if value is False:
+            profile = None
+        elif value is True:
+            profile = dict(profile or DEFAULT_BLOCK_PROFILE)
+        elif isinstance(value, dict):
+            profile = {**(profile or DEFAULT_BLOCK_PROFILE), **value}
+    return profile
+
+
+def _host_matches(host, suffixes):
+    return any(host == s or host.endswith("." + s) for s in suffixes)
+
+
+class ResourceBlocker:
+    """コンテキスト単位でリクエストを中断し、中断した件数と推定バイト数を記録する"""
+
+    def __init__(self, profile, target_name=""):
+        self.target_name = target_name
+        self.resource_types = frozenset(profile.get("resource_types", []))
+        self.deny_hosts = tuple(profile.get("deny_hosts", []))
+        self.allow_hosts = tuple(profile.get("allow_hosts", []))
+        # 中断したリクエスト数（合計 / リソースタイプ別）
+        self.blocked_requests = 0
+        self.blocked_by_type = {}
+        # 中断したバイト数の推定（ESTIMATED_BYTES による概算）
+        self.blocked_bytes_estimate = 0
+
+    def should_block(self, url, resource_type):
+        """リクエストを中断するかどうか"""
+        if resource_type == "document":
+            return False
+        host = urlparse(url).hostname or ""
+        if self.allow_hosts and _host_matches(host, self.allow_hosts):
+            return False
+        if self.deny_hosts and _host_matches(host, self.deny_hosts):
+            return True
+        return resource_type in self.resource_types
+
+    @staticmethod
+    def estimate_bytes(request, resource_type):
+        """中断したリクエストのサイズの推定値"""
+        try:
+            length = request.headers.get("content-length")
+            if length:
+                return int(length)
+        except Exception:
+            pass
+        return ESTIMATED_BYTES.get(resource_type, DEFAULT_ESTIMATED_BYTES)
+
+    async def _handle_route(self, route):
+        request = route.request
+        resource_type = request.resource_type
+        if self.should_block(request.url, resource_type):
+            self.blocked_requests += 1
+            self.blocked_by_type[resource_type] = self.blocked_by_type.get(resource_type, 0) + 1
+            size = self.estimate_bytes(request, resource_type)
+            self.blocked_bytes_estimate += size
+            # 監視中は watcher が終了しないため、終了時の表示だけでなくメトリクスにも出す
+            metrics.inc("ticket_watcher_blocked_requests_total", target=self.target_name, resource_type=resource_type)
+            metrics.inc("ticket_watcher_blocked_bytes_estimate_total", size, target=self.target_name, resource_type=resource_type)
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def install(self, context):
+        """コンテキストにルートを設定（以降のリクエストが中断対象になる。初回ロードの前に呼ぶ）"""
+        await context.route("**/*", self._handle_route)
+
+    def summary(self):
+        """中断状況の文字列"""
+        by_type = ", ".join(f"{k}:{v}" for k, v in sorted(self.blocked_by_type.items()))
+        return f"{self.blocked_requests}件 / 推定約{self.blocked_bytes_estimate // 1024}KB ({by_type})"
@@ -0,0 +1,499 @@
+# shard.py
+"""
+ターゲットの複数プロセスへの分割（シャード）
+watch_targets をターゲットのハッシュで N 個のワーカープロセスに振り分け、各ワーカーが
+自分のイベントループ・ブラウザで監視する（1プロセスの Python 側の処理が1コアに収まらない場合用）。
+通知済みの判定（重複排除）・通知の送信・検知ログはスーパーバイザー（起動したプロセス）が1か所で行い、
+ワーカーはキュー経由で通知・状態の変化を送るだけにする。そのため同じ通知が2回送られることはない。
+詳細ページのターゲットは、リンクを検知したワーカーがそのまま監視する。
+設定の再読み込みでは、既存のターゲットは同じシャードのまま、追加されたターゲットを担当の少ないシャードに割り当てる
+"""
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from pathlib import Path
+
+import control
+import mail_transport
+import line_http
+import metrics
+import watch_status
+from dispatcher import get_dispatcher
+from event_log import get_writer as get_event_writer
+from notified_store import NotifiedStore, DEFAULT_DB_PATH, DEFAULT_TTL_SEC
+from notifier import send_notifications_async
+
+# ワーカーのプロセス情報（controller.py の /status が読む）
+SHARDS_FILE = "watcher.shards.json"
+# 異常終了したワーカーを再起動するまでの待ち時間（秒）
+RESTART_DELAY_SEC = 5
+# 終了時にワーカーの終了処理を待つ時間（秒）
+STOP_TIMEOUT_SEC = 20
+# ワーカーがスーパーバイザーの終了を確認する間隔（秒）
+PARENT_CHECK_INTERVAL_SEC = 1.0
+
+
+def _target_hash(target):
+    return hashlib.blake2b(f"{target['name']}||{target['url']}".encode("utf-8"), digest_size=8).digest()
+
+
+def partition(targets, count):
+    """ターゲットをシャードに振り分ける
+    名前とURLのハッシュ順に並べて順番に割り当てるため、同じ設定なら再起動しても同じシャードになり、
+    シャード間のターゲット数の差は1以内になる
+
+    Returns:
+        シャードごとのターゲットのリスト（長さ count、各シャード内は設定の順）
+    """
+    shards = [[] for _ in range(count)]
+    order = sorted(range(len(targets)), key=lambda i: _target_hash(targets[i]))
+    assigned = {i: n % count for n, i in enumerate(order)}
+    for i, target in enumerate(targets):
+        shards[assigned[i]].append(target)
+    return shards
+
+
+def reassign(current, targets):
+    """設定の再読み込み時の振り分け
+    既存のターゲットは同じシャードのまま（ページ・通知済み状態を引き継ぐ）、追加されたターゲットは
+    ハッシュ順に担当の少ないシャードへ割り当てる
+
+    Args:
+        current: シャードごとの現在のターゲットのリスト
+        targets: 新しい watch_targets
+
+    Returns:
+        シャードごとのターゲットのリスト（長さ len(current)）
+    """
+    owner = {(t["name"], t["url"]): i for i, shard_targets in enumerate(current) for t in shard_targets}
+    shards = [[] for _ in current]
+    added = []
+    for target in targets:
+        index = owner.get((target["name"], target["url"]))
+        if index is None:
+            added.append(target)
+        else:
+            shards[index].append(target)
+    for target in sorted(added, key=_target_hash):
+        min(shards, key=len).append(target)
+    return shards
+
+
+class ShardStore(NotifiedStore):
+    """ワーカー側の通知済みストア（メモリ上のみ）
+
+    参照はワーカー内で完結させ、解除・検知状態の変化はスーパーバイザーに送って永続化する。
+    起動時にスーパーバイザーのストアから担当ターゲットの分を受け取る
+    """
+
+    def __init__(self, link, snapshot=None, ttl_sec=DEFAULT_TTL_SEC):
+        super().__init__(":memory:", ttl_sec=ttl_sec)
+        self.link = link
+        if snapshot:
+            self.restore(snapshot)
+
+    def invalidate_target(self, target_key):
+        removed = super().invalidate_target(target_key)
+        self.link.send("invalidate", target_key)
+        return removed
+
+    def set_state(self, target_key, detected):
+        if self.get_state(target_key) == bool(detected):
+            return
+        super().set_state(target_key, detected)
+        self.link.send("state", target_key, bool(detected))
+
+
+class ShardLink:
+    """ワーカーからスーパーバイザーへの連絡口（watcher.run_watcher_async に渡す）
+
+    Args:
+        index: シャード番号
+        events: スーパーバイザーへのキュー（multiprocessing.Queue）
+        profile_lock: ブラウザのプロフィール（user_data_dir）を使う間のロック
+        snapshot: 担当ターゲットの通知済みキーと検知状態（NotifiedStore.snapshot）
+        commands: スーパーバイザーからの指示のキュー（multiprocessing.Queue）
+    """
+
+    def __init__(self, index, events, profile_lock, snapshot=None, commands=None):
+        self.index = index
+        self.events = events
+        self.commands = commands
+        self.profile_lock = profile_lock
+        self.snapshot = snapshot
+        self.parent_check_interval = PARENT_CHECK_INTERVAL_SEC
+
+    def send(self, kind, *args):
+        self.events.put((kind, self.index) + args)
+
+    def create_store(self, cfg):
+        return ShardStore(self, self.snapshot, ttl_sec=cfg.get("notified_ttl_sec", DEFAULT_TTL_SEC))
+
+    def notify(self, target_key, notify_key, message, target_name, use_broadcast):
+        """通知をスーパーバイザーに依頼（通知済みの判定と送信はスーパーバイザーが行う）"""
+        self.send("notify", target_key, notify_key, message, target_name, use_broadcast, time.time())
+
+    def write(self, event):
+        """検知イベントのログをスーパーバイザーに送る（EventLogWriter.write と同じ使い方）"""
+        self.send("event", event)
+        return True
+
+    def next_command(self, timeout=None):
+        """スーパーバイザーからの指示（timeout 秒待ってもなければ None、省略時は待たない）"""
+        if self.commands is None:
+            if timeout:
+                time.sleep(timeout)
+            return None
+        try:
+            if timeout is None:
+                return self.commands.get_nowait()
+            return self.commands.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def parent_alive(self):
+        parent = multiprocessing.parent_process()
+        return parent is None or parent.is_alive()
+
+    async def acquire_profile(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.profile_lock.acquire)
+
+    def release_profile(self):
+        self.profile_lock.release()
+
+
+def _worker_main(index, targets, notification_config, events, profile_lock, snapshot, commands):
+    """ワーカープロセスのエントリーポイント"""
+    import watcher
+    # スーパーバイザーからの停止（SIGTERM）でも終了処理を実行する（監視の開始後は run_watcher_async が受ける）
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # Ctrl+C はスーパーバイザーが受けてワーカーを順に止める
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    link = ShardLink(index, events, profile_lock, snapshot, commands)
+    asyncio.run(watcher.run_watcher_async(notification_config, targets=targets, shard=link))
+
+
+def _write_shards_file(supervisor_pid, workers, paused=False):
+    data = {
+        "supervisor_pid": supervisor_pid,
+        "paused": paused,
+        "shards": [
+            {
+                "index": index,
+                "pid": w["process"].pid if w["process"] else None,
+                "targets": [t["name"] for t in w["targets"]],
+            }
+            for index, w in sorted(workers.items())
+        ],
+    }
+    tmp = Path(f"{SHARDS_FILE}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, SHARDS_FILE)
+
+
+class Supervisor:
+    """ワーカープロセスの起動・監視と、通知の集約
+
+    Args:
+        cfg: 設定辞書
+        count: シャード数
+        notification_config: コマンドラインで指定した通知設定（ワーカーにも渡す）
+    """
+
+    def __init__(self, cfg, count, notification_config=None):
+        self.cfg = cfg
+        self.notification_config = notification_config
+        # ワーカーは spawn で起動（Windows と同じ方式に揃え、親のスレッド・接続を引き継がない）
+        self.ctx = multiprocessing.get_context("spawn")
+        self.events = self.ctx.Queue()
+        self.profile_lock = self.ctx.Lock()
+        shards = partition(cfg.get("watch_targets", []), count)
+        # 空のシャードはワーカーを起動しない（設定の再読み込みでターゲットが割り当てられたら起動する）
+        # key: シャード番号
+        self.workers = {
+            i: {"targets": t, "process": None, "restart_at": None, "commands": None, "retiring": False}
+            for i, t in enumerate(shards)
+        }
+        self.store = NotifiedStore(
+            cfg.get("state_db_path", DEFAULT_DB_PATH),
+            ttl_sec=cfg.get("notified_ttl_sec", DEFAULT_TTL_SEC),
+        )
+        self.event_writer = get_event_writer(cfg)
+        self.stopping = False
+        self.paused = False
+        self.config_mtime = None
+        self.stats = {"notified": 0, "deduplicated": 0, "restarts": 0, "reloads": 0}
+
+    def _start_worker(self, index):
+        worker = self.workers[index]
+        target_keys = [(t["name"], t["url"]) for t in worker["targets"]]
+        # 指示のキューは起動ごとに作り直す（再起動前の指示は起動時のターゲットに含まれている）
+        worker["commands"] = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=_worker_main,
+            args=(index, worker["targets"], self.notification_config, self.events, self.profile_lock,
+                  self.store.snapshot(target_keys), worker["commands"]),
+            name=f"watcher-shard{index}",
+        )
+        process.start()
+        worker["process"] = process
+        worker["restart_at"] = None
+        if self.paused:
+            # 一時停止中に起動したワーカーも一時停止の状態にそろえる
+            worker["commands"].put(("pause",))
+        print(f"[shard{index}] 起動しました（PID {process.pid}、{len(worker['targets'])}ターゲット: "
+              f"{', '.join(t['name'] for t in worker['targets'])}）")
+
+    def handle_event(self, event):
+        """ワーカーからの連絡を処理（処理に失敗しても他のシャードの監視は止めない）"""
+        try:
+            self._handle_event(event)
+        except Exception as e:
+            print(f"ワーカーからの連絡の処理エラー（{event[0]}）: {e}")
+
+    def _handle_event(self, event):
+        kind, index = event[0], event[1]
+        if kind == "notify":
+            target_key, notify_key, message, target_name, use_broadcast, detected_at = event[2:]
+            # notify_key が None の通知（ログイン切れの警告など）は通知済みの判定をしない
+            if notify_key is not None and self.store.contains(notify_key):
+                self.stats["deduplicated"] += 1
+                print(f"[shard{index}] [{target_name}] 既に通知済み（スキップ）: {notify_key}")
+                return
+            # 遅延の起点はワーカーで検知した時刻（キューの待ち時間も含める）
+            created_at = time.monotonic() - max(0.0, time.time() - detected_at)
+            send_notifications_async(self.cfg, message, target_name, use_broadcast=use_broadcast, created_at=created_at)
+            if notify_key is not None:
+                self.store.add(target_key, notify_key)
+            self.stats["notified"] += 1
+        elif kind == "invalidate":
+            self.store.invalidate_target(event[2])
+        elif kind == "state":
+            self.store.set_state(event[2], event[3])
+        elif kind == "event":
+            self.event_writer.write(event[2])
+        elif kind == "reload":
+            self.safe_reload()
+        elif kind in ("pause", "resume"):
+            self.set_paused(kind == "pause")
+
+    def set_paused(self, paused):
+        """全ワーカーの監視を一時停止・再開（warm_standby、プロセスとブラウザは起動したまま）"""
+        if paused == self.paused:
+            return
+        self.paused = paused
+        for worker in self.workers.values():
+            if worker["process"] is not None and worker["restart_at"] is None and not worker["retiring"]:
+                worker["commands"].put(("pause",) if paused else ("resume",))
+        _write_shards_file(os.getpid(), self.workers, paused)
+        print("全シャードの監視を一時停止しました" if paused else "全シャードの監視を再開しました")
+
+    def safe_reload(self):
+        """設定の再読み込み（失敗してもスーパーバイザーは止めない）"""
+        try:
+            self.reload()
+        except Exception as e:
+            print(f"設定の再読み込みエラー: {e}")
+
+    def reload(self):
+        """config.json を読み直し、ワーカーに担当のターゲットを伝える（シャード数は変えない）"""
+        import watcher
+        self.config_mtime = watcher.config_mtime()
+        try:
+            new_cfg = watcher.load_config()
+            control.validate_config(new_cfg)
+        except (OSError, ValueError) as e:
+            print(f"設定ファイルの読み込みエラー（反映しません）: {e}")
+            return
+        restart_required = watcher.merge_reloaded_config(self.cfg, new_cfg)
+        shards = reassign([w["targets"] for _, w in sorted(self.workers.items())], new_cfg.get("watch_targets", []))
+        self.stats["reloads"] += 1
+        for index, shard_targets in enumerate(shards):
+            worker = self.workers[index]
+            old_keys = {(t["name"], t["url"]) for t in worker["targets"]}
+            worker["targets"] = shard_targets
+            process = worker["process"]
+            if worker["restart_at"] is not None:
+                # 再起動待ち: 再起動時に新しいターゲットで起動する（担当がなくなった場合は再起動しない）
+                if not shard_targets:
+                    worker["restart_at"] = None
+                    worker["process"] = None
+                continue
+            if process is None:
+                # 担当がなかったシャード
+                if shard_targets:
+                    self._start_worker(index)
+                continue
+            if not shard_targets:
+                print(f"[shard{index}] 担当のターゲットがなくなったため停止します")
+                worker["retiring"] = True
+                process.terminate()
+                continue
+            # 間隔などの変更もワーカーで読み直すため、ターゲットが変わらなくても伝える
+            added_keys = [(t["name"], t["url"]) for t in shard_targets if (t["name"], t["url"]) not in old_keys]
+            worker["commands"].put(("reload", shard_targets, self.store.snapshot(added_keys)))
+        _write_shards_file(os.getpid(), self.workers, self.paused)
+        print(f"設定を再読み込みしました（シャードごとのターゲット数: {[len(t) for t in shards]}）")
+        if restart_required:
+            print(f"再起動するまで反映されない設定があります: {restart_required}")
+
+    def handle_control(self, command, message):
+        """制御チャネルの指示（待ち受けスレッドから呼ばれるため、キュー経由でメインのループに渡す）"""
+        if command == "reload":
+            self.events.put(("reload", None))
+            return {"status": "reloading"}
+        if command in ("pause", "resume"):
+            # was_paused: 指示の前に一時停止していたか（一時停止していない watcher への resume を区別する）
+            was_paused = self.paused
+            self.events.put((command, None))
+            return {"status": "paused" if command == "pause" else "running", "was_paused": was_paused}
+        if command == "status":
+            return {"paused": self.paused}
+        return None
+
+    def _check_workers(self):
+        """終了したワーカーの確認（異常終了は再起動、stop_after_detection による正常終了は全体を停止）"""
+        now = time.monotonic()
+        for index, worker in self.workers.items():
+            process = worker["process"]
+            if worker["restart_at"] is not None:
+                if now >= worker["restart_at"]:
+                    self.stats["restarts"] += 1
+                    self._start_worker(index)
+                    _write_shards_file(os.getpid(), self.workers, self.paused)
+                continue
+            if process is None or process.is_alive():
+                continue
+            process.join()
+            if worker["retiring"]:
+                worker["retiring"] = False
+                worker["process"] = None
+                print(f"[shard{index}] 停止しました")
+                # 停止を待つ間に再びターゲットが割り当てられた場合は起動し直す
+                if worker["targets"]:
+                    self._start_worker(index)
+                _write_shards_file(os.getpid(), self.workers, self.paused)
+                continue
+            if process.exitcode == 0:
+                print(f"[shard{index}] 終了しました")
+                if self.cfg.get("stop_after_detection", False):
+                    print("stop_after_detection=true のため全シャードを終了します。")
+                    self.stopping = True
+                    return
+                worker["process"] = None
+            else:
+                print(f"[shard{index}] 異常終了しました（終了コード {process.exitcode}）。{RESTART_DELAY_SEC}s後に再起動します")
+                worker["restart_at"] = now + RESTART_DELAY_SEC
+        # 担当のあるワーカーがすべて終了した場合は停止（ターゲットがない間は再読み込みを待つ）
+        assigned = [w for w in self.workers.values() if w["targets"]]
+        if assigned and not any(w["process"] or w["restart_at"] is not None for w in assigned):
+            self.stopping = True
+
+    def _drain_events(self):
+        while True:
+            try:
+                self.handle_event(self.events.get_nowait())
+            except queue.Empty:
+                return
+
+    def run(self):
+        if not any(w["targets"] for w in self.workers.values()):
+            print("監視対象が設定されていません。config.jsonのwatch_targetsを確認してください。")
+            return
+        # 通知はこのプロセスから送るため、LINE・SMTPの接続を事前に確立して維持する
+        line_http.start_keepalive(
+            self.cfg.get("line_channel_access_token"),
+            interval=self.cfg.get("line_keepalive_interval_sec", line_http.KEEPALIVE_INTERVAL_SEC),
+            base_url=self.cfg.get("line_api_base_url", line_http.LINE_API_BASE_URL),
+        )
+        mail_transport.start_keepalive(self.cfg)
+        metrics_path = self.cfg.get("metrics_path", metrics.DEFAULT_METRICS_PATH)
+        metrics_interval = self.cfg.get("metrics_interval_sec", metrics.DEFAULT_WRITE_INTERVAL_SEC)
+        if metrics_path:
+            # 前回の起動（シャード数が多かった場合など）のワーカーのファイルを削除
+            for path in metrics.shard_paths(metrics_path):
+                path.unlink(missing_ok=True)
+        status_path = self.cfg.get("status_path", watch_status.DEFAULT_STATUS_PATH)
+        if status_path:
+            # 前回の起動のワーカーの状態（各ワーカーが書き出し、終了時に削除する）
+            watch_status.remove_files(status_path)
+
+        import watcher
+        started = [index for index, w in self.workers.items() if w["targets"]]
+        print(f"=== シャード: {len(started)}プロセスで監視します ===")
+        for index in started:
+            self._start_worker(index)
+        _write_shards_file(os.getpid(), self.workers, self.paused)
+
+        # 設定の再読み込み（config.json の更新、または controller.py からの指示）
+        self.config_mtime = watcher.config_mtime()
+        config_watch_interval = self.cfg.get("config_watch_interval_sec", watcher.CONFIG_WATCH_INTERVAL_SEC)
+        control_server = control.start_server(self.cfg, self.handle_control)
+
+        last_metrics = last_config_check = 0.0
+        try:
+            while not self.stopping:
+                try:
+                    self.handle_event(self.events.get(timeout=0.5))
+                except queue.Empty:
+                    pass
+                self._check_workers()
+                if config_watch_interval and time.monotonic() - last_config_check >= config_watch_interval:
+                    last_config_check = time.monotonic()
+                    if watcher.config_mtime() != self.config_mtime:
+                        self.safe_reload()
+                if metrics_path and time.monotonic() - last_metrics >= metrics_interval:
+                    last_metrics = time.monotonic()
+                    try:
+                        metrics.REGISTRY.write_textfile(metrics_path)
+                    except Exception as e:
+                        print(f"メトリクスの書き出しエラー: {e}")
+        finally:
+            if control_server:
+                control_server.close()
+            self.shutdown()
+
+    def shutdown(self):
+        """ワーカーを停止し、残った通知を送り切ってから終了"""
+        self.stopping = True
+        processes = [w["process"] for w in self.workers.values() if w["process"] is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT_SEC
+        for process in processes:
+            # 終了を待つ間もキューを読む（ワーカーの終了処理がキューへの書き込みで止まらないように）
+            while process.is_alive() and time.monotonic() < deadline:
+                self._drain_events()
+                process.join(0.2)
+            if process.is_alive():
+                print(f"[{process.name}] 終了しないため強制終了します")
+                process.kill()
+                process.join()
+        self._drain_events()
+        self.store.close()
+        self.event_writer.close()
+        dispatcher = get_dispatcher(self.cfg)
+        dispatcher.shutdown()
+        print(f"シャード統計: {self.stats}")
+        for channel, channel_stats in dispatcher.stats().items():
+            print(f"通知統計 [{channel}]: {channel_stats}")
+        metrics_path = self.cfg.get("metrics_path", metrics.DEFAULT_METRICS_PATH)
+        if metrics_path:
+            try:
+                metrics.REGISTRY.write_textfile(metrics_path)
+            except Exception as e:
+                print(f"メトリクスの書き出しエラー: {e}")
+        Path(SHARDS_FILE).unlink(missing_ok=True)
+
+
+def run_supervisor(cfg, count, notification_config=None):
+    """シャードのスーパーバイザーとして監視を実行（終了するまで戻らない）"""
+    count = max(1, min(int(count), len(cfg.get("watch_targets", [])) or 1))
+    Supervisor(cfg, count, notification_config).run()
@@ -0,0 +1,151 @@
+# test_mail_transport.py
+"""
+mail_transport.SMTPTransport のテスト（benchmark.py のモックSMTPサーバーに向けて送信する）
+  python -m unittest test_mail_transport
+"""
+import socket
+import threading
+import time
+import unittest
+from email.mime.text import MIMEText
+from unittest import mock
+
+import benchmark
+import mail_transport
+from mail_transport import SMTPTransport
+
+
+class _Tap:
+    """受信した行をサーバーの記録に残す（NOOP の確認用）"""
+
+    def __init__(self, rfile, lines):
+        self._rfile = rfile
+        self._lines = lines
+
+    def readline(self, *args):
+        line = self._rfile.readline(*args)
+        self._lines.append(line)
+        return line
+
+    def close(self):
+        self._rfile.close()
+
+
+class _RecordingSMTPHandler(benchmark._SMTPHandler):
+    def setup(self):
+        super().setup()
+        self.server.connections.append(self.connection)
+        self.rfile = _Tap(self.rfile, self.server.lines)
+
+
+class _RecordingSMTPServer(benchmark._ThreadingSMTPServer):
+    def __init__(self, state):
+        self.connections = []
+        self.lines = []
+        super().__init__(("127.0.0.1", 0), type("SMTPHandler", (_RecordingSMTPHandler,), {"state": state}))
+
+    def commands(self, name):
+        return [l for l in self.lines if l.decode("ascii", "replace").strip().upper().startswith(name)]
+
+    def drop_connections(self):
+        """サーバー側から接続を切る（アイドル切断・サーバー再起動の代わり）"""
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+        self.connections.clear()
+
+
+def _message(target_name):
+    msg = MIMEText("テスト", "plain", "utf-8")
+    msg["Subject"] = f"[{target_name}] test"
+    msg["From"] = "bench@example.com"
+    msg["To"] = "to@example.com"
+    return msg
+
+
+class SMTPTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.state = benchmark.BenchState()
+        self.server = _RecordingSMTPServer(self.state)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.transport = SMTPTransport("127.0.0.1", self.port, use_ssl=False)
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_connection(self):
+        self.assertFalse(self.transport.send(_message("A")))
+        self.assertTrue(self.transport.send(_message("B")))
+        self.assertEqual(self.transport.send_many([_message("C"), _message("D")]), [True, True])
+        self.assertEqual(self.transport.stats["connects"], 1)
+        self.assertEqual(self.transport.stats["reused"], 3)
+        self.assertEqual(self.state.mail_messages, 4)
+
+    def test_noop_keeps_connection_alive(self):
+        self.transport.connect()
+        self.transport.noop()
+        self.transport.noop()
+        self.assertEqual(len(self.server.commands("NOOP")), 2)
+        self.assertTrue(self.transport.send(_message("A")))
+        self.assertEqual(self.transport.stats["connects"], 1)
+
+    def test_noop_drops_dead_connection(self):
+        self.transport.connect()
+        self.server.drop_connections()
+        self.transport.noop()
+        self.assertIsNone(self.transport._conn)
+        # 次の送信で接続し直す（再利用ではない）
+        self.assertFalse(self.transport.send(_message("A")))
+        self.assertEqual(self.transport.stats["connects"], 2)
+        self.assertEqual(self.state.mail_messages, 1)
+
+    def test_reconnects_after_dropped_connection(self):
+        self.transport.send(_message("A"))
+        self.server.drop_connections()
+        # 保持していた接続が切れていても、再接続して送り直す
+        self.assertFalse(self.transport.send(_message("B")))
+        self.assertEqual(self.transport.stats["reconnects"], 1)
+        self.assertEqual(self.transport.stats["connects"], 2)
+        self.assertEqual(self.state.mail_messages, 2)
+
+    def test_dns_cache_expires_after_ttl(self):
+        transport = SMTPTransport("smtp.example.test", self.port, use_ssl=False, dns_ttl=60)
+        real_getaddrinfo = socket.getaddrinfo
+        resolved = []
+
+        def getaddrinfo(host, *args, **kwargs):
+            # 接続先のホスト名だけ 127.0.0.1 に解決する（smtplib が解決済みのアドレスで呼ぶ分は通す）
+            if host == "smtp.example.test":
+                resolved.append(host)
+                return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", self.port))]
+            return real_getaddrinfo(host, *args, **kwargs)
+
+        clock = [1000.0]
+        fake_time = mock.Mock(monotonic=lambda: clock[0], sleep=time.sleep)
+        try:
+            with mock.patch.object(mail_transport.socket, "getaddrinfo", side_effect=getaddrinfo), \
+                    mock.patch.object(mail_transport, "time", fake_time):
+                transport.send(_message("A"))
+                transport._drop()
+                # TTL内はキャッシュしたアドレスで接続する
+                clock[0] += 59
+                transport.send(_message("B"))
+                self.assertEqual(len(resolved), 1)
+                transport._drop()
+                # TTLを過ぎたら名前解決し直す
+                clock[0] += 2
+                transport.send(_message("C"))
+                self.assertEqual(len(resolved), 2)
+        finally:
+            transport.close()
+        self.assertEqual(self.state.mail_messages, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+# watch_status.py
+"""
+監視の現在の状態（ターゲットごとの最終チェック時刻・処理時間・検知状態・連続エラー数、開いているページ数など）
+watcher がメモリ上で更新し、一定間隔で JSON ファイルに書き出す（一時ファイルから置き換えるため、読む側が書きかけを読むことはない）。
+controller.py の /status と LINE の status コマンドはこのファイルを読むだけで、watcher の監視ループには問い合わせない。
+シャード（--shards）で起動した場合は各ワーカーが別ファイルに書き出し、controller.py がまとめて返す
+"""
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from metrics import shard_paths
+
+DEFAULT_STATUS_PATH = "logs/status.json"
+# 状態を書き出す間隔（秒、変化がなければ書き出さない）
+DEFAULT_WRITE_INTERVAL_SEC = 1
+# 書き出しからこの秒数を過ぎた状態は古い（watcher が応答していない）とみなす
+STALE_AFTER_SEC = 30
+# 変化がなくてもこの秒数ごとに書き出す（間隔の長いターゲット・一時停止中でも古いとみなされないように）
+HEARTBEAT_SEC = STALE_AFTER_SEC / 2
+# エラーメッセージの最大長
+MAX_ERROR_CHARS = 200
+
+
+class StatusBoard:
+    """ターゲットごとの状態（watcher のイベントループから更新する前提で、ロックは持たない）"""
+
+    def __init__(self):
+        # key: ターゲット名
+        self.targets = {}
+        self.fields = {}
+        self.version = 0
+        self.written_version = None
+        self.written_at = None
+
+    def _entry(self, target):
+        entry = self.targets.get(target["name"])
+        if entry is None:
+            entry = self.targets[target["name"]] = {
+                "url": target["url"],
+                "last_poll_at": None,
+                "last_latency_ms": None,
+                "detected": False,
+                "changed_at": None,
+                "last_detection": None,
+                "error_streak": 0,
+                "last_error": None,
+            }
+        return entry
+
+    def record_check(self, target, detected, detection=None):
+        """チェック1回分の結果を反映（detection["error"] がある場合は error_message をエラーとして数える）"""
+        detection = detection or {}
+        if detection.get("error"):
+            self.record_error(target, detection.get("error_message") or "チェック中エラー")
+            return
+        now = time.time()
+        entry = self._entry(target)
+        entry["last_poll_at"] = now
+        entry["last_latency_ms"] = detection.get("timings", {}).get("check_ms")
+        entry["error_streak"] = 0
+        if bool(detected) != entry["detected"]:
+            entry["detected"] = bool(detected)
+            entry["changed_at"] = now
+        if detected and detection.get("matched_date"):
+            entry["last_detection"] = {
+                "at": now,
+                "matched_date": detection.get("matched_date"),
+                "seat_type": detection.get("seat_type"),
+            }
+        self.version += 1
+
+    def record_error(self, target, error):
+        """チェックの失敗（タイムアウトを含む）を反映"""
+        entry = self._entry(target)
+        entry["last_poll_at"] = time.time()
+        entry["error_streak"] += 1
+        entry["last_error"] = str(error)[:MAX_ERROR_CHARS]
+        self.version += 1
+
+    def remove(self, target_name):
+        if self.targets.pop(target_name, None) is not None:
+            self.version += 1
+
+    def update(self, **fields):
+        """ターゲット以外の状態（一時停止、開いているページ数など）を更新"""
+        if any(self.fields.get(k) != v for k, v in fields.items()):
+            self.fields.update(fields)
+            self.version += 1
+
+    def changed(self):
+        return self.version != self.written_version
+
+    def heartbeat_due(self, heartbeat_sec=HEARTBEAT_SEC):
+        """前回の書き出しから heartbeat_sec 秒を過ぎたか"""
+        return self.written_at is None or time.monotonic() - self.written_at >= heartbeat_sec
+
+    def snapshot(self):
+        """書き出す内容（イベントループ上で作り、書き出しは別スレッドで行えるようにコピーする）"""
+        self.written_version = self.version
+        self.written_at = time.monotonic()
+        return dict(
+            self.fields,
+            pid=os.getpid(),
+            updated_at=time.time(),
+            targets=[dict(entry, name=name, last_detection=entry["last_detection"] and dict(entry["last_detection"]))
+                     for name, entry in self.targets.items()],
+        )
+
+
+def write_snapshot(path, snapshot):
+    """状態をファイルに書き出す（一時ファイルに書いてから置き換える）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.tmp")
+    tmp.write_text(json.dumps(snapshot, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def remove_files(path):
+    """書き出したファイル（シャードのファイルを含む）を削除"""
+    for p in [Path(path)] + shard_paths(path):
+        p.unlink(missing_ok=True)
+
+
+def read_merged(path=DEFAULT_STATUS_PATH):
+    """書き出された状態（シャードのファイルを含む）を読み込んでまとめる
+
+    Returns:
+        {"paused", "open_pages", "updated_at", "stale", "targets"}（ファイルがない場合は None）
+    """
+    snapshots = []
+    for p in [Path(path)] + shard_paths(path):
+        try:
+            snapshots.append(json.loads(p.read_text(encoding="utf-8")))
+        except (FileNotFoundError, ValueError):
+            continue
+    if not snapshots:
+        return None
+    updated_at = min(s.get("updated_at", 0) for s in snapshots)
+    return {
+        "paused": any(s.get("paused", False) for s in snapshots),
+        "open_pages": sum(s.get("open_pages", 0) for s in snapshots),
+        "updated_at": updated_at,
+        # 変化がなくても HEARTBEAT_SEC ごとに書き出すため、一時停止中・間隔の長いターゲットでも古くならない
+        "stale": time.time() - updated_at > STALE_AFTER_SEC,
+        "targets": sorted((t for s in snapshots for t in s.get("targets", [])), key=lambda t: t["name"]),
+    }
+
+
+def _clock(ts):
+    return datetime.fromtimestamp(ts).strftime("%H:%M:%S") if ts else "-"
+
+
+def format_text(status, running=True):
+    """LINEで返す状態のテキスト"""
+    if not running:
+        return "稼働中: False"
+    if status is None:
+        return "稼働中: True（状態はまだ書き出されていません）"
+    header = "稼働中: True"
+    if status["paused"]:
+        header += "（一時停止中）"
+    if status["stale"]:
+        header += f"（{_clock(status['updated_at'])} 以降の状態が更新されていません）"
+    lines = [header, f"開いているページ: {status['open_pages']}"]
+    for t in status["targets"]:
+        if t["error_streak"]:
+            state = f"エラー{t['error_streak']}回連続（{t['last_error']}）"
+        elif t["detected"]:
+            found = t["last_detection"] or {}
+            state = "検知中 " + " ".join(str(v) for v in (found.get("matched_date"), found.get("seat_type")) if v)
+        else:
+            state = "未検知"
+        latency = f"、{t['last_latency_ms']:.0f}ms" if t["last_latency_ms"] is not None else ""
+        lines.append(f"- {t['name']}: {state.strip()}（最終 {_clock(t['last_poll_at'])}{latency}）")
+    return "\n".join(lines)
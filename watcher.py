@@ -2,130 +2,228 @@
 import json
 import time
 import argparse
-import unicodedata
-import threading
 import os
-import queue
 import asyncio
+import random
+import signal
+import sys
 from pathlib import Path
 from datetime import datetime
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 from playwright.async_api import async_playwright, TimeoutError as PWTimeout
-from notifier import send_notifications_async
+from notifier import send_notifications_async, start_async_line_sender, close_async_line_sender
+from dispatcher import get_dispatcher
+import line_http
+import mail_transport
+import http_fetch
+from resource_block import ResourceBlocker, resolve_block_profile
+from detail_pool import (
+    DetailPagePool, DEFAULT_MAX_PAGES as DETAIL_MAX_PAGES, DEFAULT_IDLE_SEC as DETAIL_IDLE_SEC,
+    DEFAULT_RETIRE_MISSES as DETAIL_RETIRE_MISSES, DEFAULT_SPARE_PAGES as DETAIL_SPARE_PAGES,
+)
+from live_watch import install_live_observer
+from poll_schedule import PollSchedule
+from matcher import TargetMatcher, normalize_match_text
+from notified_store import NotifiedStore, DEFAULT_DB_PATH, DEFAULT_TTL_SEC
+from event_log import get_writer as get_event_writer
+from evidence import EvidenceCapturer, take_snapshot, snapshot_from_html
+from dom_archive import DomArchive, join_blocks, resolve_mode as resolve_archive_mode, DEFAULT_DIR as DOM_ARCHIVE_DIR
+import metrics
+import control
+import watch_status
 
 # 非同期ロックはrun_watcher_async内で作成（グローバル変数として保持）
 
+# config.json の更新を確認する間隔（秒、config_watch_interval_sec、0 で確認しない）
+CONFIG_WATCH_INTERVAL_SEC = 2
+# 実行中には反映できない設定（変更した場合は watcher の再起動が必要。再読み込みでは元の値のまま）
+RESTART_REQUIRED_KEYS = (
+    "chrome_path", "user_data_dir", "profile", "headless", "browser_mode", "browser_pool_size",
+    "state_db_path", "notified_ttl_sec", "event_log_path", "event_log_max_bytes",
+    "event_log_rotate_interval_sec", "event_log_compress", "metrics_path", "metrics_interval_sec",
+    "line_channel_access_token", "line_async", "line_max_concurrency", "line_api_base_url",
+    "notify_workers", "notify_max_retries", "smtp_host", "smtp_port", "smtp_ssl", "smtp_starttls",
+    "smtp_user", "smtp_password", "shards", "control_port", "management_secret", "config_watch_interval_sec",
+)
+# 変更した場合はページを開き直すターゲットの設定（ライブ監視は監視スクリプトの条件も含む）
+REOPEN_KEYS = ("watch_mode", "block_resources")
+LIVE_REOPEN_KEYS = ("selector", "target_dates")
+
 def load_config():
     with open("config.json", "r", encoding="utf-8") as f:
         return json.load(f)
 
+def config_mtime():
+    """config.json の更新時刻（ファイルがない場合は None）"""
+    try:
+        st = os.stat("config.json")
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def merge_reloaded_config(cfg, new_cfg):
+    """再読み込みした設定を cfg に反映（実行中の各処理が同じ辞書を参照しているため、置き換えずに更新する）
+
+    Returns:
+        変更されたが再起動まで反映されない設定のキー
+    """
+    restart_required = [k for k in RESTART_REQUIRED_KEYS if new_cfg.get(k) != cfg.get(k)]
+    for key in [k for k in cfg if k not in new_cfg and k not in RESTART_REQUIRED_KEYS]:
+        del cfg[key]
+    cfg.update({k: v for k, v in new_cfg.items() if k not in RESTART_REQUIRED_KEYS})
+    return restart_required
+
 def normalize(s):
     # 改行・タブを削除（スペースに変換しない）
     return s.replace("\n", "").replace("\r", "").replace("\t", "").strip()
 
-def normalize_alphabet(s):
-    """全角英数字を半角に変換"""
-    if not s:
-        return s
-    # 全角英数字を半角に変換
-    result = ""
-    for char in s:
-        # 全角英数字（Ａ-Ｚ、ａ-ｚ、０-９）を半角に変換
-        code = ord(char)
-        if 0xFF01 <= code <= 0xFF5E:  # 全角英数字・記号の範囲
-            result += unicodedata.normalize('NFKC', char)
-        else:
-            result += char
-    return result
+def log_detection_change_async(target_name, url, state_change, timestamp, detect_text, matched_date=None, seat_type=None, timings=None, dom_snapshot=None, writer=None):
+    """検知状態の変化をイベントログ（JSONL）に記録（書き込みはバックグラウンドのスレッドでまとめて行う）
+    writer を省略した場合はプロセス共通の EventLogWriter に書き込む（シャードのワーカーではスーパーバイザーに送る）
+    """
+    state_text = "検知文言が現れました" if state_change == "appeared" else "検知文言が消えました"
+    event = {
+        "ts": timestamp.isoformat(timespec="milliseconds"),
+        "target": target_name,
+        "url": url,
+        "state_change": state_change,
+        "detect_text": detect_text,
+        "matched_date": matched_date,
+        "seat_type": seat_type,
+        "timings": timings or {},
+        "dom_snapshot": dom_snapshot,
+    }
+    if (writer or get_event_writer()).write(event):
+        print(f"[{target_name}] 検知状態の変化をログに記録しました: {state_text}")
+    else:
+        print(f"[{target_name}] ログ記録をスキップしました（キュー満杯）: {state_text}")
 
-# スクリーンショット取得用のキュー（非同期処理のため）
-screenshot_queue = queue.Queue()
+# ブロック1件分の抽出処理（JS）
+# 席種・innerText・最初のリンクを1回の呼び出しでまとめて取得する
+# 戻り値は [text, seat_type, href] のコンパクトな配列
+_BLOCK_EXTRACT_FN = """
+el => {
+    let seat = null;
+    const valiation = el.querySelector('input.valiation');
+    if (valiation) {
+        seat = valiation.getAttribute('value');
+    } else {
+        const textElem = el.querySelector('.ticketSelect__text');
+        if (textElem) {
+            // 「Ａ席 7,000円」から「Ａ席」を抽出（最初のスペースまで）
+            const s = textElem.innerText;
+            seat = s.includes(' ') ? s.split(' ')[0] : s;
+        }
+    }
+    const link = el.querySelector('a');
+    return [el.innerText || '', seat, link ? link.getAttribute('href') : null];
+}
+"""
+# 一致した全要素を1回のevaluateで抽出する
+EXTRACT_BLOCKS_JS = f"els => els.map({_BLOCK_EXTRACT_FN.strip()})"
+# DOMアーカイブ用: 抽出と同じevaluateでHTMLも取得する
+# blocks: 各ブロックの末尾に outerHTML を付ける / page: [ブロック一覧, ページ全体のHTML]
+EXTRACT_BLOCKS_WITH_HTML_JS = f"els => els.map(el => [...({_BLOCK_EXTRACT_FN.strip()})(el), el.outerHTML])"
+EXTRACT_BLOCKS_WITH_PAGE_JS = f"els => [els.map({_BLOCK_EXTRACT_FN.strip()}), document.documentElement.outerHTML]"
+_EXTRACT_JS_BY_ARCHIVE = {
+    None: EXTRACT_BLOCKS_JS,
+    "blocks": EXTRACT_BLOCKS_WITH_HTML_JS,
+    "page": EXTRACT_BLOCKS_WITH_PAGE_JS,
+}
 
-def capture_screenshot_async(page, target_name, url, state_change, timestamp):
-    """スクリーンショット取得をキューに追加（非同期処理）"""
-    try:
-        # スクリーンショット保存ディレクトリを作成
-        screenshots_dir = Path("logs/screenshots")
-        screenshots_dir.mkdir(parents=True, exist_ok=True)
-        
-        # ファイル名を生成（タイムスタンプ + ターゲット名 + 状態）
-        safe_name = "".join(c for c in target_name if c.isalnum() or c in (' ', '-', '_')).strip()
-        safe_name = safe_name.replace(' ', '_')
-        filename = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_{safe_name}_{state_change}.png"
-        filepath = screenshots_dir / filename
-        
-        # キューに追加（メインスレッドで後で処理される）
-        screenshot_queue.put({
-            'page': page,
-            'filepath': filepath,
-            'target_name': target_name
-        })
-        print(f"[{target_name}] スクリーンショット取得をキューに追加しました: {filepath}")
-    except Exception as e:
-        print(f"[{target_name}] スクリーンショットキュー追加エラー: {e}")
+def _split_extract_result(result, archive):
+    """抽出結果を [text, seat_type, href] のリストとHTMLの断片に分ける"""
+    if archive == "blocks":
+        return [b[:3] for b in result], [b[3] for b in result]
+    if archive == "page":
+        return result[0], [result[1]]
+    return result, []
 
-async def process_screenshot_queue():
-    """キューに溜まったスクリーンショットを処理（非同期で実行）"""
-    processed = 0
-    max_process = 1  # 一度に処理する最大数（検知速度を最優先、1件のみ処理）
-    
-    while not screenshot_queue.empty() and processed < max_process:
+async def extract_blocks_async(page, target_name, selector, target_dates, archive=None, timings=None):
+    """監視ブロックのテキスト・席種・リンクを抽出
+    要素ごとにPlaywrightを呼び出すと往復回数が要素数に比例するため、
+    セレクタ（またはtarget_datesのテキスト検索）単位で1回のevaluateにまとめる。
+    archive（"blocks" / "page"）を指定すると、同じevaluateでアーカイブ用のHTMLも取得する。
+    timings（辞書）を渡すと、セレクタの待機時間 wait_selector_ms を記録する
+    戻り値:
+      - blocks: [text, seat_type, href] のリスト
+      - used_fallback_text_search: フォールバック（get_by_text）経由かどうか
+      - dom_html: アーカイブ用のHTML（archive 未指定の場合は None）
+    """
+    extract_js = _EXTRACT_JS_BY_ARCHIVE[archive]
+    blocks = []
+    html_parts = []
+    if selector:
+        wait_started = time.perf_counter()
         try:
-            item = screenshot_queue.get_nowait()
-            page = item['page']
-            filepath = item['filepath']
-            target_name = item['target_name']
-            
-            # スクリーンショットを取得（非同期で実行）
-            await page.screenshot(path=str(filepath), full_page=True)
-            print(f"[{target_name}] スクリーンショットを保存しました: {filepath}")
-            processed += 1
-        except queue.Empty:
-            break
-        except Exception as e:
-            print(f"[{target_name}] スクリーンショット取得エラー: {e}")
-    
-    return processed
+            # セレクタの待機時間を短縮して高速化
+            await page.wait_for_selector(selector, timeout=2000)
+            if timings is not None:
+                timings["wait_selector_ms"] = round((time.perf_counter() - wait_started) * 1000, 1)
+            blocks, html_parts = _split_extract_result(await page.eval_on_selector_all(selector, extract_js), archive)
+            print(f"[{target_name}] {len(blocks)}個の要素を検出")
+            return blocks, False, _archive_html(html_parts, archive)
+        except PWTimeout:
+            if timings is not None:
+                timings["wait_selector_ms"] = round((time.perf_counter() - wait_started) * 1000, 1)
+            print(f"[{target_name}] {selector}が見つかりません。キーワードで要素を検索します。")
 
-def log_detection_change_async(target_name, url, state_change, timestamp, detect_text, matched_date=None, seat_type=None):
-    """検知状態の変化をログに記録（非同期で実行）"""
-    def _log():
+    # セレクタが見つからない（または未指定の）場合、target_datesを含む要素を全て取得
+    for td in target_dates:
         try:
-            # ログディレクトリを作成
-            logs_dir = Path("logs")
-            logs_dir.mkdir(parents=True, exist_ok=True)
-            
-            log_file = logs_dir / "detection_changes.log"
-            
-            # ログメッセージを構築
-            state_text = "検知文言が現れました" if state_change == "appeared" else "検知文言が消えました"
-            log_message = f"[{timestamp.strftime('%Y-%m-%d %H:%M:%S')}] [{target_name}] {state_text}\n"
-            log_message += f"  URL: {url}\n"
-            log_message += f"  検知文言: {detect_text}\n"
-            if matched_date:
-                log_message += f"  対象日付: {matched_date}\n"
-            if seat_type:
-                log_message += f"  席種: {seat_type}\n"
-            log_message += "\n"
-            
-            # ログファイルに追記
-            with open(log_file, "a", encoding="utf-8") as f:
-                f.write(log_message)
-            
-            print(f"[{target_name}] 検知状態の変化をログに記録しました: {state_text}")
+            # Playwrightのget_by_textで部分一致検索し、一致要素をまとめて抽出
+            matching_blocks, parts = _split_extract_result(
+                await page.get_by_text(td, exact=False).evaluate_all(extract_js), archive
+            )
+            if archive == "page":
+                html_parts = parts
+            else:
+                html_parts.extend(parts)
+            if selector:
+                print(f"[{target_name}] '{td}'を含む要素: {len(matching_blocks)}個")
+            blocks.extend(matching_blocks)
         except Exception as e:
-            print(f"[{target_name}] ログ記録エラー: {e}")
-    
-    # バックグラウンドスレッドで実行
-    thread = threading.Thread(target=_log, daemon=True)
-    thread.start()
+            print(f"[{target_name}] テキスト検索エラー: {e}")
+
+    if selector and not blocks:
+        print(f"[{target_name}] キーワードを含む要素が見つかりませんでした")
+    return blocks, True, _archive_html(html_parts, archive)
+
+def record_check_metrics(target_name, detected_any, detection):
+    """チェック1回分の処理時間（段階ごと）と結果をメトリクスに記録"""
+    for key, value in detection["timings"].items():
+        metrics.observe_ms("ticket_watcher_phase_seconds", value, target=target_name, phase=key[:-len("_ms")])
+    if detection.get("error"):
+        result = "error"
+    else:
+        result = "detected" if detected_any else "not_detected"
+    metrics.inc("ticket_watcher_checks_total", target=target_name, result=result)
+    if detection.get("redirected"):
+        metrics.inc("ticket_watcher_redirects_total", target=target_name)
+    if detection.get("fallback"):
+        metrics.inc("ticket_watcher_fallback_total", target=target_name)
+
+def _archive_html(html_parts, archive):
+    if archive is None or not html_parts:
+        return None
+    return html_parts[0] if archive == "page" else join_blocks(html_parts)
 
-async def check_target_async(page, target_config, cfg, notified, notified_by_target, notification_config=None, notified_lock=None):
+async def check_target_async(page, target_config, cfg, notified_store, notification_config=None, http_fetcher=None, reload=True, schedule=None, matcher=None, archive_mode=None, notify=None):
     """単一ターゲットの監視処理
+    reload=False の場合はページをリロードせず、現在のDOMから抽出する（ライブ監視用）
+    archive_mode（"blocks" / "page"）を指定すると、抽出と同じevaluateで取得したHTMLを detection["dom_html"] に入れる
+    schedule（PollSchedule）を渡すと、アクセス過多ページへのリダイレクトを記録する
+    matcher（TargetMatcher）は読み込み時にコンパイルしたものを渡す（省略時はここでコンパイル）
+    notify（notify(target_key, notify_key, message, target_name, use_broadcast)）を渡すと、通知の送信を任せる
+    （シャードのワーカーでは、通知済みの判定と送信をスーパーバイザーが行う）
     戻り値:
       - detected_any: 検知条件（target_dates AND detect_text）を満たすブロックが存在したか
       - detected_links: 検知した要素のリンクのリスト
       - notified_new: 新規通知を送ったか（通知済みスキップの場合はFalse）
+      - detection: 最初に検知したブロックの matched_date / seat_type と、処理時間 timings（ミリ秒）、
+        リダイレクト（redirected）・フォールバック（fallback）・エラー（error）の有無とエラーの内容（error_message）、
+        検知条件を満たしたブロックのリンク links（enable_detail_watch の場合、通知済みのものを含む。
+        ブロックを抽出できなかった場合は None）
     """
     target_name = target_config["name"]
     url = target_config["url"]
@@ -136,140 +234,120 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
     # button_selector = target_config.get("button_selector", "")
     enable_detail_watch = target_config.get("enable_detail_watch", False)
     detail_seat_types = target_config.get("detail_seat_types", [])  # 席種指定（詳細ページ用）
+    # 取得方式（browser: ページをリロード / http: HTTPで取得してHTMLを解析）
+    fetch_mode = target_config.get("fetch_mode", "browser")
     # 詳細ページかどうか（ターゲット単位で固定）
     is_detail_page_target = "詳細" in target_name
+    if matcher is None:
+        matcher = TargetMatcher(target_config)
 
     detected_any = False
     notified_new = False
     detected_links = []  # 検知した要素のリンクを保存
+    started = time.perf_counter()
+    timings = {}
+    detection = {
+        "matched_date": None, "seat_type": None, "timings": timings, "source": "browser",
+        "redirected": False, "fallback": False, "error": False, "error_message": None, "links": None,
+    }
 
     try:
-        # ページをリロード（gotoより高速、キャッシュも活用可能）
-        # domcontentloadedを使用（リダイレクト検知のため、commitより安全）
-        # タイムアウトを1秒に短縮して高速化
-        try:
-            await page.reload(wait_until="domcontentloaded", timeout=1000)
-        except Exception:
-            # reloadが失敗した場合（初回など）はgotoを使用
-            await page.goto(url, wait_until="domcontentloaded", timeout=1000)
-        
-        # リダイレクトを検知（アクセス過多ページなどに飛ばされた場合）
-        current_url = page.url
-        if current_url != url and ("error" in current_url.lower() or "access" in current_url.lower() or "too" in current_url.lower()):
-            print(f"[{target_name}] 警告: リダイレクトが検知されました。現在のURL: {current_url}")
-            # リダイレクトされた場合は少し待ってから再試行
-            await asyncio.sleep(1)
-            await page.goto(url, wait_until="domcontentloaded", timeout=1000)
-
-        # セレクタが指定されている場合は待機、なければキーワードで検索
-        items = []
-        used_fallback_text_search = False  # フォールバック（get_by_text）経由かどうか
-        if selector:
+        blocks = None
+        used_fallback_text_search = False
+        if fetch_mode == "http" and http_fetcher and reload:
+            # HTTP高速パス（セレクタが見つからない場合などはNoneが返り、ブラウザで確認する）
+            blocks = await http_fetcher.fetch_blocks(url, selector, target_name, detection=detection)
+            timings["http_fetch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            if schedule:
+                # HTTPで取得できた場合もリダイレクトの連続回数を戻す（戻さないと間隔が延びたままになる）
+                if detection["redirected"]:
+                    schedule.record_redirect()
+                elif blocks is not None:
+                    schedule.record_ok()
+
+        if blocks is not None:
+            detection["source"] = "http"
+            if archive_mode:
+                # HTTP取得の場合はレスポンスのHTMLをそのまま使う（追加の取得・シリアライズなし）
+                cached = http_fetcher.last_html(url, selector)
+                detection["dom_html"] = cached[0] if cached else None
+
+        if blocks is None and reload:
+            load_started = time.perf_counter()
+            # ページをリロード（gotoより高速、キャッシュも活用可能）
+            # domcontentloadedを使用（リダイレクト検知のため、commitより安全）
+            # タイムアウトを1秒に短縮して高速化
             try:
-                # セレクタの待機時間を短縮して高速化
-                await page.wait_for_selector(selector, timeout=2000)
-                items = await page.locator(selector).all()
-                print(f"[{target_name}] {len(items)}個の要素を検出")
-            except PWTimeout:
-                print(f"[{target_name}] {selector}が見つかりません。キーワードで要素を検索します。")
-                used_fallback_text_search = True
-                # セレクタが見つからない場合、target_datesを含む要素を全て取得
-                items = []
-                for td in target_dates:
-                    # Playwrightのget_by_textで部分一致検索（正規表現使用）
-                    try:
-                        # 全要素からテキストで検索
-                        matching_elements = await page.get_by_text(td, exact=False).all()
-                        print(f"[{target_name}] '{td}'を含む要素: {len(matching_elements)}個")
-                        items.extend(matching_elements)
-                    except Exception as e:
-                        print(f"[{target_name}] テキスト検索エラー: {e}")
+                await page.reload(wait_until="domcontentloaded", timeout=1000)
+            except Exception:
+                # reloadが失敗した場合（初回など）はgotoを使用
+                await page.goto(url, wait_until="domcontentloaded", timeout=1000)
+        
+            # リダイレクトを検知（アクセス過多ページなどに飛ばされた場合）
+            current_url = page.url
+            if current_url != url and ("error" in current_url.lower() or "access" in current_url.lower() or "too" in current_url.lower()):
+                print(f"[{target_name}] 警告: リダイレクトが検知されました。現在のURL: {current_url}")
+                # HTTPで既に記録した場合は2回数えない
+                if schedule and not detection["redirected"]:
+                    schedule.record_redirect()
+                detection["redirected"] = True
+                # リダイレクトされた場合は少し待ってから再試行
+                await asyncio.sleep(1)
+                await page.goto(url, wait_until="domcontentloaded", timeout=1000)
+            elif schedule:
+                schedule.record_ok()
+            timings["load_ms"] = round((time.perf_counter() - load_started) * 1000, 1)
 
-                if not items:
-                    print(f"[{target_name}] キーワードを含む要素が見つかりませんでした")
-                    return detected_any, detected_links, notified_new
-        else:
-            # selectorが未指定の場合もキーワードで検索
-            items = []
-            used_fallback_text_search = True
-            for td in target_dates:
-                try:
-                    matching_elements = await page.get_by_text(td, exact=False).all()
-                    items.extend(matching_elements)
-                except Exception as e:
-                    print(f"[{target_name}] テキスト検索エラー: {e}")
+        if blocks is None:
+            # セレクタが指定されている場合は待機、なければキーワードで検索
+            extract_started = time.perf_counter()
+            blocks, used_fallback_text_search, detection["dom_html"] = await extract_blocks_async(
+                page, target_name, selector, target_dates, archive=archive_mode, timings=timings
+            )
+            detection["fallback"] = used_fallback_text_search
+            # セレクタの待機時間を除いた抽出（evaluate）の時間
+            timings["extract_ms"] = round(
+                (time.perf_counter() - extract_started) * 1000 - timings.get("wait_selector_ms", 0), 1
+            )
+            if not blocks:
+                timings["check_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                return detected_any, detected_links, notified_new, detection
 
-        print(f"[{target_name}] {len(items)}個の要素を処理開始")
+        print(f"[{target_name}] {len(blocks)}個の要素を処理開始")
+        detection["links"] = []
+        match_started = time.perf_counter()
 
-        for idx, item in enumerate(items):
+        for idx, (text, seat_type, href) in enumerate(blocks):
             try:
-                # 席種情報を取得（詳細ページ用、常に取得を試みる）
-                seat_type = None
-                try:
-                    # valiationの値を取得
-                    valiation_input = item.locator('input.valiation').first
-                    if await valiation_input.count() > 0:
-                        seat_type = await valiation_input.get_attribute('value')
-                    else:
-                        # ticketSelect__textから席種名を抽出
-                        text_elem = item.locator('.ticketSelect__text').first
-                        if await text_elem.count() > 0:
-                            text_content = await text_elem.inner_text()
-                            # 「Ａ席 7,000円」から「Ａ席」を抽出（最初のスペースまで）
-                            if ' ' in text_content:
-                                seat_type = text_content.split(' ')[0]
-                            else:
-                                seat_type = text_content
-                except Exception as e:
-                    # 席種情報が取得できない場合（親ページなど）はスキップ
-                    pass
-                
                 # 席種指定がある場合、席種の一致チェックを行う
+                # （部分一致:「Ｓ席」で「注釈付きＳ席」も検知、全角・半角を考慮）
                 if detail_seat_types and seat_type:
-                    seat_matched = False
-                    # 席種を正規化（全角英数字を半角に変換）
-                    normalized_seat_type = normalize_alphabet(seat_type)
-                    for seat_pattern in detail_seat_types:
-                        # パターンも正規化
-                        normalized_pattern = normalize_alphabet(seat_pattern)
-                        # 部分一致でチェック（「Ｓ席」で「注釈付きＳ席」も検知、全角・半角を考慮）
-                        if normalized_pattern in normalized_seat_type or normalized_seat_type in normalized_pattern:
-                            seat_matched = True
-                            print(f"[{target_name}] 席種一致: '{seat_type}' (パターン: '{seat_pattern}')")
-                            break
-                    
-                    if not seat_matched:
+                    seat_pattern = matcher.match_seat(seat_type)
+                    if seat_pattern is None:
                         print(f"[{target_name}] 席種不一致: '{seat_type}' (指定席種: {detail_seat_types})")
                         continue
+                    print(f"[{target_name}] 席種一致: '{seat_type}' (パターン: '{seat_pattern}')")
 
-                # innerText を evaluate で確実に取得（タイムアウト付き、短縮して高速化）
-                text = await item.evaluate("el => el.innerText || ''", timeout=2000)
-                text = normalize(text)
-
-                # 部分一致で各ターゲット日付をチェック
-                # スペースを正規化して比較
-                normalized_text = ' '.join(text.split())
+                # 改行を除去し、全角英数字・空白を正規化して比較
+                normalized_text = normalize_match_text(normalize(text))
                 
                 # 詳細ページ（席種フィルタを使っている場合）は、座席ブロック内に日付が無いことが多いので日付チェックをスキップ
                 # それ以外は、従来通り target_dates が空のときだけスキップ
                 date_matched = (is_detail_page_target and bool(detail_seat_types)) or (len(target_dates) == 0)
                 matched_date = ""
                 
-                for td in target_dates:
-                    normalized_td = ' '.join(td.split())
-
-                    if normalized_td in normalized_text:
-                        print(f"[{target_name}] 対象枠検出: {td}")
-                        date_matched = True
-                        matched_date = td
-                        break
+                # 部分一致で各ターゲット日付をチェック（全日付を1回の走査で照合）
+                found_date, normalized_matched_date, date_pos = matcher.match_date(normalized_text)
+                if found_date is not None:
+                    print(f"[{target_name}] 対象枠検出: {found_date}")
+                    date_matched = True
+                    matched_date = found_date
                 
                 if not date_matched:
                     continue
 
                 # このブロック内にdetect_textが含まれているかチェック
-                # detect_textも正規化して比較
-                normalized_detect = ' '.join(detect_text.split()) if detect_text else ""
+                normalized_detect = matcher.normalized_detect
 
                 print(f"[{target_name}] detect_text検索: '{normalized_detect}' in text")
 
@@ -277,14 +355,12 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
                     if used_fallback_text_search:
                         # フォールバック(get_by_text)は「広い要素」を掴んで別ブロックの文言まで含むことがある。
                         # そのため、target_dates(=matched_date)の近傍に detect_text がある場合のみ検知扱いにする。
-                        normalized_matched_date = ' '.join(matched_date.split()) if matched_date else ""
-                        idx = normalized_text.find(normalized_matched_date) if normalized_matched_date else -1
                         # 近傍ウィンドウ（前後）: 誤検知しやすいヘッダー/フッター混入を避けるため小さめに制限
                         window_before = 50
                         window_after = 250
-                        if idx >= 0:
-                            start = max(0, idx - window_before)
-                            end = min(len(normalized_text), idx + len(normalized_matched_date) + window_after)
+                        if matched_date and date_pos >= 0:
+                            start = max(0, date_pos - window_before)
+                            end = min(len(normalized_text), date_pos + len(normalized_matched_date) + window_after)
                             near_text = normalized_text[start:end]
                         else:
                             # 日付位置が取れない場合は安全側に倒してスキップ（フォールバック誤検知を防ぐ）
@@ -301,7 +377,13 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
                             continue
 
                 print(f"[{target_name}] ブロック内に'{detect_text}'を検出！")
+                if not detected_any:
+                    detection["matched_date"] = matched_date or None
+                    detection["seat_type"] = seat_type
                 detected_any = True
+                if enable_detail_watch and href:
+                    # 詳細ページの監視を続けるかの判定用（通知済みでも記録する）
+                    detection["links"].append(href if href.startswith('http') else urljoin(url, href))
 
                 # 詳細ページかどうか（通知メッセージ・通知キー用）
                 is_detail_page = is_detail_page_target
@@ -319,30 +401,20 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
                     notify_key = f"{key_mode}||親||{target_name}||{url}||{matched_date}||{detect_text}||"
 
                 # 既に通知済みかチェック
-                if notified_lock:
-                    async with notified_lock:
-                        was_notified = notify_key in notified
-                else:
-                    was_notified = notify_key in notified
-                if was_notified:
+                if notified_store.contains(notify_key):
                     print(f"[{target_name}] 既に通知済み（スキップ）: {notify_key}")
                     # 既に通知済みの場合は検知状態は維持されている（変化なし）
                     continue
 
                 # 詳細ページ監視が有効な場合、リンクを取得
                 detail_link = None
-                if enable_detail_watch:
-                    try:
-                        # 要素内の最初の<a>タグのhrefを取得
-                        link_element = item.locator('a').first
-                        if link_element.count() > 0:
-                            detail_link = link_element.get_attribute('href')
-                            # 相対URLの場合は絶対URLに変換
-                            if detail_link and not detail_link.startswith('http'):
-                                detail_link = urljoin(url, detail_link)
-                            print(f"[{target_name}] 詳細ページリンクを取得: {detail_link}")
-                    except Exception as e:
-                        print(f"[{target_name}] リンク取得エラー: {e}")
+                if enable_detail_watch and href:
+                    # 要素内の最初の<a>タグのhref（抽出時に取得済み）
+                    detail_link = href
+                    # 相対URLの場合は絶対URLに変換
+                    if not detail_link.startswith('http'):
+                        detail_link = urljoin(url, detail_link)
+                    print(f"[{target_name}] 詳細ページリンクを取得: {detail_link}")
 
                 now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 
@@ -366,20 +438,13 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
                     use_broadcast = cfg.get("use_broadcast", False)
                 
                 # 非同期で通知送信（LINEとメールを並列実行、メインスレッドはブロックされない）
-                send_notifications_async(cfg, message, target_name, use_broadcast=use_broadcast)
-
-                if notified_lock:
-                    async with notified_lock:
-                        notified.add(notify_key)
-                        # ターゲット単位で「通知済みキー」を紐付けて保持（消えたら解除して再出現で再通知できるようにする）
-                        if target_key not in notified_by_target:
-                            notified_by_target[target_key] = set()
-                        notified_by_target[target_key].add(notify_key)
+                if notify:
+                    notify(target_key, notify_key, message, target_name, use_broadcast)
                 else:
-                    notified.add(notify_key)
-                    if target_key not in notified_by_target:
-                        notified_by_target[target_key] = set()
-                    notified_by_target[target_key].add(notify_key)
+                    send_notifications_async(cfg, message, target_name, use_broadcast=use_broadcast)
+
+                # ターゲット単位で「通知済みキー」を紐付けて保持（消えたら解除して再出現で再通知できるようにする）
+                notified_store.add(target_key, notify_key)
                 notified_new = True
                 
                 # リンクがある場合は保存
@@ -394,38 +459,119 @@ async def check_target_async(page, target_config, cfg, notified, notified_by_tar
                 break  # 1つ見つかったらこの日付のチェック終了
 
             except Exception as e:
-                print(f"[{target_name}] [{idx+1}/{len(items)}] 要素処理エラー: {e}")
+                print(f"[{target_name}] [{idx+1}/{len(blocks)}] 要素処理エラー: {e}")
                 continue
+        timings["match_ms"] = round((time.perf_counter() - match_started) * 1000, 1)
 
     except Exception as e:
         print(f"[{target_name}] チェック中エラー:", e)
+        detection["error"] = True
+        detection["error_message"] = str(e) or type(e).__name__
+
+    timings["check_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return detected_any, detected_links, notified_new, detection
+
+async def warm_up_target_async(page, target_config, cfg, http_fetcher=None, notify=None):
+    """販売開始前のウォームアップ
+    DNSの事前解決、接続の事前確立（ページの開き直し）、ログイン状態の確認を行う。
+    ログイン状態は login_check_selector（ログイン中に存在する要素）または
+    login_check_text（ログイン中に表示される文言）で確認し、切れていれば通知する。
+    """
+    target_name = target_config["name"]
+    url = target_config["url"]
+    print(f"[{target_name}] 販売開始前のウォームアップを実行します")
+
+    # DNSを事前解決（OSのキャッシュに載せる）
+    parsed = urlparse(url)
+    try:
+        await asyncio.get_running_loop().getaddrinfo(parsed.hostname, parsed.port or 443)
+    except Exception as e:
+        print(f"[{target_name}] DNS事前解決エラー（無視）: {e}")
 
-    return detected_any, detected_links, notified_new
+    # 接続を事前に確立
+    if target_config.get("fetch_mode") == "http" and http_fetcher:
+        await http_fetcher.warm_up(url)
+    try:
+        await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+    except Exception as e:
+        print(f"[{target_name}] ウォームアップ時のページ読み込みエラー: {e}")
+        return
+
+    # ログイン状態を確認
+    login_check_selector = target_config.get("login_check_selector")
+    login_check_text = target_config.get("login_check_text")
+    if not login_check_selector and not login_check_text:
+        return
+    try:
+        logged_in = True
+        if login_check_selector:
+            logged_in = await page.locator(login_check_selector).count() > 0
+        if logged_in and login_check_text:
+            logged_in = login_check_text in await page.inner_text("body")
+    except Exception as e:
+        print(f"[{target_name}] ログイン状態の確認エラー: {e}")
+        return
+    if logged_in:
+        print(f"[{target_name}] ログイン状態を確認しました")
+    else:
+        message = f"[{target_name}] ログイン状態が確認できません。販売開始前に再ログインしてください。\n{url}"
+        print(message)
+        if notify:
+            notify(None, None, message, target_name, False)
+        else:
+            send_notifications_async(cfg, message, target_name)
 
-async def run_watcher_async(notification_config=None):
+async def run_watcher_async(notification_config=None, targets=None, shard=None):
+    """監視のメインループ
+    targets を指定した場合は config.json の watch_targets の代わりに監視する。
+    shard（shard.ShardLink）を渡すとシャードのワーカーとして動作し、通知済みの判定・通知の送信・
+    検知ログはスーパーバイザーに任せる
+    """
     cfg = load_config()
     chrome_path = cfg["chrome_path"]
     user_data_dir = f'{cfg["user_data_dir"]}\\{cfg["profile"]}'
-    interval = cfg["check_interval_sec"]
-    stop_after_detection = cfg.get("stop_after_detection", False)
     headless = cfg.get("headless", False)
-    watch_targets = cfg.get("watch_targets", [])
+    watch_targets = targets if targets is not None else cfg.get("watch_targets", [])
+    # ブラウザの起動方式（shared: 少数のブラウザを共有 / per_target: ターゲットごとに起動）
+    browser_mode = cfg.get("browser_mode", "shared")
+    browser_pool_size = max(1, int(cfg.get("browser_pool_size", 1)))
 
     if not watch_targets:
         print("監視対象が設定されていません。config.jsonのwatch_targetsを確認してください。")
         return
 
-    # 既通知をランタイムで管理（再通知防止）
-    notified = set()
-    # ターゲット単位で通知済みキーを保持（検知が消えたら解除して再出現で再通知）
-    # key: (target_name, url), value: set(notify_key)
-    notified_by_target = {}
-    # 各ターゲットの前回の検知状態を記録（検知状態の変化を検知するため）
-    # key: (target_name, url), value: True=検知中, False=未検知
-    previous_detection_states = {}
-    
-    # 非同期ロックを作成（共有データへのアクセス制御用）
-    notified_lock = asyncio.Lock()
+    if shard:
+        # シャードのワーカー: 通知済みの判定・通知の送信・検知ログはスーパーバイザーが1か所で行う
+        notify = shard.notify
+        notified_store = shard.create_store(cfg)
+        event_writer = shard
+        metrics.REGISTRY.const_labels = {"shard": shard.index}
+    else:
+        notify = None
+        # LINE APIへの接続を事前に確立し、検知時に接続済みの状態で送信できるようにする
+        # （LINE通知はこのイベントループ上で送信し、スレッドを経由しない）
+        line_keepalive_interval = cfg.get("line_keepalive_interval_sec", line_http.KEEPALIVE_INTERVAL_SEC)
+        line_sender = start_async_line_sender(cfg)
+        if line_sender:
+            line_sender.start_keepalive(line_keepalive_interval)
+        else:
+            line_http.start_keepalive(
+                cfg.get("line_channel_access_token"), interval=line_keepalive_interval,
+                base_url=cfg.get("line_api_base_url", line_http.LINE_API_BASE_URL),
+            )
+        # メールも同様に、認証済みのSMTP接続を事前に確立して維持する
+        mail_transport.start_keepalive(cfg)
+
+        # 既通知と各ターゲットの前回の検知状態をファイルに保存（再起動後も再通知しない）
+        # ターゲット単位で通知済みキーを保持し、検知が消えたら解除して再出現で再通知する
+        notified_store = NotifiedStore(
+            cfg.get("state_db_path", DEFAULT_DB_PATH),
+            ttl_sec=cfg.get("notified_ttl_sec", DEFAULT_TTL_SEC),
+        )
+        if len(notified_store):
+            print(f"通知済み状態を読み込みました（{len(notified_store)}件）")
+        # 検知イベントのログ（JSONL、バックグラウンドでまとめて書き込む）
+        event_writer = get_event_writer(cfg)
 
     print("=== 監視設定 ===")
     for idx, target in enumerate(watch_targets, 1):
@@ -433,7 +579,7 @@ async def run_watcher_async(notification_config=None):
         print(f"   URL: {target['url']}")
         print(f"   対象: {target['target_dates']}")
         print(f"   検知ワード: {target.get('detect_text', '')}")
-    print("検知後の動作:", "終了" if stop_after_detection else "継続監視")
+    print("検知後の動作:", "終了" if cfg.get("stop_after_detection", False) else "継続監視")
     print("ブラウザモード:", "Headless（バックグラウンド）" if headless else "表示")
     print("================\n")
 
@@ -441,45 +587,94 @@ async def run_watcher_async(notification_config=None):
         browser_args = ["--start-maximized"] if not headless else []
         
         # 各ターゲットごとに別のブラウザコンテキスト（ウィンドウ）を作成（並列処理で高速化）
-        browsers = []  # 各ターゲット用のブラウザ（launchしたブラウザインスタンス）
+        browsers = []  # launchしたブラウザインスタンス（共有モードではプールのサイズ分のみ）
         contexts = []  # 各ターゲット用のコンテキスト（ページを作成するためのコンテキスト）
         pages = []  # 各ターゲット用のページ
         target_configs = []  # 動的に追加される可能性があるため、リストで管理
+        # リソースブロック（key: (target_name, url), value: ResourceBlocker）
+        resource_blockers = {}
         
         # 最初のターゲット: persistent_contextを使用してCookieを取得（ログイン状態を保持）
-        first_browser_context = await p.chromium.launch_persistent_context(
-            user_data_dir=user_data_dir,
-            executable_path=chrome_path,
-            headless=headless,
-            args=browser_args
-        )
-        first_page = await first_browser_context.new_page()
-        await first_page.goto(watch_targets[0]['url'], wait_until="domcontentloaded", timeout=30000)
-        
-        # 最初のブラウザからCookieを取得（ログイン状態を共有するため）
-        shared_cookies = []
+        # シャードのワーカー同士で同じプロフィールを同時に開かないよう、開いている間はロックする
+        if shard:
+            await shard.acquire_profile()
         try:
-            shared_cookies = await first_browser_context.cookies()
-        except Exception as e:
-            print(f"Cookie取得エラー（無視）: {e}")
-        
-        # 最初のターゲットも通常のブラウザに切り替え（別ウィンドウとして開くため）
-        await first_browser_context.close()
-        
-        # すべてのターゲットで通常のブラウザを起動（別ウィンドウとして開く）
-        for idx, target in enumerate(watch_targets):
+            first_browser_context = await p.chromium.launch_persistent_context(
+                user_data_dir=user_data_dir,
+                executable_path=chrome_path,
+                headless=headless,
+                args=browser_args
+            )
+            first_page = await first_browser_context.new_page()
+            await first_page.goto(watch_targets[0]['url'], wait_until="domcontentloaded", timeout=30000)
+            
+            # 最初のブラウザからCookieを取得（ログイン状態を共有するため）
+            shared_cookies = []
             try:
-                # 通常のブラウザを起動（別ウィンドウ）
-                browser = await p.chromium.launch(
-                    executable_path=chrome_path,
-                    headless=headless,
-                    args=browser_args
-                )
-                browsers.append(browser)
+                shared_cookies = await first_browser_context.cookies()
+            except Exception as e:
+                print(f"Cookie取得エラー（無視）: {e}")
+            
+            # 最初のターゲットも通常のブラウザに切り替え（別ウィンドウとして開くため）
+            await first_browser_context.close()
+        finally:
+            if shard:
+                shard.release_profile()
+
+        # HTTP高速パス（fetch_mode: "http" のターゲットがある場合のみ、Cookieを引き継いで作成）
+        http_fetcher = None
+        if any(t.get("fetch_mode") == "http" for t in watch_targets):
+            if http_fetch.AVAILABLE:
+                http_fetcher = http_fetch.HttpFetcher(cookies=shared_cookies)
+            else:
+                print("HTTP高速パスに必要なライブラリ（httpx, lxml, cssselect）がありません。ブラウザで監視します。")
+
+        async def launch_browser():
+            """通常のブラウザを起動"""
+            browser = await p.chromium.launch(
+                executable_path=chrome_path,
+                headless=headless,
+                args=browser_args
+            )
+            browsers.append(browser)
+            return browser
+
+        async def get_browser(idx):
+            """ターゲットidx用のブラウザを取得
+            shared: プール内のブラウザをラウンドロビンで割り当て（足りなければ起動）
+            per_target: ターゲットごとに新しいブラウザを起動
+            """
+            if browser_mode == "per_target":
+                return await launch_browser()
+            if len(browsers) < browser_pool_size:
+                return await launch_browser()
+            return browsers[idx % browser_pool_size]
+
+        if browser_mode == "per_target":
+            print("ブラウザ: ターゲットごとに起動")
+        else:
+            print(f"ブラウザ: 共有（プール {browser_pool_size}個、ターゲットごとにコンテキストを分離）")
+
+        # 設定ファイルのターゲット（詳細ページを除く）の idx
+        configured = set()
+        # 監視中のURL（key: URL, value: idx）。詳細ページの重複チェックに使う
+        url_index = {}
+        # per_target モードでターゲット用に起動したブラウザ（key: idx）
+        target_browsers = {}
+
+        async def open_target(target):
+            """ターゲット用のコンテキストとページを開き、監視対象のリストに追加
+
+            Returns:
+                追加したターゲットの idx（ページを開けなかった場合は None）
+            """
+            idx = len(target_configs)
+            browser = context = page = None
+            try:
+                browser = await get_browser(idx)
                 
-                # 新しいコンテキストを作成
+                # 新しいコンテキストを作成（ターゲットごとにCookie・キャッシュを分離）
                 context = await browser.new_context()
-                contexts.append(context)
                 
                 # 最初のブラウザからCookieをコピー（ログイン状態を共有）
                 if shared_cookies:
@@ -488,218 +683,723 @@ async def run_watcher_async(notification_config=None):
                     except Exception as e:
                         print(f"[{target['name']}] Cookieコピーエラー（無視）: {e}")
                 
+                # リソースブロック（画像・フォント等を中断）。初回ロードから中断する
+                block_profile = resolve_block_profile(cfg, target)
+                if block_profile:
+                    blocker = ResourceBlocker(block_profile, target['name'])
+                    try:
+                        await blocker.install(context)
+                        resource_blockers[(target['name'], target['url'])] = blocker
+                    except Exception as e:
+                        print(f"[{target['name']}] リソースブロックの設定エラー（中断せずに続行）: {e}")
+                
                 # 各コンテキストで1つのページを開く
                 page = await context.new_page()
                 
                 print(f"[{target['name']}] ウィンドウを開いています: {target['url']}")
                 # 初期ロードはdomcontentloadedで十分（networkidleはタイムアウトしやすい）
                 await page.goto(target['url'], wait_until="domcontentloaded", timeout=30000)
-                pages.append(page)
-                target_configs.append(target)
             except Exception as e:
                 print(f"[{target['name']}] 初期ロードエラー: {e}")
-                print(f"[{target['name']}] タイムアウトしましたが、監視を続行します")
-                # エラーが発生してもブラウザとページは作成されている可能性があるので、追加を試みる
-                try:
-                    browsers.append(browser)
-                    contexts.append(context)
-                    pages.append(page)
-                    target_configs.append(target)
-                except:
+                # エラーが発生してもページが作成されていれば監視を続行する
+                if page is None:
                     print(f"[{target['name']}] ブラウザ/ページの追加に失敗しました。スキップします")
+                    return None
+                print(f"[{target['name']}] タイムアウトしましたが、監視を続行します")
+            contexts.append(context)
+            pages.append(page)
+            target_configs.append(target)
+            configured.add(idx)
+            url_index[target['url']] = idx
+            if browser_mode == "per_target" and browser is not None:
+                target_browsers[idx] = browser
+            return idx
+
+        # すべてのターゲットでコンテキストを作成（各コンテキストは別ウィンドウとして開く）
+        for target in watch_targets:
+            await open_target(target)
 
         print("\n全ウィンドウの初期ロード完了。監視を開始します。\n")
 
-        while True:
+        # ページ単位のロック（ライブ監視の即時チェックと定期リロードが同じページで重ならないようにする）
+        page_locks = {}
+
+        # コンパイル済みの検知条件（key: id(ターゲット設定), value: TargetMatcher）
+        matchers = {id(t): TargetMatcher(t) for t in target_configs}
+        # 詳細ページのタブ（上限・未使用時間での終了と使い回し）
+        detail_pool = DetailPagePool(
+            max_pages=cfg.get("detail_max_pages", DETAIL_MAX_PAGES),
+            idle_sec=cfg.get("detail_idle_sec", DETAIL_IDLE_SEC),
+            retire_misses=cfg.get("detail_retire_misses", DETAIL_RETIRE_MISSES),
+            spare_pages=cfg.get("detail_spare_pages", DETAIL_SPARE_PAGES),
+        )
+
+        def get_matcher(target):
+            matcher = matchers.get(id(target))
+            if matcher is None:
+                matcher = matchers[id(target)] = TargetMatcher(target)
+            return matcher
+
+        # 現在の状態（controller.py の /status が読むファイルに定期的に書き出す）
+        status_board = watch_status.StatusBoard()
+
+        # 検知時のHTMLのアーカイブ（dom_archive が有効なターゲットのみ使用）
+        dom_archive = DomArchive(cfg.get("dom_archive_dir", DOM_ARCHIVE_DIR))
+
+        # 証跡のスクリーンショット（監視中のページとは別のキャプチャページで撮影）
+        evidence_capturer = None
+        if browsers:
+            evidence_capturer = EvidenceCapturer(
+                browsers[0],
+                cookies=shared_cookies,
+                image_format=cfg.get("screenshot_format", "jpeg"),
+                quality=cfg.get("screenshot_quality", 70),
+            )
+
+        async def submit_evidence(target, page, lock, detection, state_change, timestamp, page_html=None):
+            """検知状態が変化した時点のDOMを保存し、撮影をキューに追加
+            page_html（検知と同じevaluateで取得したページ全体のHTML）があれば、それを使う
+            """
+            if evidence_capturer is None:
+                return
+            if evidence_capturer.browser is None and browsers:
+                evidence_capturer.set_browser(browsers[0])
+            if evidence_capturer.browser is None:
+                return
+            selector = target.get("selector", "")
+            needle = detection.get("matched_date")
             try:
-                any_new_notification = False
-                any_detected = False
-                new_detail_targets = []  # 新しく追加する詳細ページ監視対象
+                cached = None
+                if detection.get("source") == "http" and http_fetcher:
+                    cached = http_fetcher.last_html(target["url"], selector)
+                if cached:
+                    snapshot = snapshot_from_html(cached[0], cached[1], needle)
+                elif page_html:
+                    snapshot = snapshot_from_html(page_html, page.url, needle)
+                else:
+                    async with lock:
+                        snapshot = await take_snapshot(page, selector, needle)
+                evidence_capturer.submit(snapshot, target["name"], selector, state_change, timestamp)
+            except Exception as e:
+                print(f"[{target['name']}] スナップショット取得エラー: {e}")
+
+        async def check_target_wrapper(idx, target, page, context, reload=True, deadline=None, schedule=None):
+            """各ターゲットのチェックを非同期で実行
+            deadline秒以内にチェックが終わらない場合は asyncio.TimeoutError を送出する（検知状態は更新しない）
+            """
+            try:
+                # check_target_asyncを実行（ロックは内部で必要な部分だけ使用）
+                lock = page_locks.setdefault(id(page), asyncio.Lock())
+                async with lock:
+                    detected_any, detected_links, notified_new, detection = await asyncio.wait_for(
+                        check_target_async(
+                            page, target, cfg, notified_store, notification_config,
+                            http_fetcher=http_fetcher, reload=reload, schedule=schedule,
+                            matcher=get_matcher(target), archive_mode=resolve_archive_mode(cfg, target),
+                            notify=notify
+                        ),
+                        timeout=deadline
+                    )
+                record_check_metrics(target["name"], detected_any, detection)
+                status_board.record_check(target, detected_any, detection)
                 
-                # すべてのターゲットを並列でチェック（asyncio.gatherで並列実行）
-                async def check_target_wrapper(idx, target, page, context):
-                    """各ターゲットのチェックを非同期で実行"""
-                    try:
-                        # check_target_asyncを実行（ロックは内部で必要な部分だけ使用）
-                        detected_any, detected_links, notified_new = await check_target_async(
-                            page, target, cfg, notified, notified_by_target, notification_config, notified_lock
-                        )
-                        
-                        # 検知状態の変化をチェック
-                        target_key = (target["name"], target["url"])
-                        current_state = detected_any  # True=検知中, False=未検知
-                        
-                        async with notified_lock:
-                            previous_state = previous_detection_states.get(target_key, False)
-                        
-                        # 検知状態が変化した場合
-                        state_change = None
-                        if current_state != previous_state:
-                            if current_state and not previous_state:
-                                # 検知文言が現れた
-                                state_change = "appeared"
-                            elif not current_state and previous_state:
-                                # 検知文言が消えた
-                                state_change = "disappeared"
-                                # 「検知→検知なし→検知」で再通知できるように、当該ターゲットの通知済みキーを解除
-                                async with notified_lock:
-                                    keys = notified_by_target.get(target_key, set())
-                                    if keys:
-                                        for k in list(keys):
-                                            if k in notified:
-                                                notified.remove(k)
-                                        notified_by_target[target_key] = set()
+                # 検知状態の変化をチェック
+                target_key = (target["name"], target["url"])
+                current_state = detected_any  # True=検知中, False=未検知
+                
+                previous_state = notified_store.get_state(target_key)
+                
+                # 検知状態が変化した場合
+                state_change = None
+                if current_state != previous_state:
+                    if current_state and not previous_state:
+                        # 検知文言が現れた
+                        state_change = "appeared"
+                    elif not current_state and previous_state:
+                        # 検知文言が消えた
+                        state_change = "disappeared"
+                        # 「検知→検知なし→検知」で再通知できるように、当該ターゲットの通知済みキーを解除
+                        notified_store.invalidate_target(target_key)
+                
+                # 検知時のHTMLをアーカイブ（状態変化・新規通知の時のみ、同じ内容は1回だけ保存）
+                dom_html = detection.pop("dom_html", None)
+                dom_snapshot = None
+                if dom_html and (state_change or notified_new):
+                    dom_snapshot = dom_archive.store(dom_html)
+                    print(f"[{target['name']}] DOMスナップショット: {dom_archive.path_for(dom_snapshot)}")
+
+                if state_change:
+                    timestamp = datetime.now()
+                    detect_text = target.get("detect_text", "")
+                    
+                    # 証跡のスクリーンショット（DOMスナップショットをキャプチャページで撮影、ポーリングは待たない）
+                    page_html = dom_html if resolve_archive_mode(cfg, target) == "page" else None
+                    await submit_evidence(target, page, lock, detection, state_change, timestamp, page_html)
+                    # ログを非同期で記録
+                    log_detection_change_async(
+                        target["name"], 
+                        target["url"], 
+                        state_change, 
+                        timestamp,
+                        detect_text,
+                        matched_date=detection["matched_date"],
+                        seat_type=detection["seat_type"],
+                        timings=detection["timings"],
+                        dom_snapshot=dom_snapshot,
+                        writer=event_writer
+                    )
+                
+                # 現在の状態を記録
+                notified_store.set_state(target_key, current_state)
+                
+                # 詳細ページ監視が有効で、リンクが検知された場合
+                # タブを開くのは handle_result（上限・使い回しは detail_pool が決める。親ページのロックは持たない）
+                detail_configs_to_add = []
+                retire_details = []
+                if (target.get("enable_detail_watch", False) and detection["links"] is not None
+                        and not detection["error"] and not detection["redirected"] and not detection["fallback"]
+                        and not notified_new):
+                    # 親でリンクが検知されなくなった詳細ページは閉じる
+                    # ブロックを抽出して走査した上でリンクがなかった場合のみ数える（リダイレクト・抽出なし・フォールバック・エラーは数えない。
+                    # 新規通知したチェックは最初の1件で走査を打ち切るため、リンクが揃わない）
+                    retire_details = detail_pool.observe_parent(target_key, detection["links"])
+                if detected_links and target.get("enable_detail_watch", False):
+                    watch_all = target.get("watch_all_detected_links", False)
+                    links_to_watch = detected_links if watch_all else [detected_links[0]]  # 全てまたは最初の1つ
+                    
+                    for link_info in links_to_watch:
+                        detail_url = link_info['url']
+                        source_name = link_info['source_target']
+                        detected_date = link_info['detected_date']
                         
-                        if state_change:
-                            timestamp = datetime.now()
-                            detect_text = target.get("detect_text", "")
-                            
-                            # スクリーンショット取得をキューに追加（非同期処理）
-                            capture_screenshot_async(page, target["name"], target["url"], state_change, timestamp)
-                            # ログを非同期で記録
-                            log_detection_change_async(
-                                target["name"], 
-                                target["url"], 
-                                state_change, 
-                                timestamp,
-                                detect_text,
-                                matched_date=None,  # 詳細情報は必要に応じて追加
-                                seat_type=None
-                            )
+                        # 既に監視中のURLかチェック
+                        if detail_url in url_index:
+                            continue
                         
-                        # 現在の状態を記録
-                        async with notified_lock:
-                            previous_detection_states[target_key] = current_state
+                        # 詳細ページ用の設定を作成
+                        # detail_target_dates/detail_detect_textが未指定の場合は元の設定を使用
+                        detail_target_dates = target.get("detail_target_dates")
+                        if detail_target_dates is None or len(detail_target_dates) == 0:
+                            detail_target_dates = target.get("target_dates", [])
                         
-                        # 詳細ページ監視が有効で、リンクが検知された場合
-                        detail_configs_to_add = []
-                        if detected_links and target.get("enable_detail_watch", False):
-                            watch_all = target.get("watch_all_detected_links", False)
-                            links_to_watch = detected_links if watch_all else [detected_links[0]]  # 全てまたは最初の1つ
-                            
-                            for link_info in links_to_watch:
-                                detail_url = link_info['url']
-                                source_name = link_info['source_target']
-                                detected_date = link_info['detected_date']
-                                
-                                # 既に監視中のURLかチェック
-                                if any(t['url'] == detail_url for t in target_configs):
-                                    print(f"[{source_name}] 詳細ページは既に監視中です: {detail_url}")
-                                    continue
-                                
-                                # 詳細ページ用の設定を作成
-                                # detail_target_dates/detail_detect_textが未指定の場合は元の設定を使用
-                                detail_target_dates = target.get("detail_target_dates")
-                                if detail_target_dates is None or len(detail_target_dates) == 0:
-                                    detail_target_dates = target.get("target_dates", [])
-                                
-                                detail_detect_text = target.get("detail_detect_text")
-                                if detail_detect_text is None or detail_detect_text == "":
-                                    detail_detect_text = target.get("detect_text", "")
-                                
-                                detail_config = {
-                                    "name": f"{source_name} - 詳細({detected_date})",
-                                    "url": detail_url,
-                                    "selector": target.get("detail_selector", ""),
-                                    "target_dates": detail_target_dates,
-                                    "detect_text": detail_detect_text,
-                                    "enable_detail_watch": False,  # 詳細ページの詳細ページは監視しない
-                                    "button_selector": target.get("button_selector", ""),
-                                    "detail_seat_types": target.get("detail_seat_types", [])  # 席種指定
-                                }
-                                
-                                # 新しいタブを作成して監視対象に追加（親ページと同じブラウザコンテキストを使用）
-                                try:
-                                    # 親ページと同じコンテキストを使用
-                                    detail_page = await context.new_page()
-                                    print(f"[{detail_config['name']}] 詳細ページのタブを開いています: {detail_url}")
-                                    # domcontentloadedで十分（networkidleはタイムアウトしやすい）
-                                    await detail_page.goto(detail_url, wait_until="domcontentloaded", timeout=30000)
-                                    
-                                    detail_configs_to_add.append({
-                                        'page': detail_page,
-                                        'config': detail_config,
-                                        'context': context
-                                    })
-                                    
-                                    print(f"[{source_name}] 詳細ページ監視を開始しました: {detail_url}")
-                                except Exception as e:
-                                    print(f"[{source_name}] 詳細ページの読み込みエラー: {e}")
-                                    # エラーが発生してもページは作成されている可能性があるので、追加を試みる
-                                    try:
-                                        detail_configs_to_add.append({
-                                            'page': detail_page,
-                                            'config': detail_config,
-                                            'context': context
-                                        })
-                                        print(f"[{source_name}] エラーが発生しましたが、監視を続行します")
-                                    except:
-                                        print(f"[{source_name}] 詳細ページの追加に失敗しました。スキップします")
+                        detail_detect_text = target.get("detail_detect_text")
+                        if detail_detect_text is None or detail_detect_text == "":
+                            detail_detect_text = target.get("detect_text", "")
                         
-                        return {
-                            'detected_any': detected_any,
-                            'notified_new': notified_new,
-                            'detail_configs': detail_configs_to_add
+                        detail_config = {
+                            "name": f"{source_name} - 詳細({detected_date})",
+                            "url": detail_url,
+                            "selector": target.get("detail_selector", ""),
+                            "target_dates": detail_target_dates,
+                            "detect_text": detail_detect_text,
+                            "enable_detail_watch": False,  # 詳細ページの詳細ページは監視しない
+                            "button_selector": target.get("button_selector", ""),
+                            "detail_seat_types": target.get("detail_seat_types", []),  # 席種指定
+                            "schedule": target.get("schedule")  # 販売開始時刻に合わせた間隔調整は親と同じ
                         }
-                    except Exception as e:
-                        print(f"[{target['name']}] チェックエラー: {e}")
-                        return {
-                            'detected_any': False,
-                            'notified_new': False,
-                            'detail_configs': []
-                        }
-                
-                # すべてのターゲットを並列でチェック（asyncio.gatherで並列実行）
-                tasks = []
-                for idx, target in enumerate(target_configs):
-                    page = pages[idx]
-                    context = contexts[idx]
-                    tasks.append(check_target_wrapper(idx, target, page, context))
-                
-                # すべてのタスクを並列で実行
-                results = await asyncio.gather(*tasks)
-                
-                # 結果を統合
-                for result in results:
-                    any_detected = any_detected or result['detected_any']
-                    any_new_notification = any_new_notification or result['notified_new']
-                    
-                    # 詳細ページを追加
-                    for detail_info in result['detail_configs']:
-                        pages.append(detail_info['page'])
-                        target_configs.append(detail_info['config'])
-                        contexts.append(detail_info['context'])
-                        new_detail_targets.append(detail_info['config']['name'])
+                        
+                        # 親ページと同じブラウザコンテキストで開く
+                        detail_configs_to_add.append({
+                            'config': detail_config,
+                            'context': context,
+                            'parent': target_key
+                        })
                 
-                if new_detail_targets:
-                    print(f"新しく追加された監視対象: {', '.join(new_detail_targets)}")
-
-                # スクリーンショットキューを処理（非同期で追加されたスクリーンショットを取得）
-                # 検知速度を優先するため、スクリーンショット処理は最小限に（最大1件まで、高速化）
-                processed_count = await process_screenshot_queue()
-                if processed_count > 0:
-                    print(f"スクリーンショットを{processed_count}件処理しました。")
-
-                if any_new_notification:
-                    print("新規検知→通知しました。")
-                    if stop_after_detection:
-                        print("stop_after_detection=true のため終了します。")
-                        break
+                return {
+                    'idx': idx,
+                    'name': target['name'],
+                    'detected_any': detected_any,
+                    'notified_new': notified_new,
+                    'detail_configs': detail_configs_to_add,
+                    'retire_details': retire_details
+                }
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                print(f"[{target['name']}] チェックエラー: {e}")
+                status_board.record_error(target, e)
+                return {
+                    'idx': idx,
+                    'name': target['name'],
+                    'detected_any': False,
+                    'notified_new': False,
+                    'detail_configs': [],
+                    'retire_details': []
+                }
+
+        # ターゲットごとの監視ループ（key: id(page), value: asyncio.Task）
+        # 1つのターゲットが遅くても他のターゲットのチェック間隔に影響しないよう、ターゲットごとに独立して回す
+        watch_tasks = {}
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # 停止（SIGTERM）は stop_event で通常の終了処理に回す（送信中の通知を送り切ってから終了する）
+        # sys.exit で抜けると asyncio.run が送信中のタスクもまとめてキャンセルしてしまう
+        try:
+            loop.add_signal_handler(signal.SIGTERM, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows など（起動時の signal.signal による終了のまま）
+            pass
+        # 一時停止（warm_standby）: 監視ループは active がセットされるまで待つ（ブラウザ・ページは開いたまま）
+        active = asyncio.Event()
+        active.set()
+        # 制御チャネルの待ち受けスレッドから参照する状態（イベントループを経由せずに応答する）
+        pause_state = {"paused": False, "since": None}
+
+        # ライブ監視（watch_mode: "live"）: DOM変化の通知で即座にチェックし、リロードは長い間隔でのみ行う
+        # key: id(page), value: asyncio.Event
+        live_events = {}
+
+        async def wait_stop(timeout):
+            """指定秒数待機（終了が決まった場合は即座に戻る）"""
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=max(0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+        async def open_detail_page(detail_info):
+            """詳細ページを開いて監視を開始（空ページがあれば使い回す）"""
+            detail_config, context = detail_info['config'], detail_info['context']
+            detail_url = detail_config['url']
+            source_name = detail_info['parent'][0]
+            if len(detail_pool) >= detail_pool.max_pages:
+                print(f"[{source_name}] 詳細ページの上限（{detail_pool.max_pages}）に達しているため開きません: {detail_url}")
+                return
+            try:
+                detail_page = await detail_pool.acquire_page(context)
+            except Exception as e:
+                print(f"[{source_name}] 詳細ページの追加に失敗しました。スキップします: {e}")
+                return
+            print(f"[{detail_config['name']}] 詳細ページのタブを開いています: {detail_url}")
+            try:
+                # domcontentloadedで十分（networkidleはタイムアウトしやすい）
+                await detail_page.goto(detail_url, wait_until="domcontentloaded", timeout=30000)
+                print(f"[{source_name}] 詳細ページ監視を開始しました: {detail_url}")
+            except Exception as e:
+                # エラーが発生してもページは作成されているので、監視を続行する
+                print(f"[{source_name}] 詳細ページの読み込みエラー: {e}")
+                print(f"[{source_name}] エラーが発生しましたが、監視を続行します")
+            if detail_url in url_index:
+                # 読み込み中に別のチェックが同じURLを追加した
+                await detail_pool.release_page(detail_page, context)
+                return
+            idx = len(target_configs)
+            pages.append(detail_page)
+            target_configs.append(detail_config)
+            contexts.append(context)
+            url_index[detail_url] = idx
+            detail_pool.add(detail_url, idx, detail_info['parent'], context)
+            print(f"新しく追加された監視対象: {detail_config['name']}")
+            # 追加された詳細ページはすぐに監視ループを開始する
+            start_watch_loop(idx)
+
+        async def handle_result(result):
+            """チェック結果を反映（詳細ページの追加・終了、stop_after_detection の判定）"""
+            if result['detected_any'] and detail_pool.is_detail(result['idx']):
+                detail_pool.touch(result['idx'])
+            for idx in result['retire_details']:
+                if target_configs[idx] is not None:
+                    print(f"[{result['name']}] リンクが検知されなくなったため詳細ページの監視を終了します: {target_configs[idx]['url']}")
+                    await close_target(idx)
+            if not detail_pool.is_detail(result['idx']) and len(detail_pool):
+                # 上限を超える分・長く使われていない詳細ページを閉じてから開く
+                new_details = [d for d in result['detail_configs'] if d['config']['url'] not in url_index]
+                for idx in detail_pool.evictions(len(new_details)):
+                    if target_configs[idx] is not None:
+                        print(f"[{target_configs[idx]['name']}] 詳細ページの上限・未使用のため監視を終了します")
+                        await close_target(idx)
+            for detail_info in result['detail_configs'][:detail_pool.max_pages]:
+                if detail_info['config']['url'] not in url_index:
+                    await open_detail_page(detail_info)
+            if result['notified_new']:
+                print(f"[{result['name']}] 新規検知→通知しました。")
+                if cfg.get("stop_after_detection", False):
+                    print("stop_after_detection=true のため終了します。")
+                    stop_event.set()
+
+        async def target_watch_loop(idx):
+            """1ターゲット分の監視ループ（間隔・ゆらぎ・タイムアウトはターゲットごと）"""
+            target = target_configs[idx]
+            page = pages[idx]
+            context = contexts[idx]
+            name = target['name']
+            live_event = live_events.get(id(page))
+
+            def schedule_settings():
+                """間隔の設定（再読み込みで変わった場合はスケジュールを作り直す）"""
+                if live_event:
+                    # ライブ監視中は安全のためのリロードのみ定期実行
+                    return {}, target.get("live_reload_interval_sec", 60)
+                # 販売開始時刻（schedule.sale_start_at）に合わせて間隔を調整
+                return {"schedule": target.get("schedule")}, target.get("check_interval_sec", cfg["check_interval_sec"])
+
+            settings = schedule_settings()
+            schedule = PollSchedule(*settings)
+
+            next_at = loop.time()
+            # 予定したチェック開始時刻（ゆらぎを含む）。実際の開始との差をメトリクスに記録する
+            planned_at = None
+            while not stop_event.is_set():
+                if not active.is_set():
+                    # 一時停止中は再開まで待ち、再開したらすぐにチェックする
+                    await active.wait()
+                    next_at = loop.time()
+                    planned_at = None
+                # 間隔・ゆらぎ・タイムアウトは毎回読み直す（設定の再読み込みを次のチェックから反映）
+                if schedule_settings() != settings:
+                    settings = schedule_settings()
+                    schedule = PollSchedule(*settings)
+                jitter = target.get("interval_jitter_sec", cfg.get("interval_jitter_sec", 0))
+                deadline = target.get("check_timeout_sec", cfg.get("check_timeout_sec", 15))
+                if planned_at is not None:
+                    metrics.observe("ticket_watcher_poll_jitter_seconds", max(0.0, loop.time() - planned_at), target=name)
+                if schedule.warmup_due():
+                    schedule.mark_warmed_up()
+                    async with page_locks.setdefault(id(page), asyncio.Lock()):
+                        await warm_up_target_async(page, target, cfg, http_fetcher, notify=notify)
+                result = None
+                try:
+                    result = await check_target_wrapper(idx, target, page, context, deadline=deadline, schedule=schedule)
+                    await handle_result(result)
+                except asyncio.TimeoutError:
+                    metrics.inc("ticket_watcher_checks_total", target=name, result="timeout")
+                    status_board.record_error(target, f"{deadline}s以内に終わりませんでした")
+                    print(f"[{name}] チェックが{deadline}s以内に終わりませんでした（次回に持ち越し）")
+                except Exception as e:
+                    print(f"[{name}] 監視ループ例外:", e)
+                # 次の間隔は1回だけ求め、ログと待ち時間の両方に使う
+                target_interval = schedule.next_interval()
+                if result is not None and not result['notified_new']:
+                    if result['detected_any']:
+                        # 検知はあったが通知済みでスキップされたケース
+                        print(f"{datetime.now():%H:%M:%S} [{name}] 検知あり（通知済みのため通知なし）。{target_interval:g}s後再試行。")
                     else:
-                        print("継続監視します。次ループまで待機します。")
-                        await asyncio.sleep(interval)
-                        continue
+                        print(f"{datetime.now():%H:%M:%S} [{name}] 新規検知なし。{target_interval:g}s後再試行。")
+                if schedule.redirect_streak:
+                    print(f"[{name}] アクセス過多のため間隔を{target_interval:.1f}sに延長します（連続{schedule.redirect_streak}回）")
 
-                if any_detected:
-                    # 検知はあったが通知済みでスキップされたケース
-                    print(f"{datetime.now():%H:%M:%S} - 検知あり（通知済みのため通知なし）。{interval}s後再試行。")
+                # 一定間隔で実行（遅れた場合は詰めて連続実行せず、現在時刻から数え直す）
+                next_at = max(next_at + target_interval, loop.time())
+                delay = next_at - loop.time()
+                if jitter:
+                    delay += random.uniform(0, jitter)
+                planned_at = loop.time() + delay
+                await wait_stop(delay)
+
+        async def live_watch_loop(idx):
+            """DOM変化の通知を待ち、リロードせずにチェックする"""
+            target = target_configs[idx]
+            event = live_events[id(pages[idx])]
+            while not stop_event.is_set():
+                await event.wait()
+                await active.wait()
+                event.clear()
+                print(f"[{target['name']}] DOM変化を検知しました（ライブ監視）")
+                try:
+                    result = await check_target_wrapper(idx, target, pages[idx], contexts[idx], reload=False)
+                    await handle_result(result)
+                except Exception as e:
+                    # 1回の失敗（詳細ページを開く際のエラーなど）でライブ監視を止めない
+                    print(f"[{target['name']}] ライブ監視ループ例外:", e)
+
+        def start_watch_loop(idx):
+            page = pages[idx]
+            watch_tasks[id(page)] = asyncio.create_task(target_watch_loop(idx))
+
+        # ライブ監視のループ（key: id(page), value: asyncio.Task）
+        live_tasks = {}
+
+        async def start_target(idx):
+            """ターゲットの監視を開始（ライブ監視の場合は監視スクリプトを先に仕込む）"""
+            target = target_configs[idx]
+            if target.get("watch_mode") == "live":
+                event = asyncio.Event()
+                try:
+                    await install_live_observer(pages[idx], target, lambda href, ev=event: ev.set())
+                except Exception as e:
+                    print(f"[{target['name']}] ライブ監視の開始エラー（通常の監視を続行）: {e}")
                 else:
-                    print(f"{datetime.now():%H:%M:%S} - 新規検知なし。{interval}s後再試行。")
-                await asyncio.sleep(interval)
+                    live_events[id(pages[idx])] = event
+                    live_tasks[id(pages[idx])] = asyncio.create_task(live_watch_loop(idx))
+                    print(f"[{target['name']}] ライブ監視を開始しました（安全のためのリロード: {target.get('live_reload_interval_sec', 60)}s間隔）")
+            start_watch_loop(idx)
+
+        for idx in range(len(target_configs)):
+            await start_target(idx)
 
+        async def close_target(idx, reuse_page=True):
+            """ターゲットの監視を止めてページを閉じる（リストの位置は None にして残し、他の idx は変えない）
+            詳細ページのタブは reuse_page=True の場合、次の詳細ページで使い回すために残すことがある
+            """
+            page, context, target = pages[idx], contexts[idx], target_configs[idx]
+            tasks = [t for t in (watch_tasks.pop(id(page), None), live_tasks.pop(id(page), None)) if t]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            live_events.pop(id(page), None)
+            page_locks.pop(id(page), None)
+            matchers.pop(id(target), None)
+            is_detail = detail_pool.is_detail(idx)
+            pages[idx] = contexts[idx] = target_configs[idx] = None
+            configured.discard(idx)
+            detail_pool.remove(idx)
+            if url_index.get(target["url"]) == idx:
+                del url_index[target["url"]]
+            try:
+                # 設定ファイルのターゲットはコンテキストごと閉じる（詳細ページは親と同じコンテキストのタブのみ）
+                if idx in target_browsers:
+                    browser = target_browsers.pop(idx)
+                    browsers.remove(browser)
+                    if evidence_capturer and evidence_capturer.browser is browser:
+                        # キャプチャページも閉じるため、残っているブラウザで撮影する（なければ次に開いたブラウザ）
+                        evidence_capturer.set_browser(browsers[0] if browsers else None)
+                    await browser.close()
+                elif is_detail and reuse_page:
+                    await detail_pool.release_page(page, context)
+                elif is_detail:
+                    await page.close()
+                else:
+                    await detail_pool.close_spares(context)
+                    await context.close()
             except Exception as e:
-                print("監視ループ例外:", e)
-                await asyncio.sleep(interval)
+                print(f"[{target['name']}] ページのクローズエラー（無視）: {e}")
+            status_board.remove(target["name"])
+            print(f"[{target['name']}] 監視を終了しました")
+
+        async def retire_target(idx):
+            """設定ファイルから削除されたターゲットを、その詳細ページと合わせて閉じる"""
+            target_key = (target_configs[idx]["name"], target_configs[idx]["url"])
+            for child in detail_pool.children(target_key):
+                await close_target(child, reuse_page=False)
+            await close_target(idx)
+
+        # 設定の再読み込み（同時に2回反映しないようにする）
+        reload_lock = asyncio.Lock()
+        config_state = {"mtime": config_mtime()}
+
+        async def apply_config(new_cfg, new_targets=None):
+            """設定の変更を反映（ブラウザは起動し直さず、追加・削除・変更されたターゲットだけ開閉する）
+
+            Args:
+                new_cfg: 新しい設定（config.json の内容）
+                new_targets: 監視するターゲット（省略時は new_cfg の watch_targets、シャードでは担当分）
+
+            Returns:
+                変更の概要（追加・削除・変更したターゲット名と、再起動が必要な設定のキー）
+
+            Raises:
+                ValueError: 設定の形式が正しくない場合（何も反映しない）
+            """
+            nonlocal http_fetcher
+            # 反映を始める前に確認する（途中で失敗して cfg だけ変わった状態にしない）
+            control.validate_config(new_cfg)
+            if new_targets is not None:
+                control.validate_config({"watch_targets": new_targets})
+            async with reload_lock:
+                if new_targets is None:
+                    new_targets = new_cfg.get("watch_targets", [])
+                restart_required = merge_reloaded_config(cfg, new_cfg)
+                current = {(target_configs[i]["name"], target_configs[i]["url"]): i for i in configured}
+                wanted = {(t["name"], t["url"]): t for t in new_targets}
+                summary = {"added": [], "removed": [], "updated": [], "restart_required": restart_required}
+
+                reopen = []
+                for key, new_target in wanted.items():
+                    idx = current.get(key)
+                    if idx is None or target_configs[idx] == new_target:
+                        continue
+                    target = target_configs[idx]
+                    reopen_keys = REOPEN_KEYS + (LIVE_REOPEN_KEYS if target.get("watch_mode") == "live" else ())
+                    if any(target.get(k) != new_target.get(k) for k in reopen_keys):
+                        reopen.append(key)
+                        continue
+                    # 監視ループはこの辞書を参照しているため、置き換えずに中身を更新して検知条件を作り直す
+                    target.clear()
+                    target.update(new_target)
+                    matchers[id(target)] = TargetMatcher(target)
+                    summary["updated"].append(key[0])
+
+                for key, idx in current.items():
+                    if key not in wanted or key in reopen:
+                        await retire_target(idx)
+                        if key not in wanted:
+                            summary["removed"].append(key[0])
+
+                if http_fetcher is None and http_fetch.AVAILABLE and any(t.get("fetch_mode") == "http" for t in new_targets):
+                    http_fetcher = http_fetch.HttpFetcher(cookies=shared_cookies)
+                for key, target in wanted.items():
+                    if key in current and key not in reopen:
+                        continue
+                    idx = await open_target(target)
+                    if idx is None:
+                        continue
+                    await start_target(idx)
+                    summary["updated" if key in reopen else "added"].append(key[0])
+
+            if summary["added"] or summary["removed"] or summary["updated"]:
+                print(f"設定を再読み込みしました（追加: {summary['added']}、削除: {summary['removed']}、変更: {summary['updated']}）")
+            if restart_required:
+                print(f"再起動するまで反映されない設定があります: {restart_required}")
+            return summary
+
+        async def reload_config_file():
+            """config.json を読み直して反映"""
+            config_state["mtime"] = config_mtime()
+            try:
+                new_cfg = await loop.run_in_executor(None, load_config)
+                control.validate_config(new_cfg)
+            except (OSError, ValueError) as e:
+                print(f"設定ファイルの読み込みエラー（反映しません）: {e}")
+                return None
+            return await apply_config(new_cfg)
+
+        async def watch_config_file(watch_interval):
+            """config.json の更新時刻を確認し、変わっていれば反映"""
+            while not stop_event.is_set():
+                await wait_stop(watch_interval)
+                if not stop_event.is_set() and config_mtime() != config_state["mtime"]:
+                    try:
+                        await reload_config_file()
+                    except Exception as e:
+                        print(f"設定の再読み込みエラー: {e}")
+
+        async def set_paused(paused):
+            """監視の一時停止・再開（warm_standby）
+            ブラウザ・コンテキスト・監視中のページは開いたままにして、再開をすぐに反映する。
+            一時停止中は詳細ページのタブを閉じる（再開後に検知すれば開き直す）
+            """
+            if paused == pause_state["paused"]:
+                return
+            pause_state.update(paused=paused, since=time.time())
+            status_board.update(paused=paused)
+            if not paused:
+                active.set()
+                print("監視を再開しました")
+                return
+            active.clear()
+            for idx in detail_pool.indices():
+                await close_target(idx, reuse_page=False)
+            await detail_pool.close_spares()
+            print("監視を一時停止しました（ブラウザは起動したまま待機します）")
+
+        def handle_control(command, message):
+            """制御チャネルの指示（待ち受けスレッドから呼ばれ、イベントループで実行する）"""
+            if command == "reload":
+                # ページの読み込みを待たずに応答する（結果は watcher のログに出力）
+                asyncio.run_coroutine_threadsafe(reload_config_file(), loop)
+                return {"status": "reloading"}
+            if command in ("pause", "resume"):
+                # was_paused: 指示の前に一時停止していたか（一時停止していない watcher への resume を区別する）
+                was_paused = pause_state["paused"]
+                asyncio.run_coroutine_threadsafe(set_paused(command == "pause"), loop)
+                return {"status": "paused" if command == "pause" else "running", "was_paused": was_paused}
+            if command == "status":
+                return dict(pause_state)
+            return None
+
+        evidence_tasks = []
+        if evidence_capturer:
+            evidence_tasks.append(asyncio.create_task(evidence_capturer.run()))
+
+        # メトリクスを定期的にファイルへ書き出す（controller.py の /metrics が読む）
+        metrics_path = cfg.get("metrics_path", metrics.DEFAULT_METRICS_PATH)
+        if metrics_path and shard:
+            # シャードごとに別ファイル（controller.py がまとめて返す）
+            metrics_path = metrics.shard_path(metrics_path, shard.index)
+        metrics_interval = cfg.get("metrics_interval_sec", metrics.DEFAULT_WRITE_INTERVAL_SEC)
+
+        async def write_metrics_loop():
+            while True:
+                try:
+                    await loop.run_in_executor(None, metrics.REGISTRY.write_textfile, metrics_path)
+                except Exception as e:
+                    print(f"メトリクスの書き出しエラー: {e}")
+                await asyncio.sleep(metrics_interval)
+
+        metrics_tasks = [asyncio.create_task(write_metrics_loop())] if metrics_path else []
+
+        # 状態のファイル（シャードごとに別ファイル、変化があった場合のみ書き出す）
+        status_path = cfg.get("status_path", watch_status.DEFAULT_STATUS_PATH)
+        if status_path and shard:
+            status_path = metrics.shard_path(status_path, shard.index)
+        status_interval = cfg.get("status_interval_sec", watch_status.DEFAULT_WRITE_INTERVAL_SEC)
+
+        async def write_status_loop():
+            while True:
+                status_board.update(
+                    open_pages=sum(1 for p in pages if p is not None),
+                    detail_pages=len(detail_pool),
+                )
+                # 変化がなくても一定間隔で書き出す（controller が古い状態とみなさないように）
+                if status_board.changed() or status_board.heartbeat_due():
+                    try:
+                        await loop.run_in_executor(None, watch_status.write_snapshot, status_path, status_board.snapshot())
+                    except Exception as e:
+                        print(f"状態の書き出しエラー: {e}")
+                await asyncio.sleep(status_interval)
+
+        if status_path:
+            status_board.update(paused=False, shard=shard.index if shard else None)
+            metrics_tasks.append(asyncio.create_task(write_status_loop()))
+
+        async def watch_supervisor():
+            """スーパーバイザーからの指示（設定の再読み込み・一時停止・再開）を反映し、
+            スーパーバイザーが終了した場合（強制終了など）はワーカーも終了する"""
+            while not stop_event.is_set():
+                # 指示はすぐに反映する（待つ間は実行用のスレッドでキューを読む）
+                command = await loop.run_in_executor(None, shard.next_command, shard.parent_check_interval)
+                if not shard.parent_alive():
+                    print(f"[shard{shard.index}] スーパーバイザーが終了したため停止します")
+                    stop_event.set()
+                    return
+                if command and command[0] in ("pause", "resume"):
+                    await set_paused(command[0] == "pause")
+                elif command and command[0] == "reload":
+                    # 担当のターゲットはスーパーバイザーが決める（追加分の通知済み状態も一緒に受け取る）
+                    _, shard_targets, snapshot = command
+                    notified_store.restore(snapshot)
+                    try:
+                        await apply_config(await loop.run_in_executor(None, load_config), shard_targets)
+                    except Exception as e:
+                        print(f"[shard{shard.index}] 設定の再読み込みエラー: {e}")
+
+        # 設定の再読み込み（シャードではスーパーバイザーが config.json を確認してワーカーに伝える）
+        control_server = None
+        if shard:
+            metrics_tasks.append(asyncio.create_task(watch_supervisor()))
+        else:
+            config_watch_interval = cfg.get("config_watch_interval_sec", CONFIG_WATCH_INTERVAL_SEC)
+            if config_watch_interval:
+                metrics_tasks.append(asyncio.create_task(watch_config_file(config_watch_interval)))
+            control_server = control.start_server(cfg, handle_control)
+
+        try:
+            await stop_event.wait()
+        finally:
+            stop_event.set()
+            if control_server:
+                control_server.close()
+            background_tasks = list(watch_tasks.values()) + list(live_tasks.values()) + evidence_tasks + metrics_tasks
+            for task in background_tasks:
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+
+        if http_fetcher:
+            await http_fetcher.aclose()
+
+        notified_store.close()
+        if evidence_capturer:
+            await evidence_capturer.aclose()
+            print(f"スクリーンショット: {evidence_capturer.stats}")
+        if dom_archive.stats["stored"] or dom_archive.stats["deduplicated"]:
+            print(f"DOMアーカイブ: {dom_archive.stats}")
+        if not shard:
+            await asyncio.get_running_loop().run_in_executor(None, event_writer.close)
+            print(f"イベントログ: {event_writer.stats}")
+
+        if detail_pool.stats["opened"]:
+            print(f"詳細ページ: {detail_pool.stats}")
+        for (name, _), blocker in resource_blockers.items():
+            print(f"[{name}] リソースブロック: {blocker.summary()}")
 
         # すべてのブラウザを閉じる
         for browser in browsers:
@@ -708,6 +1408,22 @@ async def run_watcher_async(notification_config=None):
             except Exception as e:
                 print(f"ブラウザクローズエラー: {e}")
 
+        # 送信待ちの通知を送り切ってから終了（シャードのワーカーはスーパーバイザーが送信する）
+        if not shard:
+            await close_async_line_sender()
+            dispatcher = get_dispatcher(cfg)
+            await asyncio.get_running_loop().run_in_executor(None, dispatcher.shutdown)
+            for channel, channel_stats in dispatcher.stats().items():
+                print(f"通知統計 [{channel}]: {channel_stats}")
+        if metrics_path:
+            try:
+                metrics.REGISTRY.write_textfile(metrics_path)
+            except Exception as e:
+                print(f"メトリクスの書き出しエラー: {e}")
+        if status_path:
+            # 停止後に古い状態を返さないよう削除する
+            Path(status_path).unlink(missing_ok=True)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="チケット監視スクリプト",
@@ -718,6 +1434,7 @@ if __name__ == "__main__":
   python watcher.py --broadcast               # 友達追加した全員に送信
   python watcher.py --user Uxxx               # 特定ユーザーに送信
   python watcher.py --user Uxxx --user Uyyy   # 複数ユーザーに送信
+  python watcher.py --shards 4                # ターゲットを4プロセスに分けて監視
         """
     )
     parser.add_argument(
@@ -731,6 +1448,12 @@ if __name__ == "__main__":
         dest="user_ids",
         help="送信先ユーザーIDを指定（複数指定可能）"
     )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=None,
+        help="ターゲットを分割して監視するプロセス数（省略時は config.json の shards、既定は1）"
+    )
     
     args = parser.parse_args()
     
@@ -749,4 +1472,14 @@ if __name__ == "__main__":
     
     print()
     
-    asyncio.run(run_watcher_async(notification_config))
+    # コントローラーからの停止（SIGTERM）でも終了処理を実行する
+    # （監視の開始後は run_watcher_async がイベントループで受け、通知の送信待ちを含めて終了する）
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
+    shards = args.shards if args.shards is not None else load_config().get("shards", 1)
+    if shards > 1:
+        # スーパーバイザーとしてワーカープロセスを起動（通知済みの判定と通知はこのプロセスで行う）
+        from shard import run_supervisor
+        run_supervisor(load_config(), shards, notification_config)
+    else:
+        asyncio.run(run_watcher_async(notification_config))